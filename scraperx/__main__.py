@@ -0,0 +1,5 @@
+from .bench import main
+
+if __name__ == '__main__':
+    # Only the benchmark can run without a scraper
+    main()
@@ -0,0 +1,331 @@
+import os
+import gzip
+import json
+import time
+import atexit
+import struct
+import logging
+import pathlib
+import datetime
+import tempfile
+import threading
+from smart_open import open
+
+from .uploads import get_upload_queue
+from .utils import _get_s3_params
+
+logger = logging.getLogger(__name__)
+
+# Each record is: MAGIC | record type (1 byte) | header length | payload length | header | payload
+MAGIC = b'SXA1'
+_FRAME = struct.Struct('>4scIQ')
+
+RECORD_TYPES = {'source': b'S', 'metadata': b'M'}
+_RECORD_NAMES = {v: k for k, v in RECORD_TYPES.items()}
+
+# Segments that are still open (or being uploaded), final path -> local path
+_local_segments = {}
+_local_segments_lock = threading.Lock()
+
+# Archive writers used in this process, keyed by scraper & template
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_archive_writer(scraper):
+    """Get the archive writer for the scraper based on the config
+
+    Each scraper has its own writer, since the segments are named & saved using its config.
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Raises:
+        ValueError: The dispatch service is not `local`. A segment is only saved once it is
+            closed, so an extractor running somewhere else could not read the sources yet
+
+    Returns:
+        ArchiveWriter|None: The writer to use, or None if not saving sources to an archive
+    """
+    if scraper.config['DOWNLOADER_OUTPUT_MODE'] != 'archive':
+        return None
+
+    if scraper.config['DISPATCH_SERVICE_NAME'] != 'local':
+        raise ValueError("The archive output mode can only be used when the dispatch service"
+                         f" is local, not {scraper.config['DISPATCH_SERVICE_NAME']}")
+
+    template = scraper.config['DOWNLOADER_ARCHIVE_TEMPLATE']
+    key = (scraper, template)
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = ArchiveWriter(
+                scraper,
+                template,
+                max_bytes=scraper.config['DOWNLOADER_ARCHIVE_MAX_BYTES'],
+                max_seconds=scraper.config['DOWNLOADER_ARCHIVE_MAX_SECONDS'],
+            )
+            # Any open segment needs to be saved before exiting. Background threads can not
+            # be used once the interpreter is exiting, so upload it right away
+            atexit.register(_writers[key].close, background=False)
+        return _writers[key]
+
+
+def close_archives():
+    """Close all of the open archive segments"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.close()
+
+
+def _pack_record(record_type, payload, header=None):
+    """Create the bytes of a single record
+
+    Args:
+        record_type (str): One of `RECORD_TYPES`
+        payload (bytes): Data of the record, it will be compressed
+        header (dict, optional): Info about the record. Defaults to None.
+
+    Returns:
+        tuple: The record bytes and the position of the payload in the record
+    """
+    header_bytes = json.dumps({**(header or {}), 'codec': 'gzip'}).encode('utf-8')
+    compressed = gzip.compress(payload)
+    frame = _FRAME.pack(MAGIC, RECORD_TYPES[record_type], len(header_bytes), len(compressed))
+    return frame + header_bytes + compressed, len(frame) + len(header_bytes), len(compressed)
+
+
+def get_local_segment(segment_file):
+    """Get the local copy of a segment that is still being written to or uploaded
+
+    Args:
+        segment_file (str): Path or s3 url of the segment
+
+    Returns:
+        str|None: Local path of the segment, None if it is not open in this process
+    """
+    with _local_segments_lock:
+        return _local_segments.get(segment_file)
+
+
+def read_archive_record(segment_file, offset, length, transport_params={}, local_file=None):
+    """Read a single record's payload out of an archive segment
+
+    Args:
+        segment_file (str): Path or s3 url of the segment
+        offset (int): Where the payload starts in the segment
+        length (int): Size of the compressed payload
+        transport_params (dict, optional): Passed into smart_open. Defaults to {}.
+        local_file (str, optional): Local copy of the segment, for when it was opened by
+            another process. If None, the segments open in this process are checked.
+            Defaults to None.
+
+    Returns:
+        bytes: The decompressed payload
+    """
+    if local_file is None:
+        local_file = get_local_segment(segment_file)
+
+    if local_file is not None:
+        try:
+            # Still being written to or uploaded, so read it from the local copy
+            with open(local_file, 'rb') as f:
+                f.seek(offset)
+                return gzip.decompress(f.read(length))
+        except FileNotFoundError:
+            # Finished uploading while reading
+            pass
+
+    with open(segment_file, 'rb', transport_params=transport_params) as f:
+        f.seek(offset)
+        return gzip.decompress(f.read(length))
+
+
+def iter_archive_records(segment_file, record_type=None, transport_params={}):
+    """Loop over the records in an archive segment
+
+    Args:
+        segment_file (str): Path or s3 url of the segment
+        record_type (str, optional): Only return records of this type. Defaults to None.
+        transport_params (dict, optional): Passed into smart_open. Defaults to {}.
+
+    Raises:
+        ValueError: If the file is not an archive segment
+
+    Yields:
+        dict: `type`, `header`, `offset`, `length` & `payload` of each record
+    """
+    with open(segment_file, 'rb', transport_params=transport_params) as f:
+        position = 0
+        while True:
+            frame = f.read(_FRAME.size)
+            if not frame:
+                break
+            magic, type_code, header_length, payload_length = _FRAME.unpack(frame)
+            if magic != MAGIC:
+                raise ValueError(f"{segment_file} is not an archive segment")
+            header = json.loads(f.read(header_length))
+            offset = position + _FRAME.size + header_length
+            name = _RECORD_NAMES.get(type_code)
+            if record_type is None or name == record_type:
+                yield {'type': name,
+                       'header': header,
+                       'offset': offset,
+                       'length': payload_length,
+                       'payload': gzip.decompress(f.read(payload_length)),
+                       }
+            else:
+                f.seek(offset + payload_length)
+            position = offset + payload_length
+
+
+class ArchiveWriter:
+
+    def __init__(self, scraper, template, max_bytes=None, max_seconds=None):
+        """Append records to rolling archive segment files
+
+        A new segment is started once the current one is larger then `max_bytes` or older
+        then `max_seconds`. When saving to s3, segments are written locally then uploaded
+        once they are closed.
+
+        Args:
+            scraper (obj): The users Scraper instance
+            template (str): Template of the segment file names. Has the keys `segment_id`,
+                `date_created` & `time_created` along with the scrapers `log_extras`
+            max_bytes (int, optional): Max size of a segment. Defaults to None.
+            max_seconds (float, optional): Max seconds a segment is open. Defaults to None.
+        """
+        self.scraper = scraper
+        self.template = template
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._num_segments = 0
+        self._segment = None
+
+    def _open_segment(self):
+        now = datetime.datetime.utcnow()
+        self._num_segments += 1
+        segment_id = f"{now.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}_{self._num_segments:05d}"
+        filename = self.template.format(**self.scraper.log_extras(),
+                                        segment_id=segment_id,
+                                        date_created=str(now.date()),
+                                        time_created=now.isoformat() + 'Z')
+
+        save_service = self.scraper.config['DOWNLOADER_SAVE_DATA_SERVICE']
+        if save_service == 's3':
+            if filename.startswith('s3://'):
+                target_path = filename
+            else:
+                bucket_name = self.scraper.config['DOWNLOADER_SAVE_DATA_BUCKET_NAME']
+                target_path = f"s3://{bucket_name}/{filename.replace(os.sep, '/').lstrip('/')}"
+            local_path = os.path.join(tempfile.gettempdir(), 'scraperx_archive',
+                                      os.path.basename(filename))
+        else:
+            target_path = filename
+            local_path = filename
+
+        pathlib.Path(local_path).parent.mkdir(parents=True, exist_ok=True)
+        with _local_segments_lock:
+            _local_segments[target_path] = local_path
+
+        self._segment = {'target_path': target_path,
+                         'local_path': local_path,
+                         'file': open(local_path, 'wb'),
+                         'size': 0,
+                         'time_opened': time.monotonic(),
+                         }
+
+    def _swap_segment(self):
+        """Take the current segment out of the writer, must hold the lock
+
+        Returns:
+            dict: The closed segment, to be passed to `_finish_segment` once the lock is released
+        """
+        segment = self._segment
+        self._segment = None
+        segment['file'].close()
+        return segment
+
+    def _finish_segment(self, segment, background=True):
+        # Not called with the lock held, so other threads can keep appending during the upload
+        if segment['target_path'] == segment['local_path']:
+            with _local_segments_lock:
+                _local_segments.pop(segment['target_path'], None)
+            return
+
+        upload_queue = get_upload_queue(self.scraper) if background else None
+        if upload_queue is not None:
+            upload_queue.submit(segment['target_path'], self._upload, segment)
+        else:
+            self._upload(segment)
+
+    def _upload(self, segment):
+        transport_params = _get_s3_params(self.scraper, context_type='downloader')
+        with open(segment['local_path'], 'rb') as infile, \
+                open(segment['target_path'], 'wb', transport_params=transport_params) as outfile:
+            for chunk in iter(lambda: infile.read(1024 * 1024), b''):
+                outfile.write(chunk)
+
+        with _local_segments_lock:
+            _local_segments.pop(segment['target_path'], None)
+        os.remove(segment['local_path'])
+        logger.debug(f"Uploaded archive segment {segment['target_path']}",
+                     extra={**self.scraper.log_extras(), 'task': None})
+
+    def _should_roll(self):
+        if self.max_bytes and self._segment['size'] >= self.max_bytes:
+            return True
+        if (self.max_seconds
+           and time.monotonic() - self._segment['time_opened'] >= self.max_seconds):
+            return True
+        return False
+
+    def append(self, record_type, payload, header=None):
+        """Add a record to the current segment
+
+        Args:
+            record_type (str): One of `RECORD_TYPES`
+            payload (bytes|str): Data to save, strings are saved as utf-8
+            header (dict, optional): Info about the record. Defaults to None.
+
+        Returns:
+            dict: `file`, `offset` & `length` needed to read the record back
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        record, payload_offset, payload_length = _pack_record(record_type, payload, header)
+
+        closed_segment = None
+        with self._lock:
+            if self._segment is not None and self._should_roll():
+                closed_segment = self._swap_segment()
+            if self._segment is None:
+                self._open_segment()
+
+            offset = self._segment['size'] + payload_offset
+            self._segment['file'].write(record)
+            # So the record can be read back before the segment is closed
+            self._segment['file'].flush()
+            self._segment['size'] += len(record)
+            location = {'file': self._segment['target_path'],
+                        'offset': offset,
+                        'length': payload_length,
+                        }
+
+        if closed_segment is not None:
+            self._finish_segment(closed_segment)
+        return location
+
+    def close(self, background=True):
+        """Close the current segment, the next record will start a new one
+
+        Args:
+            background (bool, optional): Use the upload queue if there is one.
+                Defaults to True.
+        """
+        with self._lock:
+            if self._segment is None:
+                return
+            segment = self._swap_segment()
+        self._finish_segment(segment, background=background)
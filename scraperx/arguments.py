@@ -36,6 +36,40 @@ shared_parser.add_argument('--local', action='store_true',
 dispatch_download_parser = argparse.ArgumentParser(add_help=False)
 dispatch_download_parser.add_argument('--standalone', action='store_true',
                                       help="Do not trigger the next action")
+cassette_group = dispatch_download_parser.add_mutually_exclusive_group()
+cassette_group.add_argument('--record', metavar='CASSETTE',
+                            help="Save every response to this cassette file")
+cassette_group.add_argument('--replay', metavar='CASSETTE',
+                            help="Serve responses from this cassette file instead of the site")
+dispatch_download_parser.add_argument('--replay-latency',
+                                      help=("Simulated latency of replayed responses."
+                                            " e.g. `recorded`, `fixed:0.2`, `uniform:0.1,0.5`,"
+                                            " `normal:0.3,0.1`, `lognormal:-1.5,0.5`"))
+
+###
+# Benchmark Arguments
+# Also used by `python -m scraperx bench`
+###
+bench_parser = argparse.ArgumentParser(add_help=False)
+bench_parser.add_argument('--tasks', type=int, default=100,
+                          help="Number of tasks/pages to run through each stage")
+bench_parser.add_argument('--qps', type=float, default=50,
+                          help="Target queries per second to dispatch at")
+bench_parser.add_argument('--latency', type=float, default=0.0,
+                          help="Seconds each response from the stand-in server takes")
+bench_parser.add_argument('--page-size', type=int, default=50000,
+                          help="Size in bytes of each page from the stand-in server")
+bench_parser.add_argument('--error-rate', type=float, default=0.0,
+                          help="Fraction of responses from the stand-in server that are a 500")
+bench_parser.add_argument('--stages', nargs='+', default=['rate_limit', 'download',
+                                                          'save', 'extract'],
+                          choices=['rate_limit', 'download', 'save', 'extract'],
+                          help="Stages to benchmark")
+bench_parser.add_argument('--parsers', nargs='+', default=['parsel'],
+                          choices=['parsel', 'lxml', 'selectolax'],
+                          help="Parser backends to run the extract stage with")
+bench_parser.add_argument('-o', '--output',
+                          help="Save the results as json to this file")
 
 ###
 # Parser for subparsers
@@ -60,6 +94,14 @@ parser_test.add_argument('metadata',
                          help=("Path to a sources metadata file "
                                "to create a test for"))
 
+###
+# Benchmark
+###
+parser_bench = subparsers.add_parser('bench',
+                                     help=("Benchmark dispatch, download, save & extract"
+                                           " using a local stand-in server"),
+                                     parents=[bench_parser])
+
 ###
 # Dispatch Arguments
 ###
@@ -99,3 +141,7 @@ parser_extract = subparsers.add_parser('extract',
                                                 ])
 parser_extract.add_argument('source',
                             help="Local dir or source file to extract")
+parser_extract.add_argument('-w', '--workers', type=int, default=1,
+                            help="Number of processes to extract with")
+parser_extract.add_argument('--chunk-size', type=int, default=10,
+                            help="Number of metadata files sent to a worker at a time")
@@ -0,0 +1,422 @@
+import os
+import sys
+import math
+import json
+import time
+import yaml
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .write import Write
+from .scraper import Scraper
+from .extract import Extract
+from .download import Download
+from .utils import rate_limited, read_file_contents
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('rate_limit', 'download', 'save', 'extract')
+
+_ITEM_HTML = ('<div class="item" data-id="{idx}"><h3 class="title">Item {idx}</h3>'
+              '<span class="price">${idx}.99</span><a href="/item/{idx}">link</a></div>\n')
+
+
+def generate_page(page_size):
+    """Create a listing page of about `page_size` bytes
+
+    Args:
+        page_size (int): Size of the page in bytes
+
+    Returns:
+        bytes: The html of the page
+    """
+    items = []
+    size = 0
+    idx = 0
+    while size < page_size:
+        item = _ITEM_HTML.format(idx=idx)
+        items.append(item)
+        size += len(item)
+        idx += 1
+    return f"<html><body>{''.join(items)}</body></html>".encode('utf-8')
+
+
+def _serve(port_queue, latency, page_size, error_rate):
+    page = generate_page(page_size)
+
+    class StandInHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):  # noqa: N802
+            if latency:
+                time.sleep(latency)
+            if random.random() < error_rate:
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+class StandInServer:
+
+    def __init__(self, latency=0.0, page_size=50000, error_rate=0.0):
+        """Local http server for the scraper to download from
+
+        Runs in its own process so its cpu time is not counted against the scraper.
+        Use as a context manager::
+
+            with StandInServer(latency=0.1) as server:
+                requests.get(server.url)
+
+        Args:
+            latency (float, optional): Seconds each response takes. Defaults to 0.0.
+            page_size (int, optional): Size of each page in bytes. Defaults to 50000.
+            error_rate (float, optional): Fraction of responses that return a 500.
+                Defaults to 0.0.
+        """
+        self.latency = latency
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.url = None
+        self._process = None
+
+    def __enter__(self):
+        port_queue = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve,
+            args=(port_queue, self.latency, self.page_size, self.error_rate),
+            daemon=True,
+        )
+        self._process.start()
+        self.url = f'http://127.0.0.1:{port_queue.get(timeout=10)}'
+        return self
+
+    def __exit__(self, *args):
+        self._process.terminate()
+        self._process.join()
+
+
+def _current_rss():
+    """Current resident memory of this process in bytes, or None if unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _StageTimer:
+
+    def __init__(self, name):
+        """Measure the wall time, cpu time and peak memory of a stage
+
+        The stages run in the same process, so the memory is how far the stage grew it past
+        the memory in use when the stage started.
+
+        Args:
+            name (str): Name of the stage
+        """
+        self.name = name
+        self.latencies = []
+        self.count = 0
+        self.errors = 0
+        self._start_rss = None
+        self._peak_rss = 0
+        self._running = False
+
+    def _sample_rss(self):
+        while self._running:
+            self._peak_rss = max(self._peak_rss, _current_rss() or 0)
+            time.sleep(0.01)
+
+    def _peak_rss_delta_mb(self):
+        if self._start_rss is None:
+            return None
+        return round(max(0, self._peak_rss - self._start_rss) / 1024 / 1024, 2)
+
+    def __enter__(self):
+        self._start_rss = _current_rss()
+        self._peak_rss = self._start_rss or 0
+        self._running = True
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+        self._cpu_start = time.process_time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = time.perf_counter() - self._start
+        self.cpu_seconds = time.process_time() - self._cpu_start
+        self._running = False
+        self._sampler.join()
+
+    def result(self):
+        """Stats of the stage
+
+        Returns:
+            dict: Throughput, latency percentiles, cpu time and peak memory growth of the stage
+        """
+        latencies = sorted(self.latencies)
+        return {
+            'stage': self.name,
+            'count': self.count,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 4),
+            'throughput': round(self.count / self.seconds, 2) if self.seconds else None,
+            'latency_p50': _percentile(latencies, 50),
+            'latency_p90': _percentile(latencies, 90),
+            'latency_p99': _percentile(latencies, 99),
+            'cpu_seconds': round(self.cpu_seconds, 4),
+            'peak_rss_delta_mb': self._peak_rss_delta_mb(),
+        }
+
+
+def _percentile(sorted_values, pct):
+    """Nearest rank percentile
+
+    Args:
+        sorted_values (list): Values sorted low to high
+        pct (float): Percentile to get, 0-100
+
+    Returns:
+        float|None: Value at the percentile, None if there are no values
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1,
+                      math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[rank], 6)
+
+
+class BenchDownload(Download):
+
+    def download(self):
+        start = time.perf_counter()
+        r = self.request_get(self.task['url'])
+        self.save_request(r)
+        self.scraper.bench_timer.latencies.append(time.perf_counter() - start)
+
+
+class BenchExtract(Extract):
+
+    def extract(self, raw_source, source_idx):
+        yield self.extract_task(
+            name='items',
+            selectors=['div.item'],
+            callback=self.extract_item,
+            parser=self.task.get('parser'),
+        )
+
+    def extract_item(self, element, idx, **kwargs):
+        # Only uses the api every parser backend has
+        return {'title': element.css('h3.title')[0].text,
+                'price': element.css('span.price')[0].text,
+                'url': element.css('a')[0].attrib.get('href'),
+                }
+
+
+def _bench_scraper(output_dir, qps):
+    """Scraper setup to only use local services and save under the `output_dir`
+
+    The config is written to a file in the `output_dir`, so env vars still override it
+    like they would for any scraper.
+    """
+    scraper_name = 'scraperx_bench'
+    config_file = os.path.join(output_dir, 'config.yaml')
+    config = {
+        'standalone': False,
+        'dispatch': {
+            'service': {'name': 'local'},
+            'ratelimit': {'type': 'qps', 'value': float(qps)},
+        },
+        'downloader': {
+            'save_data': {'service': 'local'},
+            'save_metadata': False,
+            'file_template': os.path.join(output_dir, 'download', '{idx}.html'),
+        },
+        'extractor': {
+            'save_data': {'service': 'local'},
+            'file_template': os.path.join(output_dir, 'extract', '{idx}.json'),
+        },
+    }
+    with open(config_file, 'w') as f:
+        yaml.safe_dump({scraper_name: config}, f)
+
+    return Scraper(config_file=config_file,
+                   scraper_name=scraper_name,
+                   download_cls=BenchDownload,
+                   extract_cls=None)
+
+
+def bench_rate_limit(num_calls, qps):
+    """Check how close the `rate_limited` decorator gets to the target qps"""
+    timer = _StageTimer('rate_limit')
+
+    @rate_limited(num_calls=qps)
+    def _call():
+        return time.perf_counter()
+
+    with timer:
+        last_call = time.perf_counter()
+        for _ in range(num_calls):
+            called = _call()
+            # The latency is how far off each call was from the target spacing
+            timer.latencies.append(abs((called - last_call) - 1 / qps))
+            last_call = called
+            timer.count += 1
+
+    return timer.result()
+
+
+def bench_download(scraper, num_tasks, qps, server):
+    """Dispatch tasks using the thread pool to download from the stand-in server"""
+    timer = _StageTimer('download')
+    scraper.bench_timer = timer
+    tasks = [{'url': f'{server.url}/item/{idx}', 'idx': idx} for idx in range(num_tasks)]
+    with timer:
+        scraper.dispatch(tasks=tasks).run()
+    timer.count = len(timer.latencies)
+    timer.errors = num_tasks - timer.count
+    return timer.result()
+
+
+def bench_save(scraper, num_tasks, page_size, output_dir):
+    """Save pages to local files using `SaveTo`"""
+    timer = _StageTimer('save')
+    page = generate_page(page_size).decode('utf-8')
+    template = os.path.join(output_dir, 'save', '{idx}.html')
+    with timer:
+        for idx in range(num_tasks):
+            start = time.perf_counter()
+            Write(scraper, page).write_file().save(None, filename=template.format(idx=idx),
+                                                   save_service='local')
+            timer.latencies.append(time.perf_counter() - start)
+            timer.count += 1
+
+    return timer.result()
+
+
+def bench_extract(scraper, num_tasks, page_size, output_dir, parser='parsel'):
+    """Extract items from saved pages using one of the parser backends"""
+    # Named after the parser so the backends can be compared
+    timer = _StageTimer('extract' if parser == 'parsel' else f'extract:{parser}')
+    source_file = os.path.join(output_dir, 'extract_source.html')
+    with open(source_file, 'wb') as f:
+        f.write(generate_page(page_size))
+
+    manifest = {'source_files': [{'file': source_file}],
+                'time_downloaded': '',
+                'date_downloaded': '',
+                }
+    with timer:
+        for idx in range(num_tasks):
+            start = time.perf_counter()
+            raw_source = read_file_contents(source_file)
+            extractor = BenchExtract(scraper, {'idx': idx, 'parser': parser}, manifest)
+            for extraction_task in extractor._get_extraction_tasks(raw_source, 0):
+                extraction_task(raw_source)
+            timer.latencies.append(time.perf_counter() - start)
+            timer.count += 1
+
+    return timer.result()
+
+
+def run_bench(num_tasks=100, qps=50, latency=0.0, page_size=50000, error_rate=0.0,
+              stages=STAGES, parsers=('parsel',)):
+    """Run the benchmark stages
+
+    Args:
+        num_tasks (int, optional): Number of tasks/pages per stage. Defaults to 100.
+        qps (float, optional): Target queries per second for dispatch. Defaults to 50.
+        latency (float, optional): Seconds each stand-in server response takes.
+            Defaults to 0.0.
+        page_size (int, optional): Size of each page in bytes. Defaults to 50000.
+        error_rate (float, optional): Fraction of stand-in server responses that are a 500.
+            Defaults to 0.0.
+        stages (tuple, optional): Stages to run. Defaults to all of `STAGES`.
+        parsers (tuple, optional): Parser backends to run the extract stage with.
+            Defaults to ('parsel',).
+
+    Returns:
+        list: Results of each stage
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix='scraperx_bench_') as output_dir:
+        scraper = _bench_scraper(output_dir, qps)
+
+        if 'rate_limit' in stages:
+            results.append(bench_rate_limit(num_tasks, qps))
+
+        if 'download' in stages:
+            with StandInServer(latency=latency,
+                               page_size=page_size,
+                               error_rate=error_rate) as server:
+                results.append(bench_download(scraper, num_tasks, qps, server))
+
+        if 'save' in stages:
+            results.append(bench_save(scraper, num_tasks, page_size, output_dir))
+
+        if 'extract' in stages:
+            for parser in parsers:
+                results.append(bench_extract(scraper, num_tasks, page_size, output_dir,
+                                             parser=parser))
+
+    return results
+
+
+def _print_results(results):
+    columns = ('stage', 'count', 'errors', 'seconds', 'throughput',
+               'latency_p50', 'latency_p90', 'latency_p99', 'cpu_seconds',
+               'peak_rss_delta_mb')
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for result in results:
+        print('  '.join(str(result[c]).ljust(widths[c]) for c in columns))
+
+
+def _run_bench(cli_args):
+    """Run the benchmark from the cli arguments and print the results"""
+    results = run_bench(num_tasks=cli_args.tasks,
+                        qps=cli_args.qps,
+                        latency=cli_args.latency,
+                        page_size=cli_args.page_size,
+                        error_rate=cli_args.error_rate,
+                        stages=cli_args.stages,
+                        parsers=cli_args.parsers)
+    _print_results(results)
+    if cli_args.output:
+        with open(cli_args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    return results
+
+
+def main(argv=None):
+    """Run the benchmark without a scraper, `python -m scraperx bench`"""
+    from .arguments import bench_parser
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'bench':
+        argv = argv[1:]
+
+    parser = argparse.ArgumentParser(prog='python -m scraperx bench',
+                                     parents=[bench_parser])
+    _run_bench(parser.parse_args(argv))
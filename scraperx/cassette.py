@@ -0,0 +1,246 @@
+import io
+import json
+import zlib
+import time
+import base64
+import random
+import hashlib
+import logging
+import pathlib
+import threading
+import requests
+from collections import defaultdict
+from urllib3.response import HTTPResponse
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Cassettes that are open in this process, keyed by (mode, file)
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+# These describe the body as it was sent over the wire, but the body is saved decompressed
+_SKIP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+def get_cassette(scraper):
+    """Get the cassette for the scraper based on the config
+
+    All downloads in the process share the same cassette so every request ends up in
+    the same file.
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Returns:
+        Cassette|None: The cassette to use, or None if not recording or replaying
+    """
+    mode = scraper.config['DOWNLOADER_CASSETTE_MODE']
+    if not mode:
+        return None
+
+    cassette_file = scraper.config['DOWNLOADER_CASSETTE_FILE']
+    with _cassettes_lock:
+        if (mode, cassette_file) not in _cassettes:
+            cassette = Cassette(cassette_file,
+                                mode=mode,
+                                latency=scraper.config['DOWNLOADER_CASSETTE_LATENCY'])
+            logger.info(f"Cassette {mode}: {cassette_file}",
+                        extra={**scraper.log_extras(),
+                               'num_responses': cassette.num_responses})
+            _cassettes[(mode, cassette_file)] = cassette
+        return _cassettes[(mode, cassette_file)]
+
+
+def _request_key(method, url, body=None):
+    """Key used to match a request to its recorded responses
+
+    Args:
+        method (str): HTTP method of the request
+        url (str): Full url of the request
+        body (str|bytes, optional): Body of the request. Defaults to None.
+
+    Returns:
+        str: Key for the request
+    """
+    if body is None:
+        body = b''
+    elif isinstance(body, str):
+        body = body.encode('utf-8')
+    return f"{method.upper()} {url} {hashlib.sha1(body).hexdigest()}"
+
+
+def parse_latency(latency):
+    """Create a function that returns how long a replayed response should take
+
+    Formats supported:
+        `recorded`: Use the time the response took when it was recorded
+        `fixed:0.2`: Always take 0.2 seconds
+        `uniform:0.1,0.5`: Random time between 0.1 and 0.5 seconds
+        `normal:0.3,0.1`: Normal distribution with a mean of 0.3 and std dev of 0.1
+        `lognormal:-1.5,0.5`: Log-normal distribution with a mu of -1.5 and sigma of 0.5
+
+    Args:
+        latency (str): The latency distribution. If None then there is no latency.
+
+    Raises:
+        ValueError: If the format is not supported
+
+    Returns:
+        function: Takes the recorded entry and returns the seconds to wait
+    """
+    if not latency:
+        return lambda entry: 0
+
+    name, _, values = latency.partition(':')
+    try:
+        params = [float(v) for v in values.split(',') if v.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid cassette latency values: {latency}")
+
+    distributions = {
+        'recorded': (0, lambda entry: entry.get('elapsed', 0)),
+        'fixed': (1, lambda entry: params[0]),
+        'uniform': (2, lambda entry: random.uniform(*params)),
+        'normal': (2, lambda entry: random.gauss(*params)),
+        'lognormal': (2, lambda entry: random.lognormvariate(*params)),
+    }
+    if name not in distributions or len(params) != distributions[name][0]:
+        raise ValueError(f"Invalid cassette latency: {latency}")
+
+    sample = distributions[name][1]
+    return lambda entry: max(0, sample(entry))
+
+
+class Cassette:
+
+    def __init__(self, cassette_file, mode='replay', latency=None):
+        """Record responses to a file, or replay them back from it
+
+        Each line of the file is a json object of a single response.
+        The body is compressed and base64 encoded to keep the file small.
+
+        Args:
+            cassette_file (str): Path to the cassette file
+            mode (str, optional): Either `record` or `replay`. When recording an existing
+                file is overwritten. Defaults to 'replay'.
+            latency (str, optional): How long replayed responses should take,
+                see `parse_latency`. Defaults to None.
+        """
+        self.file = cassette_file
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._latency = parse_latency(latency)
+        self._entries = defaultdict(list)
+        self._cursors = defaultdict(int)
+
+        if self.mode == 'record':
+            pathlib.Path(self.file).parent.mkdir(parents=True, exist_ok=True)
+            # Start with an empty cassette
+            open(self.file, 'w').close()
+        else:
+            self._load()
+
+    def _load(self):
+        with open(self.file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._entries[entry['key']].append(entry)
+
+    @property
+    def num_responses(self):
+        """Number of responses loaded to be replayed"""
+        return sum(map(len, self._entries.values()))
+
+    def record(self, r):
+        """Save a response to the cassette
+
+        Each redirect the request went through is saved as its own response, keyed by the
+        url it was requested from. When replayed, requests follows the same redirects and
+        ends up with the same history.
+
+        Args:
+            r (requests.request): Response from the requests lib that has been read
+        """
+        lines = []
+        for response in (*r.history, r):
+            entry = {
+                'key': _request_key(response.request.method,
+                                    response.request.url,
+                                    response.request.body),
+                'url': response.url,
+                'status_code': response.status_code,
+                'reason': response.reason,
+                'headers': {k: v for k, v in response.headers.items()
+                            if k.lower() not in _SKIP_HEADERS},
+                'elapsed': response.elapsed.total_seconds(),
+                'body': base64.b64encode(zlib.compress(response.content)).decode('ascii'),
+            }
+            lines.append(json.dumps(entry, ensure_ascii=False) + '\n')
+        with self._lock:
+            with open(self.file, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+
+    def play(self, request):
+        """Get the recorded response for a request
+
+        If a request was recorded more then once, each call gets the next one in the
+        order they were recorded, starting over once they have all been used.
+
+        Args:
+            request (requests.PreparedRequest): The request being made
+
+        Returns:
+            dict|None: The recorded entry, or None if the request was never recorded
+        """
+        key = _request_key(request.method, request.url, request.body)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            entry = entries[self._cursors[key] % len(entries)]
+            self._cursors[key] += 1
+
+        return entry
+
+    def adapter(self):
+        """Transport adapter for a requests session that serves responses from the cassette
+
+        Returns:
+            CassetteAdapter: Mount this on a session for `http://` & `https://`
+        """
+        return CassetteAdapter(self)
+
+
+class CassetteAdapter(HTTPAdapter):
+
+    def __init__(self, cassette, *args, **kwargs):
+        """Requests transport adapter that replays responses instead of using the network
+
+        Args:
+            cassette (Cassette): The cassette to replay from
+        """
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        entry = self.cassette.play(request)
+        if entry is None:
+            raise requests.exceptions.ConnectionError(
+                f"No recorded response for {request.method} {request.url}",
+                request=request,
+            )
+
+        time.sleep(self.cassette._latency(entry))
+
+        body = zlib.decompress(base64.b64decode(entry['body']))
+        headers = {**entry['headers'], 'Content-Length': str(len(body))}
+        raw = HTTPResponse(body=io.BytesIO(body),
+                           headers=headers,
+                           status=entry['status_code'],
+                           reason=entry['reason'],
+                           preload_content=False,
+                           decode_content=False)
+        return self.build_response(request, raw)
@@ -0,0 +1,85 @@
+import gzip
+import logging
+
+logger = logging.getLogger(__name__)
+
+CODECS = ('gzip', 'zstd')
+
+
+def get_compression(scraper, context_type):
+    """Get the codec & level to compress saved files with based on the config
+
+    Args:
+        scraper (obj): The users Scraper instance
+        context_type (str): Either 'downloader' or 'extractor'
+
+    Returns:
+        tuple: The codec & level, the codec is None if files are not compressed
+    """
+    codec = scraper.config[f'{context_type}_COMPRESSION']
+    if codec not in CODECS:
+        return None, None
+    return codec, scraper.config[f'{context_type}_COMPRESSION_LEVEL']
+
+
+def compress(data, codec, level=None):
+    """Compress bytes
+
+    Args:
+        data (bytes): Data to compress
+        codec (str): One of `CODECS`
+        level (int, optional): Compression level, if None the codecs default is used.
+            Defaults to None.
+
+    Returns:
+        bytes: The compressed data
+    """
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=9 if level is None else level)
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+
+def open_compressed(fileobj, codec, level=None):
+    """Wrap a binary file object so everything written to it is compressed
+
+    Closing the returned stream finishes the compressed data but leaves `fileobj` open.
+
+    Args:
+        fileobj (file): Binary file object to write the compressed data to
+        codec (str): One of `CODECS`
+        level (int, optional): Compression level, if None the codecs default is used.
+            Defaults to None.
+
+    Returns:
+        file: Binary file object to write the uncompressed data to
+    """
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb',
+                             compresslevel=9 if level is None else level)
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3 if level is None else level)\
+            .stream_writer(fileobj, closefd=False)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+
+def decompress(data, codec):
+    """Decompress bytes
+
+    Args:
+        data (bytes): Data to decompress
+        codec (str): One of `CODECS`
+
+    Returns:
+        bytes: The decompressed data
+    """
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zstd':
+        import zstandard
+        # Streaming so frames without the content size in the header still work
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unknown compression codec: {codec}")
@@ -64,6 +64,15 @@ _CONFIG_STRUCTURE = {
         'type': str,
         'default': str(uuid.uuid4()),
     },
+    'SERIALIZER_BACKEND': {
+        'default': 'json',
+        'type': str,
+        'must_be': ['json', 'orjson', 'msgspec'],
+    },
+    'SERIALIZER_PRETTY': {
+        'default': False,
+        'type': bool,
+    },
     ###
     # Dispatch
     ###
@@ -89,6 +98,21 @@ _CONFIG_STRUCTURE = {
     'DISPATCH_LIMIT': {
         'type': int,
     },
+    'DISPATCH_BANDWIDTH_BUDGET': {
+        'type': int,
+    },
+    'DISPATCH_NEGATIVE_CACHE_FILE': {
+        'type': str,
+    },
+    'DISPATCH_NEGATIVE_CACHE_TTL': {
+        'type': float,
+        'default': 24.0,
+    },
+    'DISPATCH_NEGATIVE_CACHE_ACTION': {
+        'type': str,
+        'default': 'skip',
+        'must_be': ['skip', 'deprioritize'],
+    },
     ###
     # Downloader
     ###
@@ -111,6 +135,13 @@ _CONFIG_STRUCTURE = {
     'DOWNLOADER_SAVE_DATA_AWS_SECRET_ACCESS_KEY': {
         'type': str,
     },
+    'DOWNLOADER_UPLOAD_WORKERS': {
+        'default': 0,
+        'type': int,
+    },
+    'DOWNLOADER_UPLOAD_QUEUE_SIZE': {
+        'type': int,
+    },
     'DOWNLOADER_SAVE_METADATA': {
         'default': True,
         'type': bool,
@@ -119,6 +150,66 @@ _CONFIG_STRUCTURE = {
         'default': "output/source.html",
         'type': str,
     },
+    'DOWNLOADER_COMPRESSION': {
+        'default': 'none',
+        'type': str,
+        'must_be': ['none', 'gzip', 'zstd'],
+    },
+    'DOWNLOADER_COMPRESSION_LEVEL': {
+        'type': int,
+    },
+    'DOWNLOADER_IN_MEMORY_HANDOFF': {
+        'default': False,
+        'type': bool,
+    },
+    'DOWNLOADER_CONTENT_ADDRESSED': {
+        'default': False,
+        'type': bool,
+    },
+    'DOWNLOADER_CONTENT_TEMPLATE': {
+        'default': "output/{scraper_name}/content/{content_hash:.2}/{content_hash}{ext}",
+        'type': str,
+    },
+    'DOWNLOADER_OUTPUT_MODE': {
+        'default': 'files',
+        'type': str,
+        'must_be': ['files', 'archive'],
+    },
+    'DOWNLOADER_ARCHIVE_TEMPLATE': {
+        'default': "output/{scraper_name}/{run_id}_{segment_id}.sxa",
+        'type': str,
+    },
+    'DOWNLOADER_ARCHIVE_MAX_BYTES': {
+        'default': 256 * 1024 * 1024,
+        'type': int,
+    },
+    'DOWNLOADER_ARCHIVE_MAX_SECONDS': {
+        'default': 15 * 60,
+        'type': float,
+    },
+    'DOWNLOADER_MAX_RESPONSE_BYTES': {
+        'type': int,
+    },
+    'DOWNLOADER_DNS_CACHE': {
+        'default': False,
+        'type': bool,
+    },
+    'DOWNLOADER_DNS_CACHE_MAX_AGE': {
+        'default': 300.0,
+        'type': float,
+    },
+    'DOWNLOADER_CASSETTE_MODE': {
+        'type': str,
+        'default': None,
+        'must_be': [None, 'record', 'replay'],
+    },
+    'DOWNLOADER_CASSETTE_FILE': {
+        'type': str,
+        'required_if': {'DOWNLOADER_CASSETTE_MODE': ['record', 'replay']},
+    },
+    'DOWNLOADER_CASSETTE_LATENCY': {
+        'type': str,
+    },
     ###
     # Extractor
     # TODO: Uses same as downloader, best way?
@@ -142,6 +233,63 @@ _CONFIG_STRUCTURE = {
     'EXTRACTOR_SAVE_DATA_AWS_SECRET_ACCESS_KEY': {
         'type': str,
     },
+    'EXTRACTOR_COMPRESSION': {
+        'default': 'none',
+        'type': str,
+        'must_be': ['none', 'gzip', 'zstd'],
+    },
+    'EXTRACTOR_COMPRESSION_LEVEL': {
+        'type': int,
+    },
+    'EXTRACTOR_OUTPUT_MODE': {
+        'default': 'files',
+        'type': str,
+        'must_be': ['files', 'aggregate'],
+    },
+    'EXTRACTOR_AGGREGATE_TEMPLATE': {
+        'default': "output/{scraper_name}/{run_id}/{name}/{segment_id}.jsonl",
+        'type': str,
+    },
+    'EXTRACTOR_AGGREGATE_MAX_BYTES': {
+        'default': 128 * 1024 * 1024,
+        'type': int,
+    },
+    'EXTRACTOR_AGGREGATE_MAX_ROWS': {
+        'type': int,
+    },
+    'EXTRACTOR_ADAPTIVE_SELECTORS': {
+        'default': False,
+        'type': bool,
+    },
+    'EXTRACTOR_SELECTOR_STATS_FILE': {
+        'type': str,
+    },
+    'EXTRACTOR_PARSER': {
+        'default': 'parsel',
+        'type': str,
+        'must_be': ['parsel', 'lxml', 'selectolax'],
+    },
+    'EXTRACTOR_QA_POLICY': {
+        'default': 'fail',
+        'type': str,
+        'must_be': ['fail', 'drop', 'default'],
+    },
+    'EXTRACTOR_WORKERS': {
+        'default': 0,
+        'type': int,
+    },
+    'EXTRACTOR_POOL': {
+        'default': 'thread',
+        'type': str,
+        'must_be': ['thread', 'process'],
+    },
+    'EXTRACTOR_QUEUE_SIZE': {
+        'type': int,
+    },
+    'EXTRACTOR_PROCESSED_LEDGER_FILE': {
+        'default': None,
+        'type': str,
+    },
     'EXTRACTOR_FILE_TEMPLATE': {
         'default': "output/extracted.json",
         'type': str,
@@ -444,6 +592,22 @@ class ConfigGen:
         except AttributeError:
             pass
 
+        try:
+            if cli_args.record:
+                cli_config['DOWNLOADER_CASSETTE_MODE'] = 'record'
+                cli_config['DOWNLOADER_CASSETTE_FILE'] = cli_args.record
+            elif cli_args.replay:
+                cli_config['DOWNLOADER_CASSETTE_MODE'] = 'replay'
+                cli_config['DOWNLOADER_CASSETTE_FILE'] = cli_args.replay
+        except AttributeError:
+            pass
+
+        try:
+            if cli_args.replay_latency:
+                cli_config['DOWNLOADER_CASSETTE_LATENCY'] = cli_args.replay_latency
+        except AttributeError:
+            pass
+
         try:
             if cli_args.period:
                 cli_config['DISPATCH_RATELIMIT_TYPE'] = 'period'
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import pathlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Ledgers that are open in this process, keyed by file
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+def content_hash(data):
+    """Hash of the contents of a source, used as its address when saving
+
+    Args:
+        data (str|bytes): Contents of the source, strings are hashed as utf-8
+
+    Returns:
+        str: sha256 hex digest of the data
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_processed_ledger(scraper):
+    """Get the ledger of processed sources for the scraper based on the config
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Returns:
+        ProcessedLedger|None: The ledger to use, or None if it is not turned on
+    """
+    ledger_file = scraper.config['EXTRACTOR_PROCESSED_LEDGER_FILE']
+    if not ledger_file:
+        return None
+
+    with _ledgers_lock:
+        if ledger_file not in _ledgers:
+            _ledgers[ledger_file] = ProcessedLedger(ledger_file)
+            # Make sure what was extracted is not lost if the run does not finish cleanly
+            atexit.register(_ledgers[ledger_file].save)
+        return _ledgers[ledger_file]
+
+
+class ProcessedLedger:
+
+    def __init__(self, ledger_file):
+        """Remember which source contents have been extracted by which extractor version
+
+        Args:
+            ledger_file (str): Local json file the ledger is saved to
+        """
+        self.file = ledger_file
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            with open(self.file, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _key(source_hash, extractor_version):
+        return f'{extractor_version}:{source_hash}'
+
+    def is_processed(self, source_hash, extractor_version):
+        """Check if the source contents have already been extracted
+
+        Args:
+            source_hash (str): `content_hash` of the source
+            extractor_version (str): Version of the extractor
+
+        Returns:
+            bool: True if it has been extracted by this version before
+        """
+        with self._lock:
+            return self._key(source_hash, extractor_version) in self._entries
+
+    def add(self, source_hash, extractor_version):
+        """Mark the source contents as extracted
+
+        Args:
+            source_hash (str): `content_hash` of the source
+            extractor_version (str): Version of the extractor
+        """
+        with self._lock:
+            self._entries[self._key(source_hash, extractor_version)] = time.time()
+
+    def snapshot(self):
+        """Copy of the ledger entries
+
+        Returns:
+            dict: Entries and the time they were processed
+        """
+        with self._lock:
+            return dict(self._entries)
+
+    def merge(self, entries):
+        """Add the entries of another ledger, used to combine ledgers from worker processes
+
+        Args:
+            entries (dict): Entries and the time they were processed
+        """
+        with self._lock:
+            self._entries.update(entries)
+
+    def save(self):
+        """Save the ledger to its file"""
+        with self._lock:
+            pathlib.Path(self.file).parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = f"{self.file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_file, self.file)
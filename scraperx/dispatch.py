@@ -5,6 +5,12 @@ import logging
 import threading
 
 from .trigger import run_task
+from .uploads import flush_uploads
+from .archive import close_archives
+from .sinks import close_output_sinks
+from .extract_pool import close_extract_queues
+from .negative_cache import get_negative_cache
+from .content_store import get_processed_ledger
 from .utils import rate_limited, rate_limit_from_period
 
 logger = logging.getLogger(__name__)
@@ -22,6 +28,8 @@ class Dispatch():
                 Each task should be a dict. Calls submit_tasks() if None. Defaults to None.
         """
         self.scraper = scraper
+        # Tasks not dispatched because of the negative cache
+        self.skipped_tasks = []
 
         logger.info("Start Gathering Tasks...", extra={**self.scraper.log_extras()})
 
@@ -65,6 +73,45 @@ class Dispatch():
         else:
             return rate_limit_value
 
+    def _bandwidth_budget_reached(self):
+        """Check if the run has used up its bandwidth budget
+        Uses the bytes pulled over the wire by all downloads in this process, so it is only
+        used when the dispatch service is local
+
+        Returns:
+            bool: True if no more tasks should be dispatched
+        """
+        budget = self.scraper.config['DISPATCH_BANDWIDTH_BUDGET']
+        if not budget or self.scraper.config['DISPATCH_SERVICE_NAME'] != 'local':
+            return False
+
+        return self.scraper.stats['bytes_compressed'] >= budget
+
+    def _check_negative_cache(self, negative_cache, tasks):
+        """Skip or move to the end the tasks that recently failed for good
+
+        Args:
+            negative_cache (scraperx.negative_cache.NegativeCache): Cache of failed tasks
+            tasks (generator): Tasks to be dispatched
+
+        Yields:
+            dict: Tasks that should be dispatched
+        """
+        action = self.scraper.config['DISPATCH_NEGATIVE_CACHE_ACTION']
+        deprioritized = []
+        for task in tasks:
+            failure = negative_cache.get(task)
+            if failure is None:
+                yield task
+            elif action == 'deprioritize':
+                self.scraper.stats.incr('negative_cache_deprioritized')
+                deprioritized.append(task)
+            else:
+                self.scraper.stats.incr('negative_cache_skipped')
+                self.skipped_tasks.append({'task': task, **failure})
+
+        yield from deprioritized
+
     def run(self, **download_kwargs):
         """Starts dispatching the tasks using threads and a local queue
 
@@ -97,6 +144,26 @@ class Dispatch():
             # No reason to continue
             return
 
+        if (self.scraper.config['DISPATCH_BANDWIDTH_BUDGET']
+                and self.scraper.config['DISPATCH_SERVICE_NAME'] != 'local'):
+            # The downloads run somewhere else, so their bytes are never counted here
+            logger.warning("The bandwidth budget is only used when the dispatch service is local",
+                           extra={**self.scraper.log_extras(),
+                                  'dispatch_service':
+                                      self.scraper.config['DISPATCH_SERVICE_NAME']})
+
+        if (self.scraper.config['DISPATCH_NEGATIVE_CACHE_FILE']
+                and self.scraper.config['DISPATCH_SERVICE_NAME'] != 'local'):
+            logger.warning("The negative cache is only used when the dispatch service is local",
+                           extra={**self.scraper.log_extras(),
+                                  'dispatch_service':
+                                      self.scraper.config['DISPATCH_SERVICE_NAME']})
+
+        negative_cache = get_negative_cache(self.scraper)
+        if negative_cache is not None:
+            self.tasks_generator = self._check_negative_cache(negative_cache,
+                                                              self.tasks_generator)
+
         # Have 3 times the numbers of threads so a task will not bottleneck
         num_threads = math.ceil(qps * 3)
         q = queue.Queue()
@@ -108,9 +175,17 @@ class Dispatch():
                     break
 
                 try:
-                    run_task(self.scraper, task,
-                             task_cls=self.scraper.download,
-                             **download_kwargs)
+                    if self._bandwidth_budget_reached():
+                        # Tasks can be queued faster then the bytes are counted,
+                        # so check again right before downloading
+                        logger.debug("Bandwidth budget reached, task skipped",
+                                     extra={'task': task,
+                                            **self.scraper.log_extras()})
+                        self.scraper.stats.incr('bandwidth_budget_skipped')
+                    else:
+                        run_task(self.scraper, task,
+                                 task_cls=self.scraper.download,
+                                 **download_kwargs)
                 except Exception:
                     logger.critical("Dispatch failed",
                                     extra={'task': task,
@@ -128,16 +203,30 @@ class Dispatch():
 
         @rate_limited(num_calls=qps)
         def _rate_limit_tasks():
-            task = next(self.tasks_generator)
+            task = next(self.tasks_generator, None)
+            if task is None:
+                # Can happen if tasks were skipped
+                return False
             logger.debug("Adding task",
                          extra={'task': task,
                                 **self.scraper.log_extras()})
             self.tasks.append(task)
             q.put(task)
+            return True
 
         # Fill the Queue with the data to process
+        num_dispatched = 0
         for _ in range(self.num_tasks):
-            _rate_limit_tasks()
+            if self._bandwidth_budget_reached():
+                logger.warning("Bandwidth budget reached, no more tasks will be dispatched",
+                               extra={**self.scraper.log_extras(),
+                                      'bandwidth_budget':
+                                          self.scraper.config['DISPATCH_BANDWIDTH_BUDGET'],
+                                      'num_dispatched': num_dispatched})
+                break
+            if not _rate_limit_tasks():
+                break
+            num_dispatched += 1
 
         # Process the data and wait until its complete
         q.join()
@@ -147,3 +236,26 @@ class Dispatch():
             q.put(None)
         for t in threads:
             t.join()
+
+        close_extract_queues()
+        close_archives()
+        close_output_sinks()
+        flush_uploads(self.scraper)
+
+        if negative_cache is not None:
+            negative_cache.save()
+            if self.skipped_tasks:
+                logger.info(f"Skipped {len(self.skipped_tasks)} tasks in the negative cache",
+                            extra={**self.scraper.log_extras(),
+                                   'skipped_tasks': self.skipped_tasks})
+
+        processed_ledger = get_processed_ledger(self.scraper)
+        if processed_ledger is not None:
+            processed_ledger.save()
+        self.scraper.selector_stats.save()
+
+        logger.info("Dispatch finished",
+                    extra={**self.scraper.log_extras(),
+                           'num_dispatched': num_dispatched,
+                           'stats': self.scraper.stats.snapshot(),
+                           'selector_stats': self.scraper.selector_stats.snapshot()})
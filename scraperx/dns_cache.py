@@ -0,0 +1,197 @@
+import time
+import socket
+import weakref
+import logging
+import ipaddress
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+# DNS caches that are used in this process, by scraper then max age.
+# Weak so a scraper that is no longer used is not kept alive by its cache
+_dns_caches = weakref.WeakKeyDictionary()
+_dns_caches_lock = threading.Lock()
+
+
+def get_dns_cache(scraper):
+    """Get the DNS cache for the scraper based on the config
+
+    The cache is shared by every download of the scraper in the process, since each one uses
+    its own session. Each scraper has its own cache so the hits & misses go to its stats.
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Returns:
+        DNSCache|None: The cache to use, or None if it is not turned on
+    """
+    if not scraper.config['DOWNLOADER_DNS_CACHE']:
+        return None
+
+    max_age = scraper.config['DOWNLOADER_DNS_CACHE_MAX_AGE']
+    with _dns_caches_lock:
+        scraper_caches = _dns_caches.setdefault(scraper, {})
+        if max_age not in scraper_caches:
+            scraper_caches[max_age] = DNSCache(max_age=max_age, stats=scraper.stats)
+        return scraper_caches[max_age]
+
+
+def _record_ttl(host):
+    """Get the TTL of the hosts DNS record
+
+    Only works if the optional `dnspython` package is installed. Only the TTL is used, the
+    addresses still come from the system resolver so the hosts file & search domains work.
+
+    Args:
+        host (str): Hostname to look up
+
+    Returns:
+        int|None: TTL in seconds, or None if it could not be found
+    """
+    try:
+        import dns.resolver
+        import dns.exception
+    except ImportError:
+        return None
+
+    try:
+        answer = dns.resolver.resolve(host, 'A')
+    except dns.exception.DNSException:
+        # Things like `localhost` or hosts that only have IPv6 addresses
+        return None
+    return answer.rrset.ttl
+
+
+class DNSCache:
+
+    def __init__(self, max_age=300, stats=None):
+        """In process cache of hostname lookups
+
+        Hosts are resolved by the system. Entries are kept for the TTL of the DNS record,
+        up to `max_age` seconds. If the TTL cannot be found (`dnspython` is not installed or
+        the host is not in the DNS) `max_age` is used.
+
+        Args:
+            max_age (float, optional): Max seconds to keep an entry. Defaults to 300.
+            stats (scraperx.stats.RunStats, optional): Counters to add the hits and misses to.
+                Defaults to None.
+        """
+        self.max_age = max_age
+        self._stats = stats
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        # Connection pools that use this cache, used by the DNSCacheAdapter
+        self.pool_classes_by_scheme = {
+            'http': _make_pool_cls(HTTPConnectionPool, HTTPConnection, self),
+            'https': _make_pool_cls(HTTPSConnectionPool, HTTPSConnection, self),
+        }
+
+    def _incr(self, key):
+        if self._stats is not None:
+            self._stats.incr(key)
+
+    def resolve(self, host, port=None):
+        """Get the addresses of a host, from the cache if possible
+
+        Args:
+            host (str): Hostname to resolve
+            port (int, optional): Port that will be connected to. Defaults to None.
+
+        Raises:
+            socket.gaierror: If the host could not be resolved
+
+        Returns:
+            list: IP addresses of the host
+        """
+        try:
+            ipaddress.ip_address(host)
+            # Nothing to resolve
+            return [host]
+        except ValueError:
+            pass
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry is not None and entry[1] > now:
+            self._incr('dns_cache_hits')
+            return entry[0]
+
+        self._incr('dns_cache_misses')
+        addresses = []
+        for *_, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+
+        max_age = self.max_age
+        ttl = _record_ttl(host)
+        if ttl is not None:
+            max_age = min(ttl, max_age)
+        with self._lock:
+            self._entries[host] = (addresses, now + max_age)
+
+        return addresses
+
+    def invalidate(self, host):
+        """Remove a host from the cache, used if none of its addresses could be connected to
+
+        Args:
+            host (str): Hostname to remove
+        """
+        with self._lock:
+            self._entries.pop(host, None)
+
+
+def _make_pool_cls(pool_cls, connection_cls, dns_cache):
+    """Create a connection pool class whose connections resolve hosts using the `dns_cache`"""
+    cached_connection_cls = type(f'DNSCache{connection_cls.__name__}',
+                                 (_DNSCacheConnectionMixin, connection_cls),
+                                 {'dns_cache': dns_cache})
+    return type(f'DNSCache{pool_cls.__name__}',
+                (pool_cls,),
+                {'ConnectionCls': cached_connection_cls})
+
+
+class _DNSCacheConnectionMixin:
+    dns_cache = None
+
+    def _new_conn(self):
+        # The hostname is still used for the Host header & TLS, only the socket uses the address
+        dns_host = self._dns_host
+        addresses = self.dns_cache.resolve(dns_host, self.port)
+        try:
+            for idx, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError):
+                    if idx == len(addresses) - 1:
+                        # Next time look up the host again in case its addresses changed
+                        self.dns_cache.invalidate(dns_host)
+                        raise
+        finally:
+            self._dns_host = dns_host
+
+
+class DNSCacheAdapter(HTTPAdapter):
+
+    def __init__(self, dns_cache, *args, **kwargs):
+        """Requests transport adapter that resolves hosts using a DNSCache
+
+        Only used for direct requests, requests through a proxy are resolved by the proxy.
+
+        Args:
+            dns_cache (DNSCache): The cache to resolve hosts with
+        """
+        # Needs to be set before the pool manager is created in the parents __init__
+        self.dns_cache = dns_cache
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self.dns_cache.pool_classes_by_scheme
@@ -0,0 +1,195 @@
+import parsel
+
+from .selectors import css_to_xpath
+
+PARSERS = ('parsel', 'lxml', 'selectolax')
+
+# Size of the pieces `iter_elements` feeds to the parser
+_FEED_CHUNK_SIZE = 64 * 1024
+# How far into a source to look for the start of an xml declaration
+_XML_DECLARATION_SEARCH = 1024
+
+
+def parse_document(source, parser='parsel'):
+    """Parse html using one of the parser backends
+
+    Every backend's elements have the same basic api:
+        - `css(css_selector)`: List of the matching elements
+        - `xpath(query)`: List of the matching elements, `selectolax` elements do not have it
+        - `text`: All of the text in the element
+        - `attrib`: Dict of the element's attributes
+
+    `parsel` elements are still parsel Selectors, so the rest of the parsel api can be used.
+    Only `parsel` & `lxml` support the `::text` & `::attr()` pseudo elements.
+
+    Args:
+        source (str): Html to parse
+        parser (str, optional): `parsel`, `lxml` or `selectolax`. Defaults to 'parsel'.
+
+    Raises:
+        ValueError: The parser is not supported
+
+    Returns:
+        obj: The parsed document
+    """
+    if parser == 'parsel':
+        return ParselElement(text=source)
+
+    elif parser == 'lxml':
+        import lxml.html
+        if isinstance(source, str):
+            # lxml does not take strings with an encoding declaration, the parser's encoding
+            # is used over the declared one since the string is already decoded
+            source = source.encode('utf-8')
+        # lxml can not parse an empty document
+        return LxmlElement(lxml.html.document_fromstring(
+            source or b'<html></html>',
+            parser=lxml.html.HTMLParser(encoding='utf-8')))
+
+    elif parser == 'selectolax':
+        from selectolax.lexbor import LexborHTMLParser
+        return SelectolaxElement(LexborHTMLParser(source).root)
+
+    raise ValueError(f"Parser must be one of {PARSERS}, not {parser}")
+
+
+def iter_elements(source, tag, attrs=None, parser='parsel'):
+    """Find elements while the document is being parsed, without building the whole tree
+
+    The source is fed to lxml a chunk at a time. Each element is yielded once its end tag is
+    parsed, then cleared along with anything before it once the next element is requested,
+    so the parsed tree only holds the current element & what lxml has read ahead. The source
+    itself is still in memory. Elements inside a matching element are kept until it is done.
+    Sources starting with `<?xml` are parsed as xml, where `tag` matches in any namespace.
+
+    Args:
+        source (str|bytes): Html or xml to parse
+        tag (str): Tag name of the elements
+        attrs (dict, optional): Attributes the elements must have. For `class`, the element
+            only needs to have that class. Defaults to None.
+        parser (str, optional): Backend whose element api to use. `selectolax` can not parse
+            incrementally so it uses `lxml`. Defaults to 'parsel'.
+
+    Yields:
+        obj: Each matching element, see `parse_document`
+    """
+    from lxml import etree
+
+    if not source:
+        # lxml can not parse an empty document
+        return
+
+    start = source[:_XML_DECLARATION_SEARCH].lstrip()
+    is_xml = start[:5] in ('<?xml', b'<?xml')
+    is_str = isinstance(source, str)
+    if is_xml:
+        # Strings are fed encoded as utf-8, no matter what encoding they declare
+        pull_parser = etree.XMLPullParser(events=('start', 'end'),
+                                          tag=tag if '{' in tag else f'{{*}}{tag}',
+                                          encoding='utf-8' if is_str else None)
+    else:
+        pull_parser = etree.HTMLPullParser(events=('start', 'end'), tag=tag,
+                                           encoding='utf-8')
+
+    attrs = attrs or {}
+    # Number of matching elements that have started but not ended
+    open_matches = 0
+
+    def _read_events():
+        nonlocal open_matches
+        for event, element in pull_parser.read_events():
+            matches = all(_attr_matches(element, name, value) for name, value in attrs.items())
+            if event == 'start':
+                open_matches += matches
+                continue
+
+            if matches:
+                open_matches -= 1
+                if parser == 'parsel':
+                    yield ParselElement(root=element, type='xml' if is_xml else 'html')
+                else:
+                    yield LxmlElement(element)
+
+            if not open_matches:
+                # Free the element and everything parsed before it, unless it is part of a
+                # matching element that is still being parsed
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+    for idx in range(0, len(source), _FEED_CHUNK_SIZE):
+        chunk = source[idx:idx + _FEED_CHUNK_SIZE]
+        # Encoded a chunk at a time so there is never a second copy of the whole source
+        pull_parser.feed(chunk.encode('utf-8') if is_str else chunk)
+        yield from _read_events()
+    pull_parser.close()
+    yield from _read_events()
+
+
+def _attr_matches(element, name, value):
+    if name == 'class':
+        return value in (element.get('class') or '').split()
+    return element.get(name) == value
+
+
+class ParselElement(parsel.Selector):
+    """parsel Selector with the common element api"""
+
+    @property
+    def text(self):
+        return self.xpath('string()').get()
+
+
+class LxmlElement:
+    __slots__ = ('element',)
+
+    def __init__(self, element):
+        """lxml element with the common element api
+
+        Args:
+            element (lxml.html.HtmlElement): The element
+        """
+        self.element = element
+
+    def css(self, css_selector):
+        return self.xpath(css_to_xpath(css_selector))
+
+    def xpath(self, query):
+        results = self.element.xpath(query)
+        if not isinstance(results, list):
+            # Things like `string()` return a single value
+            return [results]
+        # Text & attributes are returned as strings
+        return [LxmlElement(result) if hasattr(result, 'xpath') else str(result)
+                for result in results]
+
+    @property
+    def text(self):
+        return ''.join(self.element.itertext())
+
+    @property
+    def attrib(self):
+        return dict(self.element.attrib)
+
+
+class SelectolaxElement:
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        """selectolax node with the common element api
+
+        Args:
+            node (selectolax.lexbor.LexborNode): The node
+        """
+        self.node = node
+
+    def css(self, css_selector):
+        return [SelectolaxElement(node) for node in self.node.css(css_selector)]
+
+    @property
+    def text(self):
+        return self.node.text(deep=True)
+
+    @property
+    def attrib(self):
+        return dict(self.node.attributes)
@@ -1,14 +1,24 @@
 import os
 import re
+import pathlib
 import logging
 import datetime
 import requests
 
 from .write import Write
 from .trigger import run_task
+from .extract_pool import get_extract_queue
 from .proxies import get_proxy
+from .archive import get_archive_writer
+from .content_store import content_hash
+from .compression import CODECS, get_compression
+from .uploads import wait_for_upload
+from .cassette import get_cassette
+from .dns_cache import get_dns_cache, DNSCacheAdapter
+from .negative_cache import get_negative_cache, TERMINAL_STATUS_CODES
+from .serializers import get_serializer
 from .user_agent import get_user_agent
-from .exceptions import DownloadValueError, HTTPIgnoreCodeError
+from .exceptions import DownloadValueError, HTTPIgnoreCodeError, ResponseTooLargeError
 
 logger = logging.getLogger(__name__)
 
@@ -49,13 +59,20 @@ class Download:
         self._manifest = {'source_files': [],
                           'time_downloaded': self.time_downloaded,
                           'date_downloaded': self.date_downloaded,
+                          # Includes every request made for the task, even the failed ones
+                          'bytes_downloaded': {'compressed': 0,
+                                               'decompressed': 0,
+                                               },
                           }
+        # Contents of each source, passed to the extractor if it runs in this process
+        self._source_contents = []
 
         # Set up a requests session
         self.session = requests.Session()
 
         self._init_headers(headers)
         self._init_proxy(proxy)
+        self._init_transport()
         self._init_http_methods()
 
     def download(self):
@@ -108,10 +125,17 @@ class Download:
 
         Will trigger the extract task after its complete
         """
+        negative_cache = get_negative_cache(self.scraper)
         try:
             self.download()
-        except (requests.exceptions.HTTPError, HTTPIgnoreCodeError):
+        except (requests.exceptions.HTTPError, HTTPIgnoreCodeError) as e:
             # The status code was logged during the request, no need to repeat
+            status_code = e.response.status_code if e.response is not None else None
+            if negative_cache is not None and (isinstance(e, HTTPIgnoreCodeError)
+                                               or status_code in TERMINAL_STATUS_CODES):
+                negative_cache.add(self.task, status_code)
+        except ResponseTooLargeError:
+            # Was logged during the request, no need to repeat
             pass
         except DownloadValueError:
             # The status code was logged during the request, no need to repeat
@@ -122,13 +146,18 @@ class Download:
                                     **self.scraper.log_extras()})
         else:
             if self._manifest['source_files']:
-                self._save_metadata()
-                run_task(self.scraper,
-                         self.task,
-                         task_cls=self.scraper.extract,
-                         download_manifest=self._manifest,
-                         **self._triggered_kwargs,
-                         triggered_kwargs=self._triggered_kwargs)
+                if negative_cache is not None:
+                    # It may have failed before, but it works now
+                    negative_cache.remove(self.task)
+                metadata_file = self._save_metadata()
+                try:
+                    self._wait_for_uploads(metadata_file)
+                except Exception:
+                    logger.exception("Upload failed, the extractor was not triggered",
+                                     extra={'task': self.task,
+                                            **self.scraper.log_extras()})
+                else:
+                    self._trigger_extract()
             else:
                 # If it got here and there is not saved file then thats an issue
                 logger.error("No source file saved",
@@ -143,6 +172,60 @@ class Download:
                             'time_finished': datetime.datetime.utcnow().isoformat() + 'Z',
                             })
 
+    def _wait_for_uploads(self, metadata_file):
+        """Wait for the sources & metadata to be uploaded if the extractor runs somewhere else
+
+        When local, the extractor will wait for each source it reads.
+
+        Args:
+            metadata_file (str|None): Path the metadata was saved to
+
+        Raises:
+            Exception: Whatever caused an upload to fail
+        """
+        if self.scraper.config['DISPATCH_SERVICE_NAME'] == 'local':
+            return
+        for source in self._manifest['source_files']:
+            wait_for_upload(self.scraper, source['file'])
+        if metadata_file is not None:
+            wait_for_upload(self.scraper, metadata_file)
+
+    def _trigger_extract(self):
+        """Run or queue the extractor on what was downloaded"""
+        download_manifest = self._get_extract_manifest()
+        extract_queue = get_extract_queue(self.scraper)
+        if extract_queue is not None:
+            # Extracted in its own pool so this thread can start the next download
+            extract_queue.submit(self.task, download_manifest, self._triggered_kwargs)
+        else:
+            run_task(self.scraper,
+                     self.task,
+                     task_cls=self.scraper.extract,
+                     download_manifest=download_manifest,
+                     **self._triggered_kwargs,
+                     triggered_kwargs=self._triggered_kwargs)
+
+    def _get_extract_manifest(self):
+        """Manifest to pass to the extractor
+
+        If the config `downloader.in_memory_handoff` is set and the extractor runs locally,
+        each source also has its `content` so the extractor does not have to read the saved
+        file back. The saved metadata never has the contents.
+
+        Returns:
+            dict: The download manifest
+        """
+        if (not self.scraper.config['DOWNLOADER_IN_MEMORY_HANDOFF']
+                or self.scraper.config['DISPATCH_SERVICE_NAME'] != 'local'):
+            return self._manifest
+
+        source_files = []
+        for source, content in zip(self._manifest['source_files'], self._source_contents):
+            if content is not None:
+                source = {**source, 'content': content}
+            source_files.append(source)
+        return {**self._manifest, 'source_files': source_files}
+
     def save_request(self, r, content=None, source_file=None, content_type=None, **save_kwargs):
         """Save the data from the request into a file and save the request data in the metadata file
         This is needed to pass the source file into the extract class
@@ -163,45 +246,138 @@ class Download:
         """
         if content is None:
             content = r.text
+        # Only what is saved here is known to match what the extractor would read back
+        handoff_content = content if source_file is None else None
 
+        archive_location = None
+        source_hash = None
+        saved_compression = None
         if source_file is None:
-            source_file = Write(self.scraper, content, encoding=r.encoding)\
-                .write_file(content_type=content_type)\
-                .save(self, **save_kwargs)
-
-        self._manifest['source_files'].append(
-            {
-                'file': source_file,
-                'request': {
-                    'url': r.url,
-                    'method': r.request.method,
-                    'status_code': r.status_code,
-                    'headers': {
-                        'request': dict(r.request.headers),
-                        'response': dict(r.headers),
-                    },
+            archive_writer = get_archive_writer(self.scraper)
+            if archive_writer is None and self.scraper.config['DOWNLOADER_CONTENT_ADDRESSED']:
+                # Saved as utf-8 so the same contents always have the same hash
+                source_hash = content_hash(content)
+                source_saver = Write(self.scraper, content).write_file(content_type=content_type)
+            else:
+                source_saver = Write(self.scraper, content, encoding=r.encoding)\
+                    .write_file(content_type=content_type)
+
+            if source_hash is not None:
+                source_name, source_file = self._save_content_addressed(source_saver,
+                                                                        source_hash,
+                                                                        **save_kwargs)
+            elif archive_writer is None:
+                source_file = source_saver.save(self, **save_kwargs)
+            else:
+                # Still create the filename so it is known what the source would have been
+                name = source_saver._get_filename(
+                    self,
+                    template_values=save_kwargs.get('template_values', {}),
+                    name_template=save_kwargs.get('filename'),
+                )
+                archive_location = archive_writer.append('source', content,
+                                                         header={'name': name, 'url': r.url})
+                source_file = archive_location['file']
+
+            if archive_writer is None:
+                # Archive records are always gzipped, so this is only needed for files
+                saved_compression = save_kwargs.get('compression')
+                if saved_compression is None:
+                    saved_compression, _ = get_compression(self.scraper, 'downloader')
+                elif saved_compression not in CODECS:
+                    saved_compression = None
+
+        source_info = {
+            'file': source_file,
+            'request': {
+                'url': r.url,
+                'method': r.request.method,
+                'status_code': r.status_code,
+                'headers': {
+                    'request': dict(r.request.headers),
+                    'response': dict(r.headers),
                 },
-            }
-        )
+                'bytes_downloaded': getattr(r, 'bytes_downloaded', None),
+            },
+        }
+        if saved_compression is not None:
+            source_info['compression'] = saved_compression
+        if source_hash is not None:
+            source_info['content_hash'] = source_hash
+            # What the file would have been named, the metadata is saved using it
+            source_info['name'] = source_name
+        if archive_location is not None:
+            source_info['archive'] = {'name': name,
+                                      'offset': archive_location['offset'],
+                                      'length': archive_location['length'],
+                                      }
+        self._manifest['source_files'].append(source_info)
+        self._source_contents.append(handoff_content)
 
         return source_file
 
+    def _save_content_addressed(self, source_saver, source_hash, template_values={},
+                                filename=None, **save_kwargs):
+        """Save the source under its hash, skipping it if the same contents are already saved
+
+        Args:
+            source_saver (scraperx.save_to.SaveTo): Source to save
+            source_hash (str): `content_hash` of the source
+            template_values (dict, optional): Additional keys to use in the template.
+                Defaults to {}.
+            filename (str, optional): Used to get the file extension. If None then the
+                config file_template will be used. Defaults to None.
+            **save_kwargs: Keyword arguments that will be passed into
+                `scraperx.save_to.SaveTo.save` function
+
+        Returns:
+            tuple: The name the file would have been saved as & the path it was saved to
+        """
+        # Keep the extension of the file it would have been saved as
+        name = source_saver._get_filename(self,
+                                          template_values=template_values,
+                                          name_template=filename)
+        ext = pathlib.PurePosixPath(name).suffix
+        return name, source_saver.save(self,
+                                       template_values={**template_values,
+                                                        'content_hash': source_hash,
+                                                        'ext': ext,
+                                                        },
+                                       filename=self.scraper.config['DOWNLOADER_CONTENT_TEMPLATE'],
+                                       skip_existing=True,
+                                       **save_kwargs)
+
     def _save_metadata(self):
         """Save the metadata of the download portion of the scraper to a json file.
         This is used to pass to the extract class as well as debugging if
         anything goes wrong with the request.
 
         Saves a file ending in `_metadata.json` in the same path as the first source file saved.
+        If saving to an archive, the metadata is added to the archive instead.
+
+        Returns:
+            str|None: Path of the metadata file, None if no file was saved
         """
         if self.scraper.config['DOWNLOADER_SAVE_METADATA']:
             metadata = self._get_metadata()
-            if metadata['download_manifest']['source_files']:
+            archive_writer = get_archive_writer(self.scraper)
+            if archive_writer is not None and metadata['download_manifest']['source_files']:
+                # Saved next to the sources in the archive, not in its own file
+                archive_writer.append('metadata',
+                                      get_serializer(self.scraper).dumps(metadata),
+                                      header={'task': self.task})
+            elif metadata['download_manifest']['source_files']:
                 metadata_file = Write(self.scraper, metadata).write_json_lines()
-                filename = metadata['download_manifest']['source_files'][0]['file']
+                first_source = metadata['download_manifest']['source_files'][0]
+                # Content addressed sources are shared between tasks, so use the task's name
+                filename = first_source.get('name', first_source['file'])
                 logger.debug("Saving metadata file",
                              extra={'task': self.task,
                                     **self.scraper.log_extras()})
-                metadata_file.save(self, filename=filename + '_metadata.json')
+                # Always plain json so it can be read without knowing how the sources were saved
+                return metadata_file.save(self, filename=filename + '_metadata.json',
+                                          compression='none')
+        return None
 
     def _get_metadata(self):
         """Create the dict of metadata to be saved
@@ -268,6 +444,28 @@ class Download:
             proxy_str = self._get_proxy(country=self.task.get('proxy_country'))
         self.session.proxies = self._format_proxy(proxy_str)
 
+    def _init_transport(self):
+        """Set up the transport adapters of the session
+
+        When replaying a cassette, all requests are served from the cassette
+        and nothing goes out over the network.
+        Otherwise if the DNS cache is turned on and no proxy is used, hosts are
+        resolved using the DNS cache.
+        """
+        adapter = None
+        self._cassette = get_cassette(self.scraper)
+        if self._cassette is not None and self._cassette.mode == 'replay':
+            adapter = self._cassette.adapter()
+
+        elif not any(self.session.proxies.values()):
+            dns_cache = get_dns_cache(self.scraper)
+            if dns_cache is not None:
+                adapter = DNSCacheAdapter(dns_cache)
+
+        if adapter is not None:
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
     def _init_http_methods(self):
         # Create http methods
         self.request_get = self._set_http_method('GET')
@@ -279,7 +477,8 @@ class Download:
         self.request_delete = self._set_http_method('DELETE')
 
     def _set_http_method(self, http_method):
-        def make_request(url, max_tries=3, _try_count=1, custom_source_checks=(), **r_kwargs):
+        def make_request(url, max_tries=3, _try_count=1, custom_source_checks=(),
+                         max_bytes=None, **r_kwargs):
             """Makes the requests to get the source file
 
             Must be accessed using::
@@ -304,11 +503,16 @@ class Download:
                     message (str): Custom status message to set to know this is not a normal
                         status code being thrown
                     Defaults to ().
+                max_bytes (int, optional): Max size of the response body in bytes. The body
+                    is streamed and the download stops as soon as it gets larger then this.
+                    If None, the config `DOWNLOADER_MAX_RESPONSE_BYTES` is used.
+                    Defaults to None.
                 **r_kwargs: Keyword Arguments to be passed to requests.Session().requests
 
             Raises:
                 ValueError: If max_tries is 0 or negative.
                 HTTPIgnoreCodeError: If an ignore_code is found
+                ResponseTooLargeError: If the response body is larger then `max_bytes`
                 DownloadValueError: If the download failed for any reason and
                     max_tries was reached
 
@@ -343,8 +547,23 @@ class Download:
                        'time_of_request': time_of_request,
                        }
             )
+            if max_bytes is None:
+                max_bytes = self.scraper.config['DOWNLOADER_MAX_RESPONSE_BYTES']
+
             try:
-                r = self.session.request(http_method, url, **r_kwargs)
+                # Always stream so the size of the body can be checked as it is downloaded
+                r = self.session.request(http_method, url, **{**r_kwargs, 'stream': True})
+                if r_kwargs.get('stream'):
+                    self._count_streamed_response(r, max_bytes=max_bytes)
+                    if self._cassette is not None and self._cassette.mode == 'record':
+                        logger.warning("Streamed responses are not recorded to the cassette",
+                                       extra={'task': self.task,
+                                              **self.scraper.log_extras(),
+                                              'url': url})
+                else:
+                    self._read_response(r, max_bytes=max_bytes)
+                    if self._cassette is not None and self._cassette.mode == 'record':
+                        self._cassette.record(r)
 
                 if custom_source_checks:
                     for re_text, status_code, message in custom_source_checks:
@@ -376,6 +595,7 @@ class Download:
                                               max_tries=max_tries,
                                               _try_count=_try_count + 1,
                                               custom_source_checks=custom_source_checks,
+                                              max_bytes=max_bytes,
                                               **r_kwargs)
                     else:
                         if r.status_code in self._ignore_codes:
@@ -389,6 +609,18 @@ class Download:
             except (requests.exceptions.HTTPError, HTTPIgnoreCodeError):
                 raise
 
+            except ResponseTooLargeError as e:
+                # Getting the same page again will not make it any smaller
+                logger.error(f"Download failed: {str(e)}",
+                             extra={'url': url,
+                                    'max_bytes': max_bytes,
+                                    'num_tries': _try_count,
+                                    'max_tries': max_tries,
+                                    'task': self.task,
+                                    **self.scraper.log_extras(),
+                                    'proxy': proxy_used})
+                raise
+
             except Exception as e:
                 if _try_count < max_tries:
                     r_kwargs = self.new_profile(failed_response=e.response, **r_kwargs)
@@ -396,6 +628,7 @@ class Download:
                     return request_method(url,
                                           max_tries=max_tries,
                                           _try_count=_try_count + 1,
+                                          max_bytes=max_bytes,
                                           **r_kwargs)
                 else:
                     logger.exception(f"Download failed: {str(e)}",
@@ -413,6 +646,106 @@ class Download:
 
         return make_request
 
+    def _check_content_length(self, r, max_bytes=None):
+        content_length = r.headers.get('content-length', '')
+        if max_bytes and content_length.isdigit() and int(content_length) > max_bytes:
+            r.close()
+            raise ResponseTooLargeError((f"Content-Length {content_length} is larger"
+                                         f" then {max_bytes} bytes"),
+                                        response=r)
+
+    def _count_streamed_response(self, r, max_bytes=None):
+        """Count the bytes & check the size of a response the caller is streaming
+
+        `r.iter_content` (also used by `r.content`, `r.text` & `r.iter_lines`) is wrapped so the
+        limit is checked as the body is read, and the bytes are counted once it is done.
+        Reading `r.raw` directly is not counted.
+
+        Args:
+            r (requests.request): Response from the requests lib that has not been read yet
+            max_bytes (int, optional): Max size of the (decompressed) body in bytes.
+                If None there is no limit. Defaults to None.
+
+        Raises:
+            ResponseTooLargeError: If the Content-Length is larger then `max_bytes`
+        """
+        self._check_content_length(r, max_bytes=max_bytes)
+        iter_content = r.iter_content
+
+        def _counted_iter_content(chunk_size=1, decode_unicode=False):
+            decompressed = 0
+            try:
+                for chunk in iter_content(chunk_size=chunk_size, decode_unicode=decode_unicode):
+                    decompressed += len(chunk)
+                    if max_bytes and decompressed > max_bytes:
+                        r.close()
+                        raise ResponseTooLargeError(
+                            f"Response is larger then {max_bytes} bytes", response=r)
+                    yield chunk
+            finally:
+                self._count_bytes(r, decompressed)
+
+        r.iter_content = _counted_iter_content
+
+    def _read_response(self, r, max_bytes=None):
+        """Read the body of a streamed response and count the bytes it used
+
+        The body is read in chunks so a response that is too large is stopped as soon as
+        it goes over the limit, rather then after it has all been loaded into memory.
+
+        Args:
+            r (requests.request): Response from the requests lib that has not been read yet
+            max_bytes (int, optional): Max size of the (decompressed) body in bytes.
+                If None there is no limit. Defaults to None.
+
+        Raises:
+            ResponseTooLargeError: If the body is larger then `max_bytes`
+        """
+        chunks = []
+        decompressed = 0
+        try:
+            self._check_content_length(r, max_bytes=max_bytes)
+
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                decompressed += len(chunk)
+                if max_bytes and decompressed > max_bytes:
+                    raise ResponseTooLargeError(f"Response is larger then {max_bytes} bytes",
+                                                response=r)
+                chunks.append(chunk)
+
+        except ResponseTooLargeError:
+            r.close()
+            raise
+
+        finally:
+            self._count_bytes(r, decompressed)
+
+        r._content = b''.join(chunks)
+        r._content_consumed = True
+
+    def _count_bytes(self, r, decompressed):
+        """Add the bytes used by a response to the request, task and run counters
+
+        Args:
+            r (requests.request): Response from the requests lib
+            decompressed (int): Number of bytes of the body after it was decompressed
+        """
+        try:
+            # Bytes pulled over the wire, before any decompression
+            compressed = r.raw.tell()
+        except AttributeError:
+            compressed = decompressed
+
+        r.bytes_downloaded = {'compressed': compressed,
+                              'decompressed': decompressed,
+                              }
+        self._manifest['bytes_downloaded']['compressed'] += compressed
+        self._manifest['bytes_downloaded']['decompressed'] += decompressed
+
+        self.scraper.stats.incr('requests')
+        self.scraper.stats.incr('bytes_compressed', compressed)
+        self.scraper.stats.incr('bytes_decompressed', decompressed)
+
     def _set_session_ua(self):
         """Set a user-agent for the request session to use
         If no `device_type` was set in the task, `desktop` will be used by default
@@ -16,3 +16,13 @@ class DownloadValueError(ValueError):
 class HTTPIgnoreCodeError(requests.exceptions.RequestException):
     """Requests exception for ignore_codes"""
     pass
+
+
+class ResponseTooLargeError(requests.exceptions.RequestException):
+    """Requests exception for a response body that is larger then the max bytes allowed"""
+    pass
+
+
+class UploadError(Exception):
+    """Raised when flushing the background uploads if any of them failed"""
+    pass
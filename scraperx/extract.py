@@ -1,17 +1,33 @@
 import types
+import inspect
+import itertools
 import logging
 import datetime
-from parsel import Selector
 from abc import ABC, abstractmethod
 
 from .write import Write
-from .exceptions import QAValueError
-from .utils import _get_s3_params, get_root_exc_log_overides, read_file_contents
+from .uploads import wait_for_upload
+from .archive import read_archive_record
+from .content_store import get_processed_ledger
+from .compression import get_compression
+from .sinks import get_output_sink
+from .qa import QA_POLICIES, QAValidator
+from .documents import PARSERS, iter_elements, parse_document
+from .selectors import load_selector_stats, select_css
+from .utils import _get_s3_params, get_encoding, get_root_exc_log_overides, read_file_contents
 
 logger = logging.getLogger(__name__)
 
 
 class Extract(ABC):
+    # Change when the extraction changes, so already processed sources get extracted again.
+    # Only used with the config `extractor.processed_ledger_file`. Sources are skipped by their
+    # contents, so a task with the same contents as an extracted one produces no output
+    extractor_version = None
+    # Schema used when saving as parquet, `{column name: pyarrow type}` or a pyarrow.Schema.
+    # If not set, it is inferred from the first rows saved
+    schema_fields = None
+
     def __init__(self, scraper, task, download_manifest, **kwargs):
         """Base Extract class to inherent from
 
@@ -29,6 +45,10 @@ class Extract(ABC):
         self.time_extracted = datetime.datetime.utcnow().isoformat() + 'Z'
         self.date_extracted = str(datetime.datetime.utcnow().date())
 
+        # The last source that was parsed & its parsed document, shared by the extract tasks
+        self._parsed_source = None
+        load_selector_stats(self.scraper)
+
         self.pre_extract()
 
     def pre_extract(self):
@@ -51,22 +71,32 @@ class Extract(ABC):
                            'time_started': self.time_extracted,
                            })
 
-        for source_idx, source_file in enumerate(self._get_sources()):
-            if source_file.startswith('s3://'):
-                transport_params = _get_s3_params(self.scraper, context_type='extractor')
-            else:
-                transport_params = {}
-            raw_source = read_file_contents(source_file, transport_params=transport_params)
+        ledger = get_processed_ledger(self.scraper)
+        extractor_version = f'{self.__class__.__name__}:{self.extractor_version}'
+        for source_idx, source in enumerate(self.download_manifest['source_files']):
+            source_file = source['file']
+            source_hash = source.get('content_hash') if ledger is not None else None
+            if source_hash is not None and ledger.is_processed(source_hash, extractor_version):
+                logger.debug("Source already extracted",
+                             extra={'task': self.task,
+                                    'source_file': source_file,
+                                    **self.scraper.log_extras()})
+                self.scraper.stats.incr('sources_skipped_processed')
+                continue
+
+            raw_source = self._read_source(source)
 
             try:
                 extraction_tasks = self._get_extraction_tasks(raw_source, source_idx)
-                if not extraction_tasks:
-                    continue
-
-                for extraction_task in extraction_tasks:
+                for extraction_task in extraction_tasks or []:
                     extraction_task(raw_source)
 
+                if source_hash is not None:
+                    ledger.add(source_hash, extractor_version)
+                self.scraper.stats.incr('sources_extracted')
+
             except Exception as e:
+                self.scraper.stats.incr('sources_extract_failed')
                 logger.exception(f"Extraction Failed: {e}",
                                  extra={'task': self.task,
                                         'source_file': source_file,
@@ -74,6 +104,10 @@ class Extract(ABC):
                                         **get_root_exc_log_overides(),
                                         })
 
+            finally:
+                # Do not hold on to the parsed document once the source is done
+                self._parsed_source = None
+
         logger.debug('Extract finished',
                      extra={'task': self.task,
                             **self.scraper.log_extras(),
@@ -82,7 +116,8 @@ class Extract(ABC):
 
     def extract_task(self, callback, name='', callback_kwargs={}, selectors=(),
                      raw_source=None, idx_offset=0, qa={}, post_extract=None,
-                     post_extract_kwargs={}):
+                     post_extract_kwargs={}, stream=False, stream_batch_size=None,
+                     qa_policy=None, parser=None, item_tag=None, item_attrs=None):
         """Create an extraction task to run on the source file
 
         Args:
@@ -102,6 +137,21 @@ class Extract(ABC):
                 callback. Defaults to None.
             post_extract_kwargs (dict, optional): Keyword arguments to pass into the post_extract
                 function. Defaults to {}.
+            stream (bool, optional): Pass a generator of the outputs into `post_extract` so items
+                are extracted as `post_extract` consumes them, instead of all at once.
+                Defaults to False.
+            stream_batch_size (int, optional): Call `post_extract` with a list of at most this
+                many outputs at a time, instead of once with all of them. Defaults to None.
+            qa_policy (str, optional): What to do with rows that fail the `qa`, `fail`, `drop`
+                or `default`. If None, the config `extractor.qa_policy` is used.
+                Defaults to None.
+            parser (str, optional): Parser used for the html, `parsel`, `lxml` or
+                `selectolax`. If None, the config `extractor.parser` is used. Defaults to None.
+            item_tag (str, optional): Tag name of the items to pass into the callback. The items
+                are found while the source is parsed and freed after the callback, so the whole
+                document tree is never built. Used instead of `selectors`. Defaults to None.
+            item_attrs (dict, optional): Attributes the `item_tag` elements must have.
+                Defaults to None.
 
         Returns:
             function: Function to pass the raw_source into for it to be processed
@@ -114,10 +164,17 @@ class Extract(ABC):
             else:
                 extract_source = inputs['raw_source']
 
-            if not isinstance(extract_source, (list, tuple)):
+            if inputs['item_tag']:
+                # Parsed a piece at a time as the items are extracted
+                self.scraper.stats.incr('sources_parsed_incrementally')
+                source_items = iter_elements(extract_source, inputs['item_tag'],
+                                             attrs=inputs['item_attrs'],
+                                             parser=inputs['parser'])
+
+            elif not isinstance(extract_source, (list, tuple)):
                 if inputs['selectors']:
                     # It is html, so parse it out
-                    parsel_source = Selector(text=extract_source)
+                    parsel_source = self._parse_source(extract_source, inputs['parser'])
                     source_items = self.find_css_elements(parsel_source,
                                                           inputs['selectors'])
                     if source_items is None:
@@ -125,7 +182,7 @@ class Extract(ABC):
 
                 elif inputs['selectors'] == [] and inputs['raw_source'] is None:
                     # Want to parse the entire html source as one
-                    source_items = [Selector(text=extract_source)]
+                    source_items = [self._parse_source(extract_source, inputs['parser'])]
 
                 else:
                     # Not sure what to do with the content so send it all
@@ -135,7 +192,44 @@ class Extract(ABC):
                 # source is already a list
                 source_items = extract_source
 
-            output = []
+            results = self._iter_results(inputs, source_items)
+            try:
+                if inputs['stream_batch_size']:
+                    while True:
+                        batch = list(itertools.islice(results, inputs['stream_batch_size']))
+                        if not batch:
+                            break
+                        self._post_extract(inputs, batch)
+                        self.scraper.stats.incr('extract_batches')
+
+                elif inputs['stream']:
+                    errors = []
+                    self._post_extract(inputs, self._catch_errors(results, errors))
+                    if errors:
+                        # Raised the same as if it was not streamed, once post_extract is done
+                        raise errors[0]
+
+                else:
+                    self._post_extract(inputs, list(results))
+            finally:
+                # If post_extract stopped reading the stream early, the qa summary & stats
+                # are still added now instead of whenever the generator is garbage collected
+                results.close()
+
+        return _run_extract_task
+
+    def _iter_results(self, inputs, source_items):
+        """Run the callback on each item and QA the outputs
+
+        Args:
+            inputs (dict): Arguments from `self.extract_task`
+            source_items (list): Items to pass into the callback, can be an iterator
+
+        Yields:
+            dict: Each output of the callback
+        """
+        qa_validator = inputs['qa_validator']
+        try:
             # Used when you want to start at a different number
             for idx, item in enumerate(source_items, start=inputs['idx_offset']):
                 result = inputs['callback'](item, idx, **inputs['callback_kwargs'])
@@ -146,19 +240,58 @@ class Extract(ABC):
                 if not isinstance(result, (list, tuple)):
                     result = [result]
 
-                # QA Result
-                for result_item in result:
-                    self._qa_result(idx, inputs['qa'], result_item)
-                    output.append(result_item)
+                if qa_validator:
+                    result = qa_validator.validate(result, idx)
+                yield from result
 
-            try:
-                inputs['post_extract'](output, **inputs['post_extract_kwargs'])
-            except Exception:
-                logger.exception("Post extract Failed",
-                                 extra={'task': self.task,
-                                        **self.scraper.log_extras()})
+        finally:
+            if qa_validator.violations:
+                logger.warning("QA violations",
+                               extra={'task': self.task,
+                                      **self.scraper.log_extras(),
+                                      'name': inputs['name'],
+                                      'qa': qa_validator.summary()})
+            qa_validator.add_to_stats(self.scraper.stats, name=inputs['name'])
+
+    @staticmethod
+    def _catch_errors(results, errors):
+        # Stop the stream on an error instead of raising it inside the users post_extract
+        try:
+            yield from results
+        except Exception as e:
+            errors.append(e)
+
+    def _post_extract(self, inputs, output):
+        try:
+            inputs['post_extract'](output, **inputs['post_extract_kwargs'])
+        except Exception:
+            logger.exception("Post extract Failed",
+                             extra={'task': self.task,
+                                    **self.scraper.log_extras()})
+
+    def _parse_source(self, source, parser='parsel'):
+        """Parse the html source, reusing the parsed document if this source was just parsed
+
+        Every extract task of a source is passed the same source, so it is only parsed once
+        for each parser used.
 
-        return _run_extract_task
+        Args:
+            source (str): Html to parse
+            parser (str, optional): `parsel`, `lxml` or `selectolax`. Defaults to 'parsel'.
+
+        Returns:
+            parsel.Selector: The parsed document, see `scraperx.documents.parse_document`
+        """
+        if (self._parsed_source is not None and self._parsed_source[0] is source
+                and self._parsed_source[1] == parser):
+            self.scraper.stats.incr('parse_cache_hits')
+            return self._parsed_source[2]
+
+        self.scraper.stats.incr('sources_parsed')
+        parsed_source = parse_document(source, parser=parser)
+        # Keep the source so its id can not be reused by another string while cached
+        self._parsed_source = (source, parser, parsed_source)
+        return parsed_source
 
     def _format_extract_task(self, inputs):
         """Validate and foramt each argument passed into `self.extract_task`
@@ -176,6 +309,13 @@ class Extract(ABC):
             ValueError: `qa` must be dict
             ValueError: `post_extract` has to be a function
             ValueError: `post_extract_kwargs` must be dict
+            ValueError: `stream_batch_size` must be a positive integer
+            ValueError: `stream_batch_size` can not be used with `save_as` in a file per task
+            ValueError: `stream` can not be used with `save_as` in the json format
+            ValueError: `qa_policy` is not supported
+            ValueError: `parser` is not supported
+            ValueError: `item_tag` must be a string
+            ValueError: `item_attrs` must be dict
 
         Returns:
             dict: The validated inputs
@@ -243,6 +383,39 @@ class Extract(ABC):
         elif not isinstance(inputs['qa'], dict):
             raise ValueError("Extraction Task: qa must be dict")
 
+        if inputs.get('qa_policy') is None:
+            inputs['qa_policy'] = self.scraper.config['EXTRACTOR_QA_POLICY']
+
+        elif inputs['qa_policy'] not in QA_POLICIES:
+            raise ValueError(f"Extraction Task: qa_policy must be one of {QA_POLICIES}")
+
+        # Compiled once, then used on every row of the task
+        inputs['qa_validator'] = QAValidator(inputs['qa'], policy=inputs['qa_policy'],
+                                             log_extras={'task': self.task,
+                                                         **self.scraper.log_extras(),
+                                                         'name': inputs['name']})
+
+        ###
+        # Parser
+        ###
+        if inputs.get('parser') is None:
+            inputs['parser'] = self.scraper.config['EXTRACTOR_PARSER']
+
+        elif inputs['parser'] not in PARSERS:
+            raise ValueError(f"Extraction Task: parser must be one of {PARSERS}")
+
+        ###
+        # Item path
+        ###
+        if not isinstance(inputs.get('item_tag'), (str, type(None))):
+            raise ValueError("Extraction Task: item_tag must be a string")
+
+        if inputs.get('item_attrs') is None:
+            inputs['item_attrs'] = {}
+
+        elif not isinstance(inputs['item_attrs'], dict):
+            raise ValueError("Extraction Task: item_attrs must be dict")
+
         ###
         # Post Extract
         ###
@@ -261,6 +434,39 @@ class Extract(ABC):
         elif not isinstance(inputs['post_extract_kwargs'], dict):
             raise ValueError("Extraction Task: post_extract_kwargs must be dict")
 
+        if inputs['post_extract'] == self.save_as:
+            # Let `save_as` know which task the data is from, if it takes the arguments.
+            # It may be overridden with the older signature
+            save_as_kwargs = {'name': inputs['name']}
+            if not self.schema_fields and inputs['qa']:
+                save_as_kwargs['columns'] = list(inputs['qa'])
+            save_as_params = inspect.signature(self.save_as).parameters
+            if not any(param.kind == param.VAR_KEYWORD for param in save_as_params.values()):
+                save_as_kwargs = {key: value for key, value in save_as_kwargs.items()
+                                  if key in save_as_params}
+            inputs['post_extract_kwargs'] = {**save_as_kwargs, **inputs['post_extract_kwargs']}
+
+        ###
+        # Stream
+        ###
+        inputs['stream'] = bool(inputs.get('stream'))
+        if inputs.get('stream_batch_size') is not None:
+            if (not isinstance(inputs['stream_batch_size'], int)
+                    or inputs['stream_batch_size'] < 1):
+                raise ValueError("Extraction Task: stream_batch_size must be a positive integer")
+
+        if (inputs['post_extract'] == self.save_as
+                and self.scraper.config['EXTRACTOR_OUTPUT_MODE'] != 'aggregate'):
+            # Each call of `save_as` writes the whole file for the task
+            if inputs.get('stream_batch_size') is not None:
+                raise ValueError("Extraction Task: stream_batch_size can not be used with save_as"
+                                 " unless the output mode is aggregate, each batch would"
+                                 " replace the last file")
+            file_format = inputs['post_extract_kwargs'].get('file_format', 'json')
+            if inputs['stream'] and file_format == 'json':
+                raise ValueError("Extraction Task: stream can not be used with save_as in the"
+                                 " json format, use json_lines, csv or parquet")
+
         return inputs
 
     def _get_extraction_tasks(self, raw_source, source_idx):
@@ -282,101 +488,117 @@ class Extract(ABC):
 
         return extraction_tasks
 
-    def save_as(self, data, file_format='json', template_values={}):
+    def save_as(self, data, file_format='json', template_values={}, columns=None, name=None):
         """Save the extracted data to a file
 
         Args:
-            data (list): List of dicts to be saved
+            data (list): List of dicts to be saved.
+                Can be an iterator when using `json_lines`, `csv` or `parquet`
             file_format (str, optional): File type to save data to.
-                Current options are `json` & `json_lines`. Defaults to 'json'.
+                Current options are `json`, `json_lines`, `csv` & `parquet`. Defaults to 'json'.
             template_values (dict, optional): Key/values used when createing the file name from
                 the `file_template` from the config yaml. Defaults to {}.
+            columns (list, optional): Order of the columns when using `csv`. If None, the
+                `schema_fields` of the class are used. Defaults to None.
+            name (str, optional): Name of the extract task the data is from, used by the
+                `aggregate` output mode. Defaults to None.
+
+        When `save_as` is the `post_extract` of an extract task, `name` is the tasks name and
+        `columns` are its qa fields, unless set in `post_extract_kwargs`.
+
+        If the config `extractor.output_mode` is `aggregate`, the data is added to the json
+        lines files shared by all tasks in the run and `file_format` is not used.
         """
+        output_sink = get_output_sink(self.scraper)
+        if output_sink is not None:
+            if file_format not in ('json', 'json_lines'):
+                logger.warning(f"Format `{file_format}` is not used in the aggregate output mode,"
+                               " the data is saved as json lines",
+                               extra={'task': self.task,
+                                      **self.scraper.log_extras()})
+            # Added to the runs shared files instead of a file per task
+            output_sink.append(self, data,
+                               name=name or '',
+                               template_values=template_values)
+            return
+
         write_data = Write(self.scraper, data)
+        save_kwargs = {}
+        codec, level = get_compression(self.scraper, 'extractor')
+        if file_format == 'parquet':
+            # Parquet compresses the column data itself, the file is not compressed again
+            save_kwargs['compression'] = 'none'
+
         save_as_map = {
             'json': write_data.write_json,
             'json_lines': write_data.write_json_lines,
+            'csv': lambda: write_data.write_csv(columns=columns or self._get_csv_columns()),
+            'parquet': lambda: write_data.write_parquet(schema=self.schema_fields,
+                                                        compression=codec,
+                                                        compression_level=level),
         }
         if file_format not in save_as_map:
             logger.critical(f"Format `{file_format}` is not supported",
                             extra={'task': self.task,
                                    **self.scraper.log_extras()})
         else:
-            save_as_map[file_format]().save(self, template_values=template_values)
-
-    def _qa_result(self, idx, qa_rules, result):
-        """QA the data as it gets extracted
+            save_as_map[file_format]().save(self, template_values=template_values,
+                                            **save_kwargs)
 
-        Args:
-            idx (int): index of the item being extracted
-            qa_rules (dict): QA Rules set in the scrapers self.extract_task
-            result (dict): Single row of data that was extracted
+    def _get_csv_columns(self):
+        """Default order of the csv columns, the `schema_fields`
 
-        Raises:
-            QAValueError: Filed is missing in result
-            QAValueError: Field is required to have a value
-            QAValueError: Type of result field does not match
-            QAValueError: Result field is to long
-            QAValueError: Result field is to short
+        Returns:
+            list|None: The columns or None if the order is not known
         """
-        if not qa_rules:
-            return
-
-        for qa_field, qa_rule in qa_rules.items():
-            # Make sure key exists
-            if qa_field not in result:
-                if 'default' in qa_rule:
-                    result[qa_field] = qa_rule['default']
-                    # No need to check other params since this was user set
-                    continue
-                else:
-                    raise QAValueError((f"Field {qa_field} is missing from data"
-                                        f" at result {idx}"))
-            # Check required
-            if result[qa_field] is None:
-                if qa_rule.get('required', False) is True:
-                    raise QAValueError((f"Field {qa_field} is required"
-                                        f" at result {idx}"))
-                else:
-                    # It is None and is allowed to be, so move on
-                    continue
-
-            # value_type_name also used in length check except
-            value_type_name = type(result[qa_field]).__name__
-
-            # Check Type
-            if (qa_rule.get('type')
-               and not isinstance(result[qa_field], qa_rule['type'])):
-                err_msg = (f"Type of {qa_field} is {value_type_name}."
-                           f" Expected to be of type {qa_rule['type'].__name__}"
-                           f" at result {idx}")
-                raise QAValueError(err_msg)
-
-            # Check length
+        if self.schema_fields:
             try:
-                if qa_rule.get('max_length') is not None:
-                    if len(result[qa_field]) > qa_rule['max_length']:
-                        raise QAValueError((f"Field {qa_field} is longer then"
-                                            f" {qa_rule['max_length']}"
-                                            f" at result {idx}"))
-                if qa_rule.get('min_length') is not None:
-                    if len(result[qa_field]) < qa_rule['min_length']:
-                        raise QAValueError((f"Field {qa_field} is shorter then"
-                                            f" {qa_rule['min_length']}"
-                                            f" at result {idx}"))
-
-            except TypeError:
-                # This type of value does not support length
-                logger.warning((f"The field {qa_field} of type"
-                                f" {value_type_name} does not support"
-                                " the length check"),
-                               extra={'task': self.task,
-                                      **self.scraper.log_extras()})
+                return list(self.schema_fields.names)
+            except AttributeError:
+                # Is a dict not a pyarrow.Schema
+                return list(self.schema_fields)
+        return None
 
     def _validate_qa_rules(self, qa_rules):
         # TODO: Validate for each extraction_task in run()
         pass
 
+    def _read_source(self, source):
+        """Read in the content of a source from the download_manifest
+
+        Args:
+            source (dict): Source from the download_manifest's `source_files`
+
+        Returns:
+            str: Content of the source file
+        """
+        if 'content' in source:
+            # Handed over by the downloader in this process, no need to read the file back
+            self.scraper.stats.incr('sources_read_from_memory')
+            content = source['content']
+            if isinstance(content, bytes):
+                content = content.decode(get_encoding(content))
+            return content
+
+        source_file = source['file']
+        if source_file.startswith('s3://'):
+            transport_params = _get_s3_params(self.scraper, context_type='extractor')
+        else:
+            transport_params = {}
+
+        if 'archive' in source:
+            raw_bytes = read_archive_record(source_file,
+                                            source['archive']['offset'],
+                                            source['archive']['length'],
+                                            transport_params=transport_params,
+                                            local_file=source['archive'].get('local_file'))
+            return raw_bytes.decode(get_encoding(raw_bytes))
+
+        # If the source is still being uploaded in the background
+        wait_for_upload(self.scraper, source_file)
+        return read_file_contents(source_file, transport_params=transport_params,
+                                  compression=source.get('compression'))
+
     def _get_sources(self):
         """Gets a list of source filed from the download_manifest
 
@@ -397,6 +619,10 @@ class Extract(ABC):
         Given a list of css selectors, this will loop through the selectors and
         the first one to return results will return the selected elements.
 
+        Each selector is only run once, and is counted in `scraper.selector_stats`.
+        If the config `extractor.adaptive_selectors` is set, the selector that has found
+        elements most often in this list is tried first.
+
         Args:
             source (Parsel object): A Parsel html element
             css_selectors (list): List of css selectors to try to find an element
@@ -404,11 +630,17 @@ class Extract(ABC):
         Returns:
             list: Parsel elements if any are found, else an empty list
         """
-        for selector in css_selectors:
-            results = source.css(selector)
+        selector_stats = self.scraper.selector_stats
+        ordered_selectors = css_selectors
+        if self.scraper.config['EXTRACTOR_ADAPTIVE_SELECTORS']:
+            ordered_selectors = selector_stats.order(css_selectors)
+
+        for selector in ordered_selectors:
+            results = select_css(source, selector)
+            selector_stats.record(selector, matched=len(results) > 0)
             if len(results) > 0:
-                # Found results, save selector
-                return source.css(selector)
+                selector_stats.record_group(css_selectors, selector)
+                return results
         return []
 
     @abstractmethod
@@ -0,0 +1,362 @@
+import atexit
+import logging
+import threading
+import multiprocessing
+import multiprocessing.util
+import concurrent.futures
+
+from .stats import RunStats
+from .trigger import run_task
+from .workers import BoundedExecutor
+from .uploads import flush_uploads, wait_for_upload
+from .sinks import close_output_sinks
+from .selectors import SelectorStats, load_selector_stats
+from .serializers import get_serializer
+from .archive import iter_archive_records, get_local_segment
+from .content_store import get_processed_ledger
+
+logger = logging.getLogger(__name__)
+
+# Scraper & the selector stats it started with, set in each worker process by `_init_worker`
+_worker_scraper = None
+_worker_base_groups = {}
+
+# Extract queues used in this process, keyed by (scraper, pool, max_workers, max_queue)
+_extract_queues = {}
+_extract_queues_lock = threading.Lock()
+
+
+def _get_mp_context():
+    """Context to start the worker processes with
+
+    Forking while the download & upload threads are running can leave a lock held in the
+    child, so the workers are started fresh instead. The users scraper needs to be
+    importable, with the script guarded by `if __name__ == '__main__':`.
+
+    Returns:
+        multiprocessing.context.BaseContext: `forkserver` if supported, otherwise `spawn`
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def load_metadata(metadata_file, serializer):
+    """Load the metadata from a metadata file or every metadata record in an archive segment
+
+    Args:
+        metadata_file (str): `_metadata.json` file or `.sxa` archive segment
+        serializer (scraperx.serializers.JSONSerializer): Used to load the json
+
+    Yields:
+        dict: Metadata of a download
+    """
+    if metadata_file.endswith('.sxa'):
+        for record in iter_archive_records(metadata_file, record_type='metadata'):
+            yield serializer.loads(record['payload'])
+    else:
+        with open(metadata_file, 'rb') as f:
+            yield serializer.loads(f.read())
+
+
+def extract_metadata_file(scraper, metadata_file):
+    """Run the extractor on every download in a metadata file
+
+    Failures are logged and counted in `scraper.stats` so one bad file does not stop the run.
+
+    Args:
+        scraper (obj): The users Scraper instance
+        metadata_file (str): `_metadata.json` file or `.sxa` archive segment
+    """
+    try:
+        for metadata in load_metadata(metadata_file, get_serializer(scraper)):
+            extractor = scraper.extract(metadata['task'],
+                                        metadata['download_manifest'])
+            extractor.run()
+    except Exception:
+        logger.exception(f"Failed to extract metadata file {metadata_file}",
+                         extra={**scraper.log_extras(),
+                                'metadata_file': metadata_file})
+        scraper.stats.incr('metadata_files_failed')
+    else:
+        scraper.stats.incr('metadata_files_extracted')
+
+
+def run_extract_pool(scraper, metadata_files, workers, chunk_size=10):
+    """Extract the metadata files using a pool of processes
+
+    The files are sent to the workers in chunks, at most two chunks per worker are waiting
+    at a time. Each worker saves its output the same way a single process would. The
+    stats, selector stats & processed ledger of every chunk are merged into the scraper's.
+
+    Args:
+        scraper (obj): The users Scraper instance
+        metadata_files (list): `_metadata.json` files or `.sxa` archive segments
+        workers (int): Number of processes
+        chunk_size (int, optional): Number of files sent to a worker at a time.
+            Defaults to 10.
+    """
+    # Load the adaptive selector order once, so every worker starts with the same one
+    load_selector_stats(scraper)
+    chunks = [metadata_files[i:i + chunk_size]
+              for i in range(0, len(metadata_files), chunk_size)]
+    num_done = 0
+
+    def _merge(future):
+        nonlocal num_done
+        try:
+            result = future.result()
+        except Exception:
+            # The worker process died, nothing in the chunk is known to be done
+            logger.exception("Extract worker failed",
+                             extra=scraper.log_extras())
+            scraper.stats.incr('extract_chunks_failed')
+            return
+
+        _merge_worker_result(scraper, result)
+        num_done += result['num_files']
+        logger.info(f"Extracted {num_done}/{len(metadata_files)} metadata files",
+                    extra=scraper.log_extras())
+
+    executor = BoundedExecutor(workers,
+                               max_queue=workers * 2,
+                               executor_cls=concurrent.futures.ProcessPoolExecutor,
+                               mp_context=_get_mp_context(),
+                               initializer=_init_worker,
+                               initargs=(scraper,))
+    try:
+        for chunk in chunks:
+            # Results are merged in the parent, as futures finish
+            executor.submit(_extract_chunk, chunk).add_done_callback(_merge)
+        executor.join()
+    finally:
+        executor.shutdown()
+
+
+def get_extract_queue(scraper):
+    """Get the queue that downloads hand their manifest to, based on the config
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Returns:
+        ExtractQueue|None: The queue to use, or None if the download runs the extractor itself
+    """
+    max_workers = scraper.config['EXTRACTOR_WORKERS']
+    if not max_workers or scraper.config['DISPATCH_SERVICE_NAME'] != 'local':
+        return None
+
+    pool = scraper.config['EXTRACTOR_POOL']
+    max_queue = scraper.config['EXTRACTOR_QUEUE_SIZE']
+    if max_queue is None:
+        max_queue = max_workers * 2
+
+    # Each queue extracts with its scraper's Extract class & config
+    key = (scraper, pool, max_workers, max_queue)
+    with _extract_queues_lock:
+        if key not in _extract_queues:
+            extract_queue = ExtractQueue(scraper, max_workers=max_workers,
+                                         max_queue=max_queue, pool=pool)
+            # Do not exit before everything has been extracted
+            atexit.register(extract_queue.close)
+            _extract_queues[key] = extract_queue
+        return _extract_queues[key]
+
+
+def close_extract_queues():
+    """Wait for everything queued to be extracted and stop the workers"""
+    with _extract_queues_lock:
+        extract_queues = list(_extract_queues.values())
+        _extract_queues.clear()
+    for extract_queue in extract_queues:
+        extract_queue.close()
+
+
+class ExtractQueue:
+
+    def __init__(self, scraper, max_workers, max_queue=0, pool='thread'):
+        """Extract downloads in their own pool of workers
+
+        Downloads submit their manifest and move on to the next task, only waiting when
+        `max_queue` downloads are already waiting to be extracted. With a process pool, the
+        stats, selector stats & processed ledger of each extract are merged back into the
+        scraper's.
+
+        Args:
+            scraper (obj): The users Scraper instance
+            max_workers (int): Number of extracts that can run at the same time
+            max_queue (int, optional): Number of downloads that can be waiting before
+                submitting another one blocks. Defaults to 0.
+            pool (str, optional): `thread` or `process`. Defaults to 'thread'.
+        """
+        self.scraper = scraper
+        self.pool = pool
+        if pool == 'process':
+            # Load the adaptive selector order once, so every worker starts with the same one
+            load_selector_stats(scraper)
+            executor_kwargs = {'executor_cls': concurrent.futures.ProcessPoolExecutor,
+                               'mp_context': _get_mp_context(),
+                               'initializer': _init_queue_worker,
+                               'initargs': (scraper,),
+                               }
+        else:
+            executor_kwargs = {'thread_name_prefix': 'scraperx_extract'}
+        self._executor = BoundedExecutor(max_workers, max_queue=max_queue, **executor_kwargs)
+        self._closed = False
+
+    def submit(self, task, download_manifest, triggered_kwargs={}):
+        """Extract a download in the background, blocks if the queue is full
+
+        Args:
+            task (dict): Task that was downloaded
+            download_manifest (dict): Manifest of the download
+            triggered_kwargs (dict, optional): Keyword arguments the download was triggered
+                with. Defaults to {}.
+        """
+        self.scraper.stats.incr('extracts_queued')
+        if self.pool == 'process':
+            download_manifest = _get_worker_manifest(self.scraper, download_manifest)
+            future = self._executor.submit(_extract_task, task, download_manifest,
+                                           triggered_kwargs)
+            future.add_done_callback(lambda f: self._merge(task, f))
+        else:
+            self._executor.submit(run_task, self.scraper, task,
+                                  task_cls=self.scraper.extract,
+                                  download_manifest=download_manifest,
+                                  **triggered_kwargs,
+                                  triggered_kwargs=triggered_kwargs)
+
+    def _merge(self, task, future):
+        try:
+            result = future.result()
+        except Exception:
+            logger.exception("Extract worker failed",
+                             extra={'task': task, **self.scraper.log_extras()})
+            self.scraper.stats.incr('extracts_failed')
+            return
+
+        _merge_worker_result(self.scraper, result)
+
+    def join(self):
+        """Block until everything that has been queued is extracted"""
+        self._executor.join()
+
+    def close(self):
+        """Wait for everything that has been queued then stop the workers"""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.join()
+        self._executor.shutdown()
+
+
+def _get_worker_manifest(scraper, download_manifest):
+    """Manifest a worker process can read the sources with
+
+    Background uploads & open archive segments are only known about in this process. So
+    wait for the uploads, and pass along the local copy of any archive segment still open.
+
+    Args:
+        scraper (obj): The users Scraper instance
+        download_manifest (dict): Manifest of the download
+
+    Returns:
+        dict: The manifest to send to the worker
+    """
+    source_files = []
+    for source in download_manifest['source_files']:
+        if 'archive' in source:
+            local_file = get_local_segment(source['file'])
+            if local_file is not None:
+                source = {**source, 'archive': {**source['archive'], 'local_file': local_file}}
+        elif 'content' not in source:
+            wait_for_upload(scraper, source['file'])
+        source_files.append(source)
+    return {**download_manifest, 'source_files': source_files}
+
+
+def _merge_worker_result(scraper, result):
+    scraper.stats.merge(result['stats'])
+    scraper.selector_stats.merge(result['selector_counts'])
+    scraper.selector_stats.merge_groups(result['selector_groups'])
+    ledger = get_processed_ledger(scraper)
+    if ledger is not None:
+        ledger.merge(result['ledger_entries'])
+
+
+def _init_worker(scraper):
+    global _worker_scraper, _worker_base_groups
+    _worker_scraper = scraper
+    _worker_base_groups = scraper.selector_stats.group_snapshot()
+
+
+def _init_queue_worker(scraper):
+    _init_worker(scraper)
+    # Aggregated output stays open between extracts, atexit does not run in the worker
+    # processes but multiprocessing's finalizers do
+    multiprocessing.util.Finalize(None, _finish_worker, exitpriority=10)
+
+
+def _finish_worker():
+    close_output_sinks()
+    flush_uploads(_worker_scraper)
+
+
+def _start_worker_run():
+    """Reset the worker scraper's stats so only what the next run does is sent back
+
+    Returns:
+        dict: Ledger entries from before the run
+    """
+    scraper = _worker_scraper
+    scraper.stats = RunStats()
+    # The fallback selector counts from the parent are kept so the order is the same
+    selector_stats = SelectorStats()
+    selector_stats.file = scraper.selector_stats.file
+    selector_stats.merge_groups(_worker_base_groups)
+    scraper.selector_stats = selector_stats
+
+    ledger = get_processed_ledger(scraper)
+    return ledger.snapshot() if ledger is not None else {}
+
+
+def _worker_result(ledger_before):
+    scraper = _worker_scraper
+    selector_groups = {}
+    for group_key, wins in scraper.selector_stats.group_snapshot().items():
+        base_wins = _worker_base_groups.get(group_key, {})
+        selector_groups[group_key] = {css_selector: count - base_wins.get(css_selector, 0)
+                                      for css_selector, count in wins.items()}
+
+    ledger = get_processed_ledger(scraper)
+    ledger_entries = {}
+    if ledger is not None:
+        ledger_entries = {key: value for key, value in ledger.snapshot().items()
+                          if key not in ledger_before}
+
+    return {'stats': scraper.stats.snapshot(),
+            'selector_counts': scraper.selector_stats.snapshot(),
+            'selector_groups': selector_groups,
+            'ledger_entries': ledger_entries,
+            }
+
+
+def _extract_chunk(metadata_files):
+    ledger_before = _start_worker_run()
+    for metadata_file in metadata_files:
+        extract_metadata_file(_worker_scraper, metadata_file)
+
+    # The worker process may not get to run atexit, so finish all output now
+    close_output_sinks()
+    flush_uploads(_worker_scraper)
+    return {**_worker_result(ledger_before), 'num_files': len(metadata_files)}
+
+
+def _extract_task(task, download_manifest, triggered_kwargs):
+    ledger_before = _start_worker_run()
+    run_task(_worker_scraper, task,
+             task_cls=_worker_scraper.extract,
+             download_manifest=download_manifest,
+             **triggered_kwargs,
+             triggered_kwargs=triggered_kwargs)
+    return _worker_result(ledger_before)
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import pathlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Status codes that will not get better by trying again tomorrow
+TERMINAL_STATUS_CODES = (404, 410)
+
+# Negative caches that are open in this process, keyed by file
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_negative_cache(scraper):
+    """Get the negative cache for the scraper based on the config
+
+    The cache is a local file, so it is only used when the dispatch service is local.
+    Otherwise the failures would be saved wherever the downloads run.
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Returns:
+        NegativeCache|None: The cache to use, or None if it is not turned on
+    """
+    cache_file = scraper.config['DISPATCH_NEGATIVE_CACHE_FILE']
+    if not cache_file or scraper.config['DISPATCH_SERVICE_NAME'] != 'local':
+        return None
+
+    with _caches_lock:
+        if cache_file not in _caches:
+            _caches[cache_file] = NegativeCache(
+                cache_file,
+                ttl=scraper.config['DISPATCH_NEGATIVE_CACHE_TTL'],
+            )
+            # Make sure failures are not lost if the run does not finish cleanly
+            atexit.register(_caches[cache_file].save)
+        return _caches[cache_file]
+
+
+def task_fingerprint(task):
+    """Create a key that is the same for the same task across runs
+
+    Args:
+        task (dict): The task
+
+    Returns:
+        str: Hash of the task
+    """
+    task_str = json.dumps(task, sort_keys=True, default=str)
+    return hashlib.sha1(task_str.encode('utf-8')).hexdigest()
+
+
+class NegativeCache:
+
+    def __init__(self, cache_file, ttl=24):
+        """Remember tasks that failed in a way that retrying will not fix
+
+        Args:
+            cache_file (str): Local json file the cache is saved to
+            ttl (float, optional): Hours a failure is remembered for. Defaults to 24.
+        """
+        self.file = cache_file
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            with open(self.file, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+
+        # No need to keep anything that has already expired
+        now = time.time()
+        self._entries = {k: v for k, v in self._entries.items() if v['expires'] > now}
+
+    def get(self, task):
+        """Get the failure of a task if it is in the cache and has not expired
+
+        Args:
+            task (dict): The task to check
+
+        Returns:
+            dict|None: Info about the last failure or None if it is not in the cache
+        """
+        with self._lock:
+            entry = self._entries.get(task_fingerprint(task))
+
+        if entry is None or entry['expires'] <= time.time():
+            return None
+        return entry
+
+    def add(self, task, status_code):
+        """Add a failed task to the cache
+
+        Args:
+            task (dict): The task that failed
+            status_code (int): The status code the task failed with
+        """
+        now = time.time()
+        with self._lock:
+            self._entries[task_fingerprint(task)] = {
+                'url': task.get('url'),
+                'status_code': status_code,
+                'time_failed': now,
+                'expires': now + self.ttl * 60 * 60,
+            }
+
+    def remove(self, task):
+        """Remove a task from the cache, used when it is successful again
+
+        Args:
+            task (dict): The task to remove
+        """
+        with self._lock:
+            self._entries.pop(task_fingerprint(task), None)
+
+    def save(self):
+        """Save the cache to its file"""
+        with self._lock:
+            pathlib.Path(self.file).parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = f"{self.file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_file, self.file)
@@ -0,0 +1,174 @@
+import logging
+from collections import defaultdict
+
+from .exceptions import QAValueError
+
+logger = logging.getLogger(__name__)
+
+QA_POLICIES = ('fail', 'drop', 'default')
+
+
+class QAValidator:
+
+    def __init__(self, qa_rules, policy='fail', log_extras=None):
+        """QA rules of an extract task, compiled once so each row is checked quickly
+
+        Every violation is counted per field. What happens to a row with a violation
+        depends on the `policy`:
+            - `fail`: Raise a QAValueError, which fails the extract task
+            - `drop`: Leave the row out of the output
+            - `default`: Set the field to the rules `default`, rows with no default are dropped
+
+        Args:
+            qa_rules (dict): Extracted fields to qa and their rules
+            policy (str, optional): One of `fail`, `drop` or `default`. Defaults to 'fail'.
+            log_extras (dict, optional): Added to the log messages, like the task & the
+                scrapers `log_extras()`. Defaults to None.
+
+        Raises:
+            ValueError: The policy is not supported
+        """
+        if policy not in QA_POLICIES:
+            raise ValueError(f"QA policy must be one of {QA_POLICIES}, not {policy}")
+
+        self.policy = policy
+        self.log_extras = log_extras or {}
+        self.qa_rules = qa_rules or {}
+        self.violations = defaultdict(int)
+        self.rows_dropped = 0
+        self._no_length = set()
+        self._rules = tuple(
+            (qa_field,
+             'default' in qa_rule,
+             qa_rule.get('default'),
+             qa_rule.get('required', False) is True,
+             qa_rule.get('type') or None,
+             qa_rule.get('max_length'),
+             qa_rule.get('min_length'),
+             )
+            for qa_field, qa_rule in self.qa_rules.items()
+        )
+
+    def __bool__(self):
+        return bool(self._rules)
+
+    def validate(self, rows, idx=0):
+        """QA a batch of rows, fields that are missing & have a default are set to it
+
+        Args:
+            rows (list): Rows to check, they may be updated in place
+            idx (int, optional): Index of the item the rows are from, used in the errors.
+                Defaults to 0.
+
+        Raises:
+            QAValueError: A row failed the qa and the policy is `fail`
+
+        Returns:
+            list: The rows that passed, or were fixed
+        """
+        if not self._rules:
+            return rows
+
+        output = []
+        for row in rows:
+            if self._validate_row(row, idx):
+                output.append(row)
+            else:
+                self.rows_dropped += 1
+        return output
+
+    def _validate_row(self, row, idx):
+        valid = True
+        for (qa_field, has_default, default, required,
+             value_type, max_length, min_length) in self._rules:
+            # Make sure key exists
+            if qa_field not in row:
+                if has_default:
+                    # No need to check other params since this was user set
+                    row[qa_field] = default
+                    continue
+                error = 'missing'
+            else:
+                value = row[qa_field]
+                if value is None:
+                    if not required:
+                        # It is None and is allowed to be, so move on
+                        continue
+                    error = 'required'
+                elif value_type is not None and not isinstance(value, value_type):
+                    error = 'type'
+                elif max_length is None and min_length is None:
+                    continue
+                else:
+                    try:
+                        length = len(value)
+                    except TypeError:
+                        self._length_unsupported(qa_field, value)
+                        continue
+                    if max_length is not None and length > max_length:
+                        error = 'max_length'
+                    elif min_length is not None and length < min_length:
+                        error = 'min_length'
+                    else:
+                        continue
+
+            self.violations[(qa_field, error)] += 1
+            if self.policy == 'fail':
+                raise QAValueError(self._error_message(qa_field, error, row, idx))
+            elif self.policy == 'default' and has_default:
+                row[qa_field] = default
+            else:
+                valid = False
+        return valid
+
+    def _length_unsupported(self, qa_field, value):
+        # Only warn once per field, not on every row
+        if qa_field in self._no_length:
+            return
+        self._no_length.add(qa_field)
+        logger.warning((f"The field {qa_field} of type"
+                        f" {type(value).__name__} does not support"
+                        " the length check"),
+                       extra=self.log_extras)
+
+    def _error_message(self, qa_field, error, row, idx):
+        # Only built when raising, so the checks do not pay for the formatting
+        rule = self.qa_rules[qa_field]
+        if error == 'missing':
+            return f"Field {qa_field} is missing from data at result {idx}"
+        elif error == 'required':
+            return f"Field {qa_field} is required at result {idx}"
+        elif error == 'type':
+            return (f"Type of {qa_field} is {type(row[qa_field]).__name__}."
+                    f" Expected to be of type {rule['type'].__name__}"
+                    f" at result {idx}")
+        elif error == 'max_length':
+            return f"Field {qa_field} is longer then {rule['max_length']} at result {idx}"
+        return f"Field {qa_field} is shorter then {rule['min_length']} at result {idx}"
+
+    def summary(self):
+        """Counts of the violations found
+
+        Returns:
+            dict: `{field: {rule: count}}` of each violation, and the number of rows dropped
+        """
+        fields = defaultdict(dict)
+        for (qa_field, error), count in self.violations.items():
+            fields[qa_field][error] = count
+        return {'violations': dict(fields), 'rows_dropped': self.rows_dropped}
+
+    def add_to_stats(self, stats, name=''):
+        """Add the violation counts to the runs stats, then reset them
+
+        Args:
+            stats (scraperx.stats.RunStats): Stats of the run
+            name (str, optional): Name of the extract task. Defaults to ''.
+        """
+        counters = {f"qa_violations.{name or '-'}.{qa_field}.{error}": count
+                    for (qa_field, error), count in self.violations.items()}
+        if self.rows_dropped:
+            counters['qa_rows_dropped'] = self.rows_dropped
+        if counters:
+            stats.merge(counters)
+        self.violations.clear()
+        self.rows_dropped = 0
@@ -7,6 +7,13 @@ import pathlib
 
 from .write import Write
 from .utils import read_file_contents
+from .uploads import flush_uploads
+from .archive import close_archives, read_archive_record
+from .negative_cache import get_negative_cache
+from .sinks import close_output_sinks
+from .serializers import get_serializer
+from .content_store import get_processed_ledger
+from .extract_pool import extract_metadata_file, run_extract_pool, close_extract_queues
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +30,7 @@ def _create_test(cli_args, scraper):
         sys.exit(1)
 
     with pathlib.Path(metadata_file).open(mode='r') as f:
-        metadata = json.load(f)
+        metadata = get_serializer(scraper).loads(f.read())
 
     time_downloaded_cleaned = (metadata['download_manifest']['time_downloaded']
                                .replace('-', '').replace(':', ''))
@@ -36,12 +43,20 @@ def _create_test(cli_args, scraper):
     current_sources = metadata['download_manifest']['source_files'].copy()
     metadata_sources = []
     for idx, source in enumerate(current_sources):
-        new_file = pathlib.Path(f"{dst_base}_source_{idx}.{source['file'].split('.')[-1]}")
-        try:
-            shutil.copy(source['file'], new_file)
-        except shutil.SameFileError:
-            # Normally happens when trying to re-create a test qa file from the tests folder
-            pass
+        if 'archive' in source:
+            # Pull the source out of the archive segment into its own file
+            archive = source.pop('archive')
+            new_file = pathlib.Path(f"{dst_base}_source_{idx}.{archive['name'].split('.')[-1]}")
+            new_file.write_bytes(read_archive_record(source['file'],
+                                                     archive['offset'],
+                                                     archive['length']))
+        else:
+            new_file = pathlib.Path(f"{dst_base}_source_{idx}.{source['file'].split('.')[-1]}")
+            try:
+                shutil.copy(source['file'], new_file)
+            except shutil.SameFileError:
+                # Normally happens when trying to re-create a test qa file from the tests folder
+                pass
         source['file'] = new_file.as_posix()
         metadata_sources.append(source)
 
@@ -61,7 +76,10 @@ def _create_test(cli_args, scraper):
 
     def save_extracted(data, source_idx, name):
         data_name = f'{dst_base}_extracted_(qa)_{name}_{source_idx}.json'
-        Write(scraper, data).write_json().save(extractor, filename=data_name)
+        # QA files are always plain json so they are easy to edit
+        Write(scraper, data).write_json(pretty=True).save(extractor,
+                                                          filename=data_name,
+                                                          compression='none')
 
     def _tester_format_extract_task(inputs):
         inputs = extractor.original_format_extract_task(inputs)
@@ -73,7 +91,7 @@ def _create_test(cli_args, scraper):
     extractor._format_extract_task = _tester_format_extract_task
 
     for source_idx, source in enumerate(metadata_sources):
-        raw_source = read_file_contents(source['file'])
+        raw_source = read_file_contents(source['file'], compression=source.get('compression'))
 
         for e_task in extractor._get_extraction_tasks(raw_source, source_idx):
             e_task(raw_source)
@@ -93,7 +111,8 @@ def _run_dispatch(cli_args, scraper):
 
     def dump_tasks(tasks):
         # Dump all tasks to local json file
-        task_file = Write(scraper, tasks).write_json().save(None, filename='tasks.json')
+        task_file = Write(scraper, tasks).write_json(pretty=True)\
+            .save(None, filename='tasks.json')
         num_tasks = len(tasks)
         logger.info(f"Saved {num_tasks} tasks to {task_file}",
                     extra={'scraper_name': scraper.config['SCRAPER_NAME']})
@@ -115,6 +134,12 @@ def _run_dispatch(cli_args, scraper):
     if cli_args.dump_tasks and try_dump_after is True:
         dump_tasks(dispatcher.tasks)
 
+    if cli_args.dump_tasks and dispatcher.skipped_tasks:
+        skipped_file = Write(scraper, dispatcher.skipped_tasks).write_json(pretty=True)\
+            .save(None, filename='tasks_skipped.json')
+        logger.info(f"Saved {len(dispatcher.skipped_tasks)} skipped tasks to {skipped_file}",
+                    extra={'scraper_name': scraper.config['SCRAPER_NAME']})
+
 
 def _run_download(cli_args, scraper):
     """Kick off the downloader for the scraper
@@ -123,6 +148,20 @@ def _run_download(cli_args, scraper):
         downloader = scraper.download(task)
         downloader.run()
 
+    close_extract_queues()
+    close_archives()
+    close_output_sinks()
+    flush_uploads(scraper)
+
+    negative_cache = get_negative_cache(scraper)
+    if negative_cache is not None:
+        negative_cache.save()
+
+    logger.info("Download finished",
+                extra={**scraper.log_extras(),
+                       'stats': scraper.stats.snapshot(),
+                       'selector_stats': scraper.selector_stats.snapshot()})
+
 
 def _run_extract(cli_args, scraper):
     """Kick off the extractor for the scraper
@@ -131,22 +170,33 @@ def _run_extract(cli_args, scraper):
         metadata_files = []
         for root, dirs, files in os.walk(cli_args.source):
             for filename in files:
-                if filename.endswith('_metadata.json'):
+                if filename.endswith(('_metadata.json', '.sxa')):
                     metadata_files.append(os.path.join(root, filename))
     else:
-        if cli_args.source.endswith('_metadata.json'):
+        if cli_args.source.endswith(('_metadata.json', '.sxa')):
             metadata_files = [cli_args.source]
         else:
             metadata_files = [f"{cli_args.source}_metadata.json"]
 
-    for metadata_file in metadata_files:
-        metadata = {}
-        with open(metadata_file) as f:
-            metadata = json.load(f)
+    if cli_args.workers > 1 and len(metadata_files) > 1:
+        run_extract_pool(scraper, metadata_files, cli_args.workers,
+                         chunk_size=cli_args.chunk_size)
+    else:
+        for metadata_file in metadata_files:
+            extract_metadata_file(scraper, metadata_file)
+
+    close_output_sinks()
+    flush_uploads(scraper)
 
-        extractor = scraper.extract(metadata['task'],
-                                    metadata['download_manifest'])
-        extractor.run()
+    processed_ledger = get_processed_ledger(scraper)
+    if processed_ledger is not None:
+        processed_ledger.save()
+    scraper.selector_stats.save()
+
+    logger.info("Extract finished",
+                extra={**scraper.log_extras(),
+                       'stats': scraper.stats.snapshot(),
+                       'selector_stats': scraper.selector_stats.snapshot()})
 
 
 def run_cli(scraper):
@@ -184,3 +234,7 @@ def run_cli(scraper):
 
     elif cli_args.action == 'extract':
         _run_extract(cli_args, scraper)
+
+    elif cli_args.action == 'bench':
+        from .bench import _run_bench
+        _run_bench(cli_args)
@@ -1,19 +1,42 @@
+import io
+import os
 import pathlib
 import logging
+import threading
 from smart_open import open
 
+from .uploads import get_upload_queue
+from .compression import CODECS, compress, get_compression, open_compressed
 from .utils import _get_s3_params, get_context_type
 
 logger = logging.getLogger(__name__)
 
+# Paths saved with `skip_existing` in this process, so they do not need to be checked again
+_saved_targets = set()
+# Paths being saved with `skip_existing`, set once the write or upload is done
+_pending_targets = {}
+_saved_targets_lock = threading.Lock()
+
 
 class SaveTo:
 
-    def __init__(self, scraper, raw_data, content_type=None, encoding='utf-8'):
+    def __init__(self, scraper, raw_data, content_type=None, encoding='utf-8', binary=False):
+        """Save data to a local file or s3
+
+        Args:
+            scraper (obj): The users Scraper instance
+            raw_data (io.StringIO|io.BytesIO|bytes|function): Data to save. If a function,
+                it is called with the open text file to write the data into.
+            content_type (str, optional): Mimetype of the file. Defaults to None.
+            encoding (str, optional): Encoding of the file. Defaults to 'utf-8'.
+            binary (bool, optional): The `raw_data` function writes bytes instead of text.
+                Defaults to False.
+        """
         self.scraper = scraper
         self.raw_data = raw_data
         self.content_type = content_type
         self.encoding = encoding
+        self.binary = binary
 
     def _get_filename(self, context=None, template_values={}, name_template=None):
         """Generate the filename based on the config template
@@ -58,7 +81,8 @@ class SaveTo:
 
         return filename
 
-    def save(self, context=None, template_values={}, filename=None, save_service=None):
+    def save(self, context=None, template_values={}, filename=None, save_service=None,
+             skip_existing=False, compression=None):
         """Save the file based on the config
 
         Args:
@@ -70,12 +94,16 @@ class SaveTo:
                 config file_template will be used. Defaults to None.
             save_service (str, optional): Override the service in the context.
                 Defaults to None.
+            skip_existing (bool, optional): Do not write the file if it already exists.
+                Only safe when the path is unique to the contents. Defaults to False.
+            compression (str, optional): Codec to compress the file with, `none` to not
+                compress. If None the contexts config is used. Defaults to None.
 
         Returns:
             str: File path to where it was saved
         """
+        context_type = get_context_type(context)
         if save_service is None and context is not None:
-            context_type = get_context_type(context)
             save_service = self.scraper.config[f'{context_type}_SAVE_DATA_SERVICE']
 
         filename = self._get_filename(context,
@@ -114,6 +142,116 @@ class SaveTo:
             pathlib.Path(target_path).parent.mkdir(parents=True, exist_ok=True)
             transport_params = {}
 
+        if compression is None and context is not None:
+            codec, level = get_compression(self.scraper, context_type)
+        elif compression in CODECS:
+            codec, level = compression, None
+        else:
+            codec, level = None, None
+
+        write = self._write
+        if skip_existing:
+            if not self._claim_target(target_path, transport_params):
+                self.scraper.stats.incr('saves_skipped_existing')
+                return target_path
+            write = self._write_claimed
+
+        upload_queue = None
+        if save_service == 's3' and context_type == 'downloader':
+            upload_queue = get_upload_queue(self.scraper)
+
+        if upload_queue is not None:
+            # The path is known now, so there is no need to wait for the upload to finish
+            upload_queue.submit(target_path, write, target_path, transport_params,
+                                codec, level)
+        else:
+            write(target_path, transport_params, codec, level)
+
+        return target_path
+
+    def _claim_target(self, target_path, transport_params):
+        """Check if the target path needs to be saved, and if so mark it as being saved
+
+        If another thread is saving the same path, wait for it to finish first so the path of
+        a partial file is never returned.
+
+        Args:
+            target_path (str): Local path or s3 url
+            transport_params (dict): Passed into smart_open, has the s3 client
+
+        Returns:
+            bool: True if the caller must write the file, False if it already exists
+        """
+        while True:
+            with _saved_targets_lock:
+                if target_path in _saved_targets:
+                    return False
+                pending = _pending_targets.get(target_path)
+                if pending is None:
+                    _pending_targets[target_path] = threading.Event()
+                    break
+            # If that save fails, try to claim it again
+            pending.wait()
+
+        try:
+            exists = self._target_exists(target_path, transport_params)
+        except Exception:
+            _release_target(target_path, saved=False)
+            raise
+        if exists:
+            _release_target(target_path, saved=True)
+            return False
+        return True
+
+    def _write_claimed(self, target_path, transport_params, codec=None, level=None):
+        """Write a path claimed by `_claim_target`, only marking it as saved if it succeeds"""
+        try:
+            self._write(target_path, transport_params, codec, level)
+        except BaseException:
+            _release_target(target_path, saved=False)
+            raise
+        _release_target(target_path, saved=True)
+
+    def _target_exists(self, target_path, transport_params):
+        """Check if the target path has already been saved to
+
+        Args:
+            target_path (str): Local path or s3 url
+            transport_params (dict): Passed into smart_open, has the s3 client
+
+        Returns:
+            bool: True if the file exists
+        """
+        if not target_path.startswith('s3://'):
+            return os.path.exists(target_path)
+
+        import botocore.exceptions
+        bucket_name, key = target_path[len('s3://'):].split('/', 1)
+        try:
+            transport_params['client'].head_object(Bucket=bucket_name, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def _write(self, target_path, transport_params, codec=None, level=None):
+        """Write the data to the target path
+
+        Args:
+            target_path (str): Local path or s3 url to save the data to
+            transport_params (dict): Passed into smart_open
+            codec (str, optional): Codec to compress the data with. Defaults to None.
+            level (int, optional): Compression level. Defaults to None.
+        """
+        if callable(self.raw_data):
+            self._write_stream(target_path, transport_params, codec, level)
+            return
+
+        if codec is not None:
+            self._write_compressed(target_path, transport_params, codec, level)
+            return
+
         try:
             with open(target_path, 'w',
                       transport_params=transport_params, encoding=self.encoding) as outfile:
@@ -137,4 +275,59 @@ class SaveTo:
         except AttributeError:
             pass
 
-        return target_path
+    def _write_stream(self, target_path, transport_params, codec, level):
+        """Have the `raw_data` writer function write directly into the open file"""
+        if codec is None:
+            if self.binary:
+                with open(target_path, 'wb', transport_params=transport_params) as outfile:
+                    self.raw_data(outfile)
+            else:
+                with open(target_path, 'w', transport_params=transport_params,
+                          encoding=self.encoding) as outfile:
+                    self.raw_data(outfile)
+            return
+
+        # The codec is set by the config, so do not let smart_open guess from the extension
+        with open(target_path, 'wb', transport_params=transport_params,
+                  compression='disable') as outfile:
+            if self.binary:
+                with open_compressed(outfile, codec, level) as compressed_outfile:
+                    self.raw_data(compressed_outfile)
+            else:
+                with io.TextIOWrapper(open_compressed(outfile, codec, level),
+                                      encoding=self.encoding or 'utf-8') as text_outfile:
+                    self.raw_data(text_outfile)
+
+    def _write_compressed(self, target_path, transport_params, codec, level):
+        try:
+            data = self.raw_data.read()
+        except AttributeError:
+            # Data is bytes and does not need .read()
+            data = self.raw_data
+        if isinstance(data, str):
+            data = data.encode(self.encoding or 'utf-8')
+
+        # The codec is set in the manifest, so do not let smart_open guess from the extension
+        with open(target_path, 'wb', transport_params=transport_params,
+                  compression='disable') as outfile:
+            outfile.write(compress(data, codec, level))
+
+        try:
+            self.raw_data.close()
+        except AttributeError:
+            pass
+
+
+def _release_target(target_path, saved):
+    """Let threads waiting on a target path know it is done being saved
+
+    Args:
+        target_path (str): Local path or s3 url
+        saved (bool): If the file was saved, otherwise the next thread will try to save it
+    """
+    with _saved_targets_lock:
+        if saved:
+            _saved_targets.add(target_path)
+        pending = _pending_targets.pop(target_path, None)
+    if pending is not None:
+        pending.set()
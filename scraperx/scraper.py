@@ -1,4 +1,6 @@
 import logging
+from .stats import RunStats
+from .selectors import SelectorStats
 from .config import ConfigGen
 from .dispatch import Dispatch
 from .download import Download
@@ -26,6 +28,9 @@ class Scraper:
         self.config = ConfigGen(config_file=config_file,
                                 cli_args=cli_args,
                                 scraper_name=scraper_name)
+        # Counters shared by every task that runs in this process
+        self.stats = RunStats()
+        self.selector_stats = SelectorStats()
         self._set_download_cls(download_cls)
         self._set_dispatch_cls(dispatch_cls)
         self._set_extract_cls(extract_cls)
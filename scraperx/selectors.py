@@ -0,0 +1,214 @@
+import os
+import json
+import atexit
+import logging
+import pathlib
+import functools
+import threading
+from collections import defaultdict
+from parsel import Selector, SelectorList
+from parsel.csstranslator import HTMLTranslator
+
+logger = logging.getLogger(__name__)
+
+_translator = HTMLTranslator()
+_load_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=2048)
+def css_to_xpath(css_selector):
+    """Translate a css selector to xpath, cached for the whole process
+
+    Args:
+        css_selector (str): Css selector, parsel's `::text` & `::attr()` are supported
+
+    Returns:
+        str: The xpath
+    """
+    return _translator.css_to_xpath(css_selector)
+
+
+def select_css(source, css_selector):
+    """Run a css selector on a parsel element using the cached translation
+
+    Elements from the other parser backends run the selector themselves.
+
+    Args:
+        source (parsel.Selector|parsel.SelectorList): Element(s) to run the selector on
+        css_selector (str): Css selector
+
+    Returns:
+        parsel.SelectorList: The matching elements
+    """
+    if not isinstance(source, (Selector, SelectorList)):
+        return source.css(css_selector)
+    if getattr(source, 'type', 'html') != 'html':
+        # Xml uses a different translator
+        return source.css(css_selector)
+    return source.xpath(css_to_xpath(css_selector))
+
+
+def load_selector_stats(scraper):
+    """Load the selector stats saved by previous runs, once per process
+
+    Args:
+        scraper (obj): The users Scraper instance
+    """
+    stats_file = scraper.config['EXTRACTOR_SELECTOR_STATS_FILE']
+    if not stats_file:
+        return
+
+    with _load_lock:
+        if scraper.selector_stats.file is not None:
+            return
+        scraper.selector_stats.load(stats_file)
+        # Make sure the stats are not lost if the run does not finish cleanly
+        atexit.register(scraper.selector_stats.save)
+
+
+class SelectorStats:
+
+    def __init__(self):
+        """Thread safe counts of how often each selector was run and found elements
+
+        Shows which fallback selectors are actually being used. For each list of fallback
+        selectors, it also counts which selector was the one that found the elements so
+        the list can be reordered to try the most likely one first.
+        """
+        self.file = None
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'evaluated': 0, 'matched': 0})
+        self._group_wins = defaultdict(lambda: defaultdict(int))
+
+    @staticmethod
+    def _group_key(css_selectors):
+        return '\n'.join(css_selectors)
+
+    def record_group(self, css_selectors, css_selector):
+        """Count which selector of a list of fallbacks found the elements
+
+        Args:
+            css_selectors (list): The fallback selectors, in the order they were given
+            css_selector (str): The selector that found the elements
+        """
+        with self._lock:
+            self._group_wins[self._group_key(css_selectors)][css_selector] += 1
+
+    def order(self, css_selectors):
+        """Order the fallback selectors so the one that has found elements most often is first
+
+        Selectors with the same count stay in the order they were given.
+
+        Args:
+            css_selectors (list): The fallback selectors, in the order they were given
+
+        Returns:
+            list: The selectors to try, in order
+        """
+        with self._lock:
+            wins = self._group_wins.get(self._group_key(css_selectors))
+            if not wins:
+                return list(css_selectors)
+            return sorted(css_selectors, key=lambda selector: -wins.get(selector, 0))
+
+    def record(self, css_selector, matched):
+        """Count a selector being run
+
+        Args:
+            css_selector (str): The selector
+            matched (bool): If it found any elements
+        """
+        with self._lock:
+            counts = self._counts[css_selector]
+            counts['evaluated'] += 1
+            if matched:
+                counts['matched'] += 1
+
+    def merge(self, counts):
+        """Add the counts from another SelectorStats snapshot into these
+
+        Args:
+            counts (dict): Selectors and their `evaluated` & `matched` counts
+        """
+        with self._lock:
+            for css_selector, other in counts.items():
+                self._counts[css_selector]['evaluated'] += other['evaluated']
+                self._counts[css_selector]['matched'] += other['matched']
+
+    def snapshot(self):
+        """Copy of all of the counts
+
+        Returns:
+            dict: Selectors and their `evaluated` & `matched` counts
+        """
+        with self._lock:
+            return {k: dict(v) for k, v in self._counts.items()}
+
+    def __getstate__(self):
+        # So the scraper can be sent to worker processes
+        return {'file': self.file,
+                'counts': self.snapshot(),
+                'group_wins': self.group_snapshot(),
+                }
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.file = state['file']
+        self.merge(state['counts'])
+        self.merge_groups(state['group_wins'])
+
+    def merge_groups(self, group_wins):
+        """Add the fallback selector counts from another SelectorStats
+
+        Args:
+            group_wins (dict): Lists of fallback selectors and how often each one matched
+        """
+        with self._lock:
+            for group_key, wins in group_wins.items():
+                for css_selector, count in wins.items():
+                    self._group_wins[group_key][css_selector] += count
+
+    def group_snapshot(self):
+        """Copy of the fallback selector counts
+
+        Returns:
+            dict: Lists of fallback selectors and how often each one matched
+        """
+        with self._lock:
+            return {k: dict(v) for k, v in self._group_wins.items()}
+
+    def load(self, stats_file):
+        """Add the counts of the fallback selectors saved in a file
+
+        The saved counts are halved each time they are loaded, so the order can change
+        quickly after a site changes.
+
+        Args:
+            stats_file (str): Local json file the stats are saved to
+        """
+        self.file = stats_file
+        try:
+            with open(stats_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+
+        with self._lock:
+            for group_key, wins in saved.get('groups', {}).items():
+                for css_selector, count in wins.items():
+                    self._group_wins[group_key][css_selector] += count // 2
+
+    def save(self):
+        """Save the counts to the file they were loaded from"""
+        if self.file is None:
+            return
+
+        saved = {'selectors': self.snapshot(),
+                 'groups': self.group_snapshot(),
+                 }
+        with self._lock:
+            pathlib.Path(self.file).parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = f"{self.file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(saved, f)
+            os.replace(tmp_file, self.file)
@@ -0,0 +1,131 @@
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('json', 'orjson', 'msgspec')
+
+# Serializers used in this process, keyed by backend
+_serializers = {}
+_serializers_lock = threading.Lock()
+
+
+def get_serializer(scraper=None, backend=None):
+    """Get the json serializer based on the config
+
+    Falls back to the standard library if the backend is not installed.
+
+    Args:
+        scraper (obj, optional): The users Scraper instance. Defaults to None.
+        backend (str, optional): Override the backend from the config. Defaults to None.
+
+    Returns:
+        JSONSerializer: The serializer to use
+    """
+    if backend is None:
+        backend = scraper.config['SERIALIZER_BACKEND'] if scraper is not None else 'json'
+
+    with _serializers_lock:
+        if backend not in _serializers:
+            serializer_cls = {'json': JSONSerializer,
+                              'orjson': ORJSONSerializer,
+                              'msgspec': MsgspecSerializer,
+                              }[backend]
+            try:
+                _serializers[backend] = serializer_cls()
+            except ImportError:
+                logger.warning(f"Serializer backend {backend} is not installed, using json",
+                               extra={'task': None})
+                _serializers[backend] = JSONSerializer()
+        return _serializers[backend]
+
+
+class JSONSerializer:
+    """Serialize using the standard library `json` module
+
+    Compact output has no whitespace. Pretty output is indented and has its keys sorted,
+    it is always created with the standard library so it looks the same for every backend.
+    """
+    name = 'json'
+
+    def dumps(self, data, pretty=False):
+        """Serialize data to a json string
+
+        Args:
+            data (obj): Data to serialize
+            pretty (bool, optional): Indent & sort the keys. Defaults to False.
+
+        Returns:
+            str: The json
+        """
+        if pretty:
+            return json.dumps(data, sort_keys=True, indent=4, ensure_ascii=False)
+        return self._dumps(data)
+
+    def dump(self, data, outfile, pretty=False):
+        """Serialize data into an open text file
+
+        Args:
+            data (obj): Data to serialize
+            outfile (file): File to write the json to
+            pretty (bool, optional): Indent & sort the keys. Defaults to False.
+        """
+        if pretty:
+            json.dump(data, outfile, sort_keys=True, indent=4, ensure_ascii=False)
+        else:
+            self._dump(data, outfile)
+
+    def loads(self, data):
+        """Deserialize a json string or bytes
+
+        Args:
+            data (str|bytes): The json
+
+        Returns:
+            obj: The data
+        """
+        return json.loads(data)
+
+    def _dumps(self, data):
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+    def _dump(self, data, outfile):
+        # Writes each chunk as it is encoded, so the full string is never built
+        json.dump(data, outfile, ensure_ascii=False, separators=(',', ':'))
+
+
+class ORJSONSerializer(JSONSerializer):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+    def _dumps(self, data):
+        # Int & other keys are converted to strings like the other backends
+        return self._orjson.dumps(data, option=self._orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def _dump(self, data, outfile):
+        outfile.write(self._dumps(data))
+
+
+class MsgspecSerializer(JSONSerializer):
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec.json
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def loads(self, data):
+        return self._decoder.decode(data)
+
+    def _dumps(self, data):
+        return self._encoder.encode(data).decode('utf-8')
+
+    def _dump(self, data, outfile):
+        outfile.write(self._dumps(data))
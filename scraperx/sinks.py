@@ -0,0 +1,228 @@
+import os
+import atexit
+import logging
+import pathlib
+import datetime
+import tempfile
+import itertools
+import threading
+from smart_open import open
+
+from .save_to import SaveTo
+from .uploads import get_upload_queue
+from .serializers import get_serializer
+from .compression import get_compression, open_compressed
+from .utils import _get_s3_params
+
+logger = logging.getLogger(__name__)
+
+# Placeholder for the segment id while the template is used as the partition key
+_SEGMENT_ID = '\0segment_id\0'
+
+# Number of rows serialized at a time when appending
+_APPEND_CHUNK_ROWS = 1000
+
+# Sinks used in this process, keyed by scraper & template
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_output_sink(scraper):
+    """Get the aggregating sink for the extracted data based on the config
+
+    Each scraper has its own sink, since the files are named & saved using its config.
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Returns:
+        AggregatingSink|None: The sink to use, or None if each task saves its own files
+    """
+    if scraper.config['EXTRACTOR_OUTPUT_MODE'] != 'aggregate':
+        return None
+
+    template = scraper.config['EXTRACTOR_AGGREGATE_TEMPLATE']
+    key = (scraper, template)
+    with _sinks_lock:
+        if key not in _sinks:
+            _sinks[key] = AggregatingSink(
+                scraper,
+                template,
+                max_bytes=scraper.config['EXTRACTOR_AGGREGATE_MAX_BYTES'],
+                max_rows=scraper.config['EXTRACTOR_AGGREGATE_MAX_ROWS'],
+            )
+            # Background threads can not be used once the interpreter is exiting,
+            # so upload any open files right away
+            atexit.register(_sinks[key].close, background=False)
+        return _sinks[key]
+
+
+def close_output_sinks():
+    """Close the open files of all of the sinks"""
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    for sink in sinks:
+        sink.close()
+
+
+class AggregatingSink:
+
+    def __init__(self, scraper, template, max_bytes=None, max_rows=None):
+        """Append the extracted rows of every task to shared json lines files
+
+        There is an open file per partition, which is the `template` filled in with
+        everything but the `segment_id`. A new file is started once the current one is larger
+        then `max_bytes` or has `max_rows`. When saving to s3, files are written locally then
+        uploaded once they are closed.
+
+        Args:
+            scraper (obj): The users Scraper instance
+            template (str): Template of the file names. Has the same keys as the extractors
+                `file_template` along with `name` (of the extract task) & `segment_id`
+            max_bytes (int, optional): Max size of a file before it is compressed.
+                Defaults to None.
+            max_rows (int, optional): Max rows in a file. Defaults to None.
+        """
+        self.scraper = scraper
+        self.template = template
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._num_segments = 0
+        self._segments = {}
+
+    def append(self, context, rows, name='', template_values={}):
+        """Add rows to the file of their partition
+
+        Args:
+            context (scraperx.Extract): The extractor the rows are from
+            rows (list): Rows to add, can be an iterator
+            name (str, optional): Name of the extract task. Defaults to ''.
+            template_values (dict, optional): Additional keys to use in the template.
+                Defaults to {}.
+
+        Returns:
+            int: Number of rows added
+        """
+        partition = SaveTo(self.scraper, None)._get_filename(
+            context,
+            template_values={**template_values, 'name': name, 'segment_id': _SEGMENT_ID},
+            name_template=self.template,
+        )
+        serializer = get_serializer(self.scraper)
+        rows = iter(rows)
+        num_rows = 0
+        while True:
+            # Written a chunk at a time so an iterator of rows is never all in memory
+            lines = [f'{serializer.dumps(row)}\n'
+                     for row in itertools.islice(rows, _APPEND_CHUNK_ROWS)]
+            if not lines:
+                break
+            data = ''.join(lines).encode('utf-8')
+
+            closed_segment = None
+            with self._lock:
+                segment = self._segments.get(partition)
+                if segment is not None and self._should_roll(segment):
+                    closed_segment = self._swap_segment(partition)
+                    segment = None
+                if segment is None:
+                    segment = self._open_segment(partition)
+
+                segment['file'].write(data)
+                segment['size'] += len(data)
+                segment['num_rows'] += len(lines)
+            num_rows += len(lines)
+
+            if closed_segment is not None:
+                self._finish_segment(closed_segment)
+
+        self.scraper.stats.incr('rows_aggregated', num_rows)
+        return num_rows
+
+    def _should_roll(self, segment):
+        if self.max_bytes and segment['size'] >= self.max_bytes:
+            return True
+        if self.max_rows and segment['num_rows'] >= self.max_rows:
+            return True
+        return False
+
+    def _open_segment(self, partition):
+        now = datetime.datetime.utcnow()
+        self._num_segments += 1
+        segment_id = f"{now.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}_{self._num_segments:05d}"
+        filename = partition.replace(_SEGMENT_ID, segment_id)
+
+        if self.scraper.config['EXTRACTOR_SAVE_DATA_SERVICE'] == 's3':
+            if filename.startswith('s3://'):
+                target_path = filename
+            else:
+                bucket_name = self.scraper.config['EXTRACTOR_SAVE_DATA_BUCKET_NAME']
+                target_path = f"s3://{bucket_name}/{filename.replace(os.sep, '/').lstrip('/')}"
+            local_path = os.path.join(tempfile.gettempdir(), 'scraperx_sink',
+                                      filename.replace(os.sep, '_').replace('/', '_'))
+        else:
+            target_path = filename
+            local_path = filename
+
+        pathlib.Path(local_path).parent.mkdir(parents=True, exist_ok=True)
+        raw_file = open(local_path, 'wb', compression='disable')
+        codec, level = get_compression(self.scraper, 'extractor')
+        segment = {'target_path': target_path,
+                   'local_path': local_path,
+                   'raw_file': raw_file,
+                   'file': raw_file if codec is None else open_compressed(raw_file, codec, level),
+                   'size': 0,
+                   'num_rows': 0,
+                   }
+        self._segments[partition] = segment
+        return segment
+
+    def _swap_segment(self, partition):
+        """Take a partition's file out of the sink & close it, must hold the lock
+
+        Returns:
+            dict: The closed segment, to be passed to `_finish_segment` once the lock is released
+        """
+        segment = self._segments.pop(partition)
+        segment['file'].close()
+        if segment['raw_file'] is not segment['file']:
+            # Compressed, so the compressor does not close the file itself
+            segment['raw_file'].close()
+        logger.debug(f"Closed output file {segment['target_path']}",
+                     extra={**self.scraper.log_extras(),
+                            'task': None,
+                            'num_rows': segment['num_rows']})
+        return segment
+
+    def _finish_segment(self, segment, background=True):
+        # Not called with the lock held, so other threads can keep appending during the upload
+        if segment['target_path'] == segment['local_path']:
+            return
+
+        upload_queue = get_upload_queue(self.scraper) if background else None
+        if upload_queue is not None:
+            upload_queue.submit(segment['target_path'], self._upload, segment)
+        else:
+            self._upload(segment)
+
+    def _upload(self, segment):
+        transport_params = _get_s3_params(self.scraper, context_type='extractor')
+        with open(segment['local_path'], 'rb', compression='disable') as infile, \
+                open(segment['target_path'], 'wb', transport_params=transport_params,
+                     compression='disable') as outfile:
+            for chunk in iter(lambda: infile.read(1024 * 1024), b''):
+                outfile.write(chunk)
+        os.remove(segment['local_path'])
+
+    def close(self, background=True):
+        """Close all of the open files, the next rows will start new ones
+
+        Args:
+            background (bool, optional): Use the upload queue if there is one.
+                Defaults to True.
+        """
+        with self._lock:
+            segments = [self._swap_segment(partition) for partition in list(self._segments)]
+        for segment in segments:
+            self._finish_segment(segment, background=background)
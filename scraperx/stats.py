@@ -0,0 +1,70 @@
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class RunStats:
+
+    def __init__(self):
+        """Thread safe counters that are shared across a single run of the scraper
+
+        Every task that runs in this process adds to the same counters, so they can be
+        reported in the run summary once everything has finished.
+        """
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+
+    def incr(self, key, value=1):
+        """Add to a counter
+
+        Args:
+            key (str): Name of the counter
+            value (int, optional): Amount to add to the counter. Defaults to 1.
+
+        Returns:
+            int: The new value of the counter
+        """
+        with self._lock:
+            self._counters[key] += value
+            return self._counters[key]
+
+    def __getitem__(self, key):
+        """Get the current value of a counter via stats['key']
+
+        Args:
+            key (str): Name of the counter
+
+        Returns:
+            int: Value of the counter, 0 if it has never been set
+        """
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def merge(self, counters):
+        """Add the values of another set of counters into these
+
+        Args:
+            counters (dict): Counter names and the amount to add to each
+        """
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] += value
+
+    def snapshot(self):
+        """Copy of all of the counters
+
+        Returns:
+            dict: Counter names and their current values
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def __getstate__(self):
+        # So the scraper can be sent to worker processes
+        return {'counters': self.snapshot()}
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int, state['counters'])
@@ -127,7 +127,8 @@ class ExtractorBaseTest:
                     self.assertEqual(diff, {}, '\n' + errors)
 
         def _test_source_file(self, extractor, s_idx, s_file, metadata):
-            raw_source = read_file_contents(s_file)
+            source = metadata['download_manifest']['source_files'][s_idx]
+            raw_source = read_file_contents(s_file, compression=source.get('compression'))
 
             time_downloaded = (metadata['download_manifest']['time_downloaded']
                                .replace('-', '').replace(':', ''))
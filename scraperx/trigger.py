@@ -1,6 +1,8 @@
 import json
 import logging
 
+from .serializers import get_serializer
+
 logger = logging.getLogger(__name__)
 
 
@@ -75,7 +77,7 @@ def _dispatch_sns(scraper, task, arn=None, **kwargs):
                    **kwargs,
                    }
         if target_arn is not None:
-            sns_message = json.dumps({'default': json.dumps(message)})
+            sns_message = json.dumps({'default': get_serializer(scraper).dumps(message)})
             response = client.publish(TargetArn=target_arn,
                                       Message=sns_message,
                                       MessageStructure='json'
@@ -0,0 +1,156 @@
+import atexit
+import logging
+import threading
+
+from .workers import BoundedExecutor
+from .exceptions import UploadError
+
+logger = logging.getLogger(__name__)
+
+# Upload queues used in this process, keyed by (max_workers, max_queue)
+_upload_queues = {}
+_upload_queues_lock = threading.Lock()
+
+
+def get_upload_queue(scraper):
+    """Get the upload queue for the scraper based on the config
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Returns:
+        UploadQueue|None: The queue to use, or None if uploads should not run in the background
+    """
+    max_workers = scraper.config['DOWNLOADER_UPLOAD_WORKERS']
+    if not max_workers:
+        return None
+
+    max_queue = scraper.config['DOWNLOADER_UPLOAD_QUEUE_SIZE']
+    if max_queue is None:
+        max_queue = max_workers * 4
+
+    with _upload_queues_lock:
+        if (max_workers, max_queue) not in _upload_queues:
+            upload_queue = UploadQueue(scraper, max_workers=max_workers, max_queue=max_queue)
+            # Do not exit before everything has been uploaded
+            atexit.register(upload_queue.flush)
+            _upload_queues[(max_workers, max_queue)] = upload_queue
+        return _upload_queues[(max_workers, max_queue)]
+
+
+def wait_for_upload(scraper, target_path):
+    """Block until the file has been uploaded, if it is being uploaded in the background
+
+    Args:
+        scraper (obj): The users Scraper instance
+        target_path (str): Path the file is being saved to
+    """
+    upload_queue = get_upload_queue(scraper)
+    if upload_queue is not None:
+        upload_queue.wait(target_path)
+
+
+def flush_uploads(scraper):
+    """Block until all of the background uploads are done
+
+    Args:
+        scraper (obj): The users Scraper instance
+
+    Raises:
+        UploadError: If any upload failed since the last flush
+    """
+    upload_queue = get_upload_queue(scraper)
+    if upload_queue is not None:
+        upload_queue.flush()
+
+
+class UploadQueue:
+
+    def __init__(self, scraper, max_workers, max_queue=0):
+        """Upload files in background threads
+
+        Args:
+            scraper (obj): The users Scraper instance
+            max_workers (int): Number of uploads that can run at the same time
+            max_queue (int, optional): Number of uploads that can be waiting before
+                submitting another one blocks. Defaults to 0.
+        """
+        self.scraper = scraper
+        self._executor = BoundedExecutor(max_workers, max_queue=max_queue,
+                                         thread_name_prefix='scraperx_upload')
+        self._lock = threading.Lock()
+        self._futures = {}
+        # Exception of each path whose last upload failed, so waiting on it raises
+        self._failed = {}
+        # Failures that have not been raised by `flush` yet
+        self._unflushed_failures = []
+
+    def submit(self, target_path, fn, *args, **kwargs):
+        """Upload a file in the background, blocks if the queue is full
+
+        Args:
+            target_path (str): Path the file is being saved to
+            fn (function): Function that does the upload
+            *args: Arguments to pass into the function
+            **kwargs: Keyword arguments to pass into the function
+        """
+        future = self._executor.submit(self._upload, target_path, fn, *args, **kwargs)
+        with self._lock:
+            self._futures[target_path] = future
+        future.add_done_callback(lambda f: self._done(target_path, f))
+
+    def _upload(self, target_path, fn, *args, **kwargs):
+        # The outcome is kept before the future is done, so `flush` can not miss it
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                self._failed[target_path] = e
+                self._unflushed_failures.append((target_path, e))
+            raise
+        with self._lock:
+            self._failed.pop(target_path, None)
+
+    def _done(self, target_path, future):
+        with self._lock:
+            if self._futures.get(target_path) is future:
+                del self._futures[target_path]
+
+        if future.exception() is not None:
+            logger.error(f"Upload failed: {target_path}",
+                         extra={**self.scraper.log_extras(),
+                                'task': None,
+                                'file': target_path},
+                         exc_info=future.exception())
+
+    def wait(self, target_path):
+        """Block until a file has been uploaded
+
+        Args:
+            target_path (str): Path the file is being saved to
+
+        Raises:
+            Exception: Whatever caused the upload to fail
+        """
+        with self._lock:
+            future = self._futures.get(target_path)
+            exception = self._failed.get(target_path)
+        if future is not None:
+            future.result()
+        elif exception is not None:
+            raise exception
+
+    def flush(self):
+        """Block until all of the uploads are done
+
+        Raises:
+            UploadError: If any upload failed since the last flush, from the first failure
+        """
+        self._executor.join()
+        with self._lock:
+            failures = self._unflushed_failures
+            self._unflushed_failures = []
+        if failures:
+            target_path, exception = failures[0]
+            raise UploadError(f"{len(failures)} uploads failed, the first was {target_path}") \
+                from exception
@@ -4,6 +4,8 @@ import logging
 import threading
 from smart_open import open
 
+from .compression import decompress
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,11 +22,17 @@ def get_encoding(file_bytes):
     # return charset_normalizer.detect(file_bytes)['encoding']
 
 
-def read_file_contents(file_name, transport_params={}):
+def read_file_contents(file_name, transport_params={}, compression=None):
     # Read in file (local or s3) and check bytes for encoding type
-    with open(file_name, 'rb',
-              transport_params=transport_params) as f:
-        raw_bytes = f.read()
+    if compression is None:
+        with open(file_name, 'rb',
+                  transport_params=transport_params) as f:
+            raw_bytes = f.read()
+    else:
+        # The codec is known, so do not let smart_open guess from the extension
+        with open(file_name, 'rb',
+                  transport_params=transport_params, compression='disable') as f:
+            raw_bytes = decompress(f.read(), compression)
     file_encoding = get_encoding(file_bytes=raw_bytes)
     # Once encoding is known, decode into correct encoding
     return raw_bytes.decode(file_encoding)
@@ -71,8 +79,43 @@ def get_context_type(context=None):
     return context_type
 
 
-def _get_s3_params(scraper, context=None, context_type=None):
+# boto3 clients are thread safe and keep their own connection pool, so they are reused
+# for every read & write in the process
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+
+def _get_s3_client(context_type, endpoint_url=None, **aws_access_key):
+    """Get a cached s3 client, creating it if needed
+
+    Args:
+        context_type (str): Either 'downloader' or 'extractor'
+        endpoint_url (str, optional): Url of the s3 server if not using AWS. Defaults to None.
+        **aws_access_key: `aws_access_key_id` & `aws_secret_access_key` if set
+
+    Returns:
+        botocore.client.S3: The s3 client
+    """
     import boto3
+    client_key = (context_type,
+                  endpoint_url,
+                  aws_access_key.get('aws_access_key_id'),
+                  aws_access_key.get('aws_secret_access_key'))
+    with _s3_clients_lock:
+        if client_key not in _s3_clients:
+            # boto3 sessions are not thread safe, so create them under the lock as well
+            session = boto3.Session(**aws_access_key)
+            _s3_clients[client_key] = session.client('s3', endpoint_url=endpoint_url)
+        return _s3_clients[client_key]
+
+
+def clear_s3_client_cache():
+    """Remove all cached s3 clients, mostly useful in tests"""
+    with _s3_clients_lock:
+        _s3_clients.clear()
+
+
+def _get_s3_params(scraper, context=None, context_type=None):
     endpoint_url = None
     if context_type is None:
         context_type = get_context_type(context)
@@ -86,9 +129,8 @@ def _get_s3_params(scraper, context=None, context_type=None):
     if aws_secret_access_key:
         aws_access_key['aws_secret_access_key'] = aws_secret_access_key
 
-    session = boto3.Session(**aws_access_key)
     return {
-        'client': session.client('s3', endpoint_url=endpoint_url),
+        'client': _get_s3_client(context_type, endpoint_url=endpoint_url, **aws_access_key),
     }
 
 
@@ -0,0 +1,73 @@
+import logging
+import threading
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+
+    def __init__(self, max_workers, max_queue=0,
+                 executor_cls=concurrent.futures.ThreadPoolExecutor, **executor_kwargs):
+        """Executor that blocks on submit once too many items are waiting to run
+
+        This gives backpressure to whatever is submitting the work, so it can not get
+        too far ahead of the workers.
+
+        Args:
+            max_workers (int): Number of workers
+            max_queue (int, optional): Number of items that can wait for a worker before
+                submit blocks. Defaults to 0.
+            executor_cls (class, optional): Executor to run the items with.
+                Defaults to concurrent.futures.ThreadPoolExecutor.
+            **executor_kwargs: Keyword arguments passed into the `executor_cls`
+        """
+        self._executor = executor_cls(max_workers=max_workers, **executor_kwargs)
+        self._slots = threading.BoundedSemaphore(max_workers + max(0, max_queue))
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit an item to run, blocks if the queue is full
+
+        Args:
+            fn (function): Function to run
+            *args: Arguments to pass into the function
+            **kwargs: Keyword arguments to pass into the function
+
+        Returns:
+            concurrent.futures.Future: Future of the function call
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def join(self):
+        """Wait until everything that has been submitted is done"""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return
+            concurrent.futures.wait(pending)
+
+    def shutdown(self, wait=True):
+        """Stop the workers
+
+        Args:
+            wait (bool, optional): Wait for everything submitted to finish. Defaults to True.
+        """
+        self._executor.shutdown(wait=wait)
@@ -1,7 +1,11 @@
 import io
+import csv
 import json
 import logging
+import itertools
+import collections.abc
 from .save_to import SaveTo
+from .serializers import get_serializer
 
 logger = logging.getLogger(__name__)
 
@@ -17,18 +21,18 @@ class Write:
         # TODO: (will work like .save())
         raise NotImplementedError
 
-    def write_json(self, json_args=None):
-        """Write json data to a StringIO object
+    def write_json(self, json_args=None, pretty=None):
+        """Write json data, it is encoded straight into the file when saved
+
+        Args:
+            json_args (dict, optional): Keyword arguments for the standard library
+                `json.dump`. If set, the configs serializer is not used. Defaults to None.
+            pretty (bool, optional): Indent & sort the keys. If None the config
+                `serializer.pretty` is used. Defaults to None.
 
         Returns:
             class: scraper.save_to.SaveTo, Used to then save the file
         """
-        if json_args is None:
-            json_args = {'sort_keys': True,
-                         'indent': 4,
-                         'ensure_ascii': False,
-                         }
-
         if isinstance(self.data, str):
             # Convert raw string into a list to be saved as json
             json_data = [self.data]
@@ -37,25 +41,35 @@ class Write:
 
         # TODO: Convert all non json types into strings.
 
-        output_io = io.StringIO()
-        json.dump(json_data, output_io, **json_args)
-        output_io.seek(0)
-        return SaveTo(self.scraper, output_io,
+        if json_args is not None:
+            def _write_json(outfile):
+                json.dump(json_data, outfile, **json_args)
+        else:
+            serializer = get_serializer(self.scraper)
+            if pretty is None:
+                pretty = self.scraper.config['SERIALIZER_PRETTY']
+
+            def _write_json(outfile):
+                serializer.dump(json_data, outfile, pretty=pretty)
+
+        return SaveTo(self.scraper, _write_json,
                       content_type='application/json',
                       encoding=self.encoding)
 
     def write_json_lines(self, json_args=None):
-        """Write json data to a StringIO object
+        """Write json data one row per line
+
+        The data can be a list or an iterator of rows. Rows are written to the file
+        one at a time when it is saved, so an iterator is never fully loaded into memory.
+
+        Args:
+            json_args (dict, optional): Keyword arguments for the standard library
+                `json.dumps`. If set, the configs serializer is not used. Defaults to None.
 
         Returns:
             class: scraper.save_to.SaveTo, Used to then save the file
         """
-        if json_args is None:
-            json_args = {'sort_keys': True,
-                         'ensure_ascii': False,
-                         }
-
-        if not isinstance(self.data, (list, tuple)):
+        if not isinstance(self.data, (list, tuple, collections.abc.Iterator)):
             # Convert raw string into a list to be saved as json
             json_data = [self.data]
         else:
@@ -63,13 +77,18 @@ class Write:
 
         # TODO: Convert all non json types into strings.
 
-        output_io = io.StringIO()
-        for row in json_data:
-            json.dump(row, output_io, **json_args)
-            output_io.write('\n')
+        if json_args is not None:
+            def dumps(row):
+                return json.dumps(row, **json_args)
+        else:
+            dumps = get_serializer(self.scraper).dumps
 
-        output_io.seek(0)
-        return SaveTo(self.scraper, output_io,
+        def _write_json_lines(outfile):
+            for row in json_data:
+                outfile.write(dumps(row))
+                outfile.write('\n')
+
+        return SaveTo(self.scraper, _write_json_lines,
                       content_type='application/json',
                       encoding=self.encoding)
 
@@ -95,49 +114,147 @@ class Write:
                       content_type=content_type,
                       encoding=self.encoding)
 
-    def write_csv(self, filename):
-        # TODO
-        raise NotImplementedError
+    def write_csv(self, columns=None):
+        """Write the rows to a csv file, the rows are written one at a time when saved
+
+        Nested values (dicts & lists) are saved as json.
+
+        Args:
+            columns (list, optional): Order of the columns. Columns in the first row that
+                are not in the list are added after them, in the order of the row.
+                Keys that are not in the columns are left out. Defaults to None.
+
+        Returns:
+            class: scraper.save_to.SaveTo, Used to then save the file
+        """
+        if isinstance(self.data, dict):
+            rows = iter([self.data])
+        else:
+            rows = iter(self.data)
+        serializer = get_serializer(self.scraper)
+
+        def _csv_value(value):
+            if isinstance(value, (dict, list, tuple)):
+                return serializer.dumps(value)
+            return value
+
+        def _write_csv(outfile):
+            first_row = next(rows, None)
+            fieldnames = list(columns or [])
+            if first_row is not None:
+                fieldnames.extend(k for k in first_row if k not in fieldnames)
+                rows_to_write = itertools.chain([first_row], rows)
+            else:
+                rows_to_write = []
+
+            writer = csv.DictWriter(outfile, fieldnames=fieldnames,
+                                    extrasaction='ignore',
+                                    lineterminator='\n')
+            writer.writeheader()
+            for row in rows_to_write:
+                writer.writerow({k: _csv_value(v) for k, v in row.items()})
+
+        return SaveTo(self.scraper, _write_csv,
+                      content_type='text/csv',
+                      encoding=self.encoding)
 
     def write_xlsx(self, filename):
         # TODO
         raise NotImplementedError
 
-    def write_parquet(self):
-        # TODO: Test and create docs for
+    def write_parquet(self, schema=None, batch_size=10000, compression=None,
+                      compression_level=None):
+        """Write the rows to a parquet file, one row group per batch of rows
+
+        Rows are converted to arrow a batch at a time when the file is saved, so the data
+        can be a list or an iterator of dicts. Fields that are not in the schema are not saved,
+        a warning is logged the first time each one is found.
+
+        Args:
+            schema (pyarrow.Schema|dict, optional): Schema of the rows, a dict is
+                `{column name: pyarrow type}`. If None, it is inferred from the first batch.
+                Defaults to None.
+            batch_size (int, optional): Number of rows in each row group. Defaults to 10000.
+            compression (str, optional): Codec parquet uses to compress the column data.
+                Defaults to None.
+            compression_level (int, optional): Level of the `compression`. Defaults to None.
+
+        Returns:
+            class: scraper.save_to.SaveTo, Used to then save the file
+        """
         import pyarrow as pa
         import pyarrow.parquet as pq
 
-        # Generate the schema
-        field_list = []
-        # TODO: Catch and exit gracefully
-        # Will fail if the extractor does not have the class var schema_fields
-        for k, v in self.schema_fields.items():
-            field_list.append(pa.field(k, v))
+        if isinstance(schema, dict):
+            schema = pa.schema([pa.field(k, v) for k, v in schema.items()])
 
-        schema = pa.schema(field_list)
+        if isinstance(self.data, dict):
+            rows = iter([self.data])
+        else:
+            rows = iter(self.data)
 
-        # Create pyarrow table
-        column_names = []
-        columns = []
-        for column in schema:
-            column_values = [dic.get(column.name) for dic in self.data]
+        def _write_parquet(outfile):
+            batch_schema = schema
+            writer = None
+            # Fields that are not saved, only warned about once
+            skipped_fields = set()
             try:
-                columns.append(pa.array(column_values, type=column.type))
-            except Exception:
-                logger.exception(("Could not create array"
-                                  f" for column: {column.name}"))
-                raise
-            column_names.append(column.name)
+                while True:
+                    rows_batch = list(itertools.islice(rows, batch_size))
+                    if not rows_batch and writer is not None:
+                        break
 
-        record_batch = pa.RecordBatch.from_arrays(columns, column_names)
-        table = pa.Table.from_batches([record_batch])
+                    if batch_schema is None:
+                        batch_schema = _infer_parquet_schema(rows_batch)
 
-        output_io = io.BytesIO()
-        pq.write_table(table, output_io)
-        output_io.seek(0)
+                    new_fields = {key for row in rows_batch for key in row}
+                    new_fields.difference_update(skipped_fields, batch_schema.names)
+                    if new_fields:
+                        skipped_fields.update(new_fields)
+                        logger.warning(f"Fields {sorted(new_fields)} are not in the parquet"
+                                       " schema and will not be saved",
+                                       extra={'task': None, **self.scraper.log_extras()})
+                    try:
+                        record_batch = pa.RecordBatch.from_pylist(rows_batch,
+                                                                  schema=batch_schema)
+                    except (pa.ArrowInvalid, pa.ArrowTypeError):
+                        logger.exception("Could not convert rows to the parquet schema",
+                                         extra={'task': None, **self.scraper.log_extras()})
+                        raise
 
-        # TODO: Is this the correct content type for a parquet file?
-        return SaveTo(self.scraper, output_io,
-                      content_type='application/octet-stream',
-                      encoding=self.encoding)
+                    if writer is None:
+                        writer = pq.ParquetWriter(outfile, batch_schema,
+                                                  compression=compression or 'none',
+                                                  compression_level=compression_level)
+                    if not rows_batch:
+                        # No rows at all, the file still gets the schema
+                        break
+                    writer.write_batch(record_batch)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        return SaveTo(self.scraper, _write_parquet,
+                      content_type='application/vnd.apache.parquet',
+                      encoding=self.encoding,
+                      binary=True)
+
+
+def _infer_parquet_schema(rows):
+    """Infer the arrow schema from a batch of rows
+
+    Columns that are always None in the batch are saved as strings, since their
+    type cannot be known.
+
+    Args:
+        rows (list): List of dicts
+
+    Returns:
+        pyarrow.Schema: The schema of the rows
+    """
+    import pyarrow as pa
+
+    schema = pa.RecordBatch.from_pylist(rows).schema
+    return pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type)
+                      else field
+                      for field in schema])
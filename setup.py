@@ -22,7 +22,14 @@ setup(name='scraperx',
                         'requests',
                         'boto3',
                         'deepdiff',
-                        'smart_open>=1.8.4',
+                        'smart_open>=5.1.0',
                         'charset_normalizer',
                         ],
+      extras_require={'zstd': ['zstandard'],
+                      'orjson': ['orjson'],
+                      'msgspec': ['msgspec'],
+                      'parquet': ['pyarrow'],
+                      'selectolax': ['selectolax>=0.3.13'],
+                      'dns': ['dnspython>=2.0.0'],
+                      },
       )
@@ -0,0 +1,44 @@
+import gzip
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+PAGE = b'<html><body>' + b'<p>scraperx</p>' * 1000 + b'</body></html>'
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):  # noqa: N802
+        if self.path.startswith('/status/'):
+            self.send_response(int(self.path.split('/')[-1]))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/gzip')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = PAGE
+        self.send_response(200)
+        if self.path == '/gzip':
+            body = gzip.compress(PAGE)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server_url():
+    server = HTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
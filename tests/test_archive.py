@@ -0,0 +1,135 @@
+import json
+import pytest
+import tempfile
+import threading
+
+from scraperx import Scraper, Download, Extract
+from scraperx import archive as archive_module
+from scraperx.extract_pool import _get_worker_manifest
+from scraperx.archive import ArchiveWriter, iter_archive_records, read_archive_record, \
+    close_archives, get_archive_writer
+
+from .conftest import PAGE
+
+
+def test_archive_roll_and_read(tmp_path):
+    scraper = Scraper(scraper_name='test_archive')
+    template = str(tmp_path / '{segment_id}.sxa')
+    writer = ArchiveWriter(scraper, template, max_bytes=1)
+
+    first = writer.append('source', b'first', header={'name': 'a.html'})
+    second = writer.append('source', 'second')
+    writer.close()
+
+    # Each record goes past max_bytes so a new segment is started
+    assert first['file'] != second['file']
+    assert read_archive_record(first['file'], first['offset'], first['length']) == b'first'
+    assert read_archive_record(second['file'], second['offset'], second['length']) == b'second'
+
+    records = list(iter_archive_records(first['file']))
+    assert records[0]['type'] == 'source'
+    assert records[0]['header']['name'] == 'a.html'
+    assert records[0]['payload'] == b'first'
+
+
+def test_download_to_archive(server_url, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    extracted = []
+
+    class ArchiveExtract(Extract):
+
+        def extract(self, raw_source, source_idx):
+            extracted.append(raw_source)
+            return []
+
+    scraper = Scraper(scraper_name='test_archive', extract_cls=ArchiveExtract)
+    scraper.config._set_value('DOWNLOADER_OUTPUT_MODE', 'archive')
+    task = {'url': server_url}
+    Download(scraper, task).run()
+    close_archives()
+    # Running locally, the extractor reads the source back out of the open segment
+    assert extracted == [PAGE.decode('utf-8')]
+
+    segments = list(tmp_path.glob('output/test_archive/*.sxa'))
+    assert len(segments) == 1
+    metadata = [json.loads(r['payload'])
+                for r in iter_archive_records(str(segments[0]), record_type='metadata')]
+    assert metadata[0]['task'] == task
+    source = metadata[0]['download_manifest']['source_files'][0]
+    assert source['archive']['name'].endswith('.html')
+
+    scraper.extract(metadata[0]['task'], metadata[0]['download_manifest']).run()
+    assert extracted == [PAGE.decode('utf-8')] * 2
+
+
+def test_open_segment_for_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    scraper = Scraper(scraper_name='test_archive')
+    scraper.config._set_value('DOWNLOADER_SAVE_DATA_SERVICE', 's3')
+    writer = ArchiveWriter(scraper, 's3://test-bucket/{segment_id}.sxa')
+    location = writer.append('source', b'first')
+
+    manifest = {'source_files': [{'file': location['file'],
+                                  'archive': {'offset': location['offset'],
+                                              'length': location['length']}}]}
+    archive = _get_worker_manifest(scraper, manifest)['source_files'][0]['archive']
+    assert archive['local_file'].startswith(str(tmp_path))
+    assert 'local_file' not in manifest['source_files'][0]['archive']
+
+    # A worker process does not know about the open segment, the local copy is passed in
+    monkeypatch.setattr(archive_module, '_local_segments', {})
+    assert read_archive_record(location['file'], archive['offset'], archive['length'],
+                               local_file=archive['local_file']) == b'first'
+
+    # Never uploaded, so forget about it
+    monkeypatch.undo()
+    writer._segment['file'].close()
+    archive_module._local_segments.pop(location['file'])
+
+
+def test_archive_needs_local_dispatch():
+    scraper = Scraper(scraper_name='test_archive')
+    scraper.config._set_value('DOWNLOADER_OUTPUT_MODE', 'archive')
+    scraper.config._set_value('DISPATCH_SERVICE_NAME', 'sns')
+    # The remote extractor would be triggered before the segment is uploaded
+    with pytest.raises(ValueError, match='local'):
+        get_archive_writer(scraper)
+
+
+def test_archive_writer_per_scraper(tmp_path):
+    scrapers = []
+    for scraper_name in ('test_archive_a', 'test_archive_b'):
+        scraper = Scraper(scraper_name=scraper_name)
+        scraper.config._set_value('DOWNLOADER_OUTPUT_MODE', 'archive')
+        scrapers.append(scraper)
+    writers = [get_archive_writer(scraper) for scraper in scrapers]
+    assert writers[0] is get_archive_writer(scrapers[0])
+    assert writers[1].scraper is scrapers[1]
+
+
+def test_archive_upload_outside_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    scraper = Scraper(scraper_name='test_archive')
+    scraper.config._set_value('DOWNLOADER_SAVE_DATA_SERVICE', 's3')
+    writer = ArchiveWriter(scraper, 's3://test-bucket/{segment_id}.sxa')
+    uploading = threading.Event()
+    release = threading.Event()
+
+    def _upload(segment):
+        uploading.set()
+        release.wait(5)
+        archive_module._local_segments.pop(segment['target_path'], None)
+
+    monkeypatch.setattr(writer, '_upload', _upload)
+    first = writer.append('source', b'first')
+    closing = threading.Thread(target=writer.close)
+    closing.start()
+    assert uploading.wait(5)
+
+    # Appending to the next segment does not wait for the upload
+    second = writer.append('source', b'second')
+    assert second['file'] != first['file']
+    release.set()
+    closing.join()
+    assert read_archive_record(second['file'], second['offset'], second['length']) == b'second'
+    writer.close()
@@ -0,0 +1,48 @@
+import time
+import pytest
+
+from scraperx import bench
+
+
+@pytest.mark.parametrize('stage', bench.STAGES)
+def test_bench_stage(stage):
+    results = bench.run_bench(num_tasks=10, qps=50, page_size=5000, stages=(stage,))
+    assert len(results) == 1
+    assert results[0]['stage'] == stage
+    assert results[0]['count'] == 10
+    assert results[0]['errors'] == 0
+    assert results[0]['throughput'] > 0
+    assert results[0]['latency_p50'] <= results[0]['latency_p99']
+
+
+def test_bench_download_errors():
+    results = bench.run_bench(num_tasks=10, qps=50, page_size=5000, error_rate=1.0,
+                              stages=('download',))
+    assert results[0]['count'] == 0
+    assert results[0]['errors'] == 10
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert bench._percentile(values, 50) == 50
+    assert bench._percentile(values, 99) == 99
+    assert bench._percentile([], 50) is None
+
+
+def test_stage_memory_growth():
+    timer = bench._StageTimer('memory')
+    with timer:
+        data = bytearray(50 * 1024 * 1024)
+        time.sleep(0.05)
+    del data
+    # Only what the stage itself used, not what the process had before it
+    assert 40 < timer.result()['peak_rss_delta_mb'] < 100
+
+
+def test_bench_scraper_config(tmp_path):
+    scraper = bench._bench_scraper(str(tmp_path), 20)
+    assert scraper.config['SCRAPER_NAME'] == 'scraperx_bench'
+    assert scraper.config['DISPATCH_SERVICE_NAME'] == 'local'
+    assert scraper.config['DISPATCH_RATELIMIT_VALUE'] == 20.0
+    assert scraper.config['DOWNLOADER_SAVE_METADATA'] is False
+    assert scraper.config['EXTRACTOR_FILE_TEMPLATE'] == str(tmp_path / 'extract' / '{idx}.json')
@@ -0,0 +1,60 @@
+import pytest
+import requests
+
+from scraperx import Scraper, Download
+from scraperx.cassette import parse_latency
+
+from .conftest import PAGE
+
+
+def _get_downloader(url, mode, cassette_file):
+    scraper = Scraper(scraper_name='test_cassette')
+    scraper.config._set_value('DOWNLOADER_CASSETTE_MODE', mode)
+    scraper.config._set_value('DOWNLOADER_CASSETTE_FILE', str(cassette_file))
+    return Download(scraper, {'url': url})
+
+
+def test_record_replay(server_url, tmp_path):
+    cassette_file = tmp_path / 'cassette.jsonl'
+    url = f'{server_url}/gzip'
+
+    recorder = _get_downloader(url, 'record', cassette_file)
+    recorder.request_get(url)
+
+    # The server is not used when replaying
+    player = _get_downloader(url, 'replay', cassette_file)
+    r = player.request_get(url)
+    assert r.status_code == 200
+    assert r.content == PAGE
+    assert r.bytes_downloaded['decompressed'] == len(PAGE)
+
+
+def test_record_replay_redirect(server_url, tmp_path):
+    cassette_file = tmp_path / 'cassette.jsonl'
+    url = f'{server_url}/redirect'
+
+    recorder = _get_downloader(url, 'record', cassette_file)
+    recorder.request_get(url)
+
+    player = _get_downloader(url, 'replay', cassette_file)
+    r = player.request_get(url)
+    assert r.content == PAGE
+    assert r.url == f'{server_url}/gzip'
+    assert [h.status_code for h in r.history] == [302]
+
+
+def test_replay_missing(tmp_path):
+    cassette_file = tmp_path / 'empty_cassette.jsonl'
+    cassette_file.touch()
+    player = _get_downloader('http://127.0.0.1:1/missing', 'replay', cassette_file)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        player.session.get('http://127.0.0.1:1/missing')
+
+
+def test_parse_latency():
+    assert parse_latency(None)({}) == 0
+    assert parse_latency('fixed:0.2')({}) == 0.2
+    assert parse_latency('recorded')({'elapsed': 0.5}) == 0.5
+    assert 0.1 <= parse_latency('uniform:0.1,0.3')({}) <= 0.3
+    with pytest.raises(ValueError):
+        parse_latency('uniform:0.1')
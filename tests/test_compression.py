@@ -0,0 +1,41 @@
+import json
+import pytest
+
+from scraperx import Scraper, Download, Extract
+from scraperx.compression import compress, decompress
+from scraperx.utils import read_file_contents
+
+from .conftest import PAGE
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'zstd'])
+def test_compress_round_trip(codec):
+    compressed = compress(PAGE, codec, level=1)
+    assert len(compressed) < len(PAGE)
+    assert decompress(compressed, codec) == PAGE
+
+
+def test_download_compressed(server_url, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    extracted = []
+
+    class CompressedExtract(Extract):
+
+        def extract(self, raw_source, source_idx):
+            extracted.append(raw_source)
+            return []
+
+    scraper = Scraper(scraper_name='test_compression', extract_cls=CompressedExtract)
+    scraper.config._set_value('DOWNLOADER_COMPRESSION', 'zstd')
+    scraper.config._set_value('DOWNLOADER_FILE_TEMPLATE', 'output/source.html')
+    Download(scraper, {'url': server_url}).run()
+
+    assert (tmp_path / 'output/source.html').read_bytes()[:4] == b'\x28\xb5\x2f\xfd'
+    # The metadata is never compressed
+    with open(tmp_path / 'output/source.html_metadata.json') as f:
+        metadata = json.load(f)
+    source = metadata['download_manifest']['source_files'][0]
+    assert source['compression'] == 'zstd'
+
+    assert read_file_contents(source['file'], compression='zstd') == PAGE.decode('utf-8')
+    assert extracted == [PAGE.decode('utf-8')]
@@ -0,0 +1,71 @@
+import io
+import pytest
+
+from scraperx import Scraper, Download, Extract
+from scraperx.save_to import SaveTo
+from scraperx.content_store import ProcessedLedger, content_hash
+
+from .conftest import PAGE
+
+
+def test_processed_ledger_persist(tmp_path):
+    ledger_file = str(tmp_path / 'ledger.json')
+    ledger = ProcessedLedger(ledger_file)
+    ledger.add('abc', 'v1')
+    ledger.save()
+
+    ledger = ProcessedLedger(ledger_file)
+    assert ledger.is_processed('abc', 'v1')
+    assert not ledger.is_processed('abc', 'v2')
+
+
+def test_content_addressed_download(server_url, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    extracted = []
+
+    class LedgerExtract(Extract):
+        extractor_version = '1'
+
+        def extract(self, raw_source, source_idx):
+            extracted.append(self.task)
+            return []
+
+    scraper = Scraper(scraper_name='test_content', extract_cls=LedgerExtract)
+    scraper.config._set_value('DOWNLOADER_CONTENT_ADDRESSED', True)
+    scraper.config._set_value('DOWNLOADER_FILE_TEMPLATE', 'output/{name}.html')
+    scraper.config._set_value('EXTRACTOR_PROCESSED_LEDGER_FILE', str(tmp_path / 'ledger.json'))
+
+    tasks = [{'url': server_url, 'name': 'a'}, {'url': f'{server_url}/other', 'name': 'b'}]
+    for task in tasks:
+        Download(scraper, task).run()
+
+    source_hash = content_hash(PAGE)
+    sources = list(tmp_path.glob('output/test_content/content/*/*'))
+    assert [s.name for s in sources] == [f'{source_hash}.html']
+    # Metadata is still saved per task
+    assert (tmp_path / 'output/a.html_metadata.json').exists()
+    assert (tmp_path / 'output/b.html_metadata.json').exists()
+    assert scraper.stats['saves_skipped_existing'] == 1
+
+    # The second task has the same contents, so it is not extracted again
+    assert extracted == tasks[:1]
+    assert scraper.stats['sources_skipped_processed'] == 1
+
+
+def test_skip_existing_failed_write(tmp_path, monkeypatch):
+    target = str(tmp_path / 'source.html')
+    scraper = Scraper(scraper_name='test_content')
+
+    def _fail(*args, **kwargs):
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(SaveTo, '_write', _fail)
+    with pytest.raises(OSError):
+        SaveTo(scraper, io.StringIO(PAGE.decode())).save(None, filename=target, skip_existing=True)
+    monkeypatch.undo()
+
+    # The failed write is not remembered as saved, so it is written the next time
+    SaveTo(scraper, io.StringIO(PAGE.decode())).save(None, filename=target, skip_existing=True)
+    with open(target, encoding='utf-8') as f:
+        assert f.read() == PAGE.decode()
+    assert scraper.stats['saves_skipped_existing'] == 0
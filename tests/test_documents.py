@@ -0,0 +1,127 @@
+import pytest
+
+from scraperx import Scraper, Extract, bench
+from scraperx.documents import PARSERS, iter_elements, parse_document
+
+HTML = ('<html><body><div class="item" data-id="1"><h3>Item <b>1</b></h3>'
+        '<a href="/1">link</a></div><div class="item" data-id="2"><h3>Item 2</h3></div>'
+        '</body></html>')
+
+
+def _parser(parser):
+    if parser == 'selectolax':
+        pytest.importorskip('selectolax')
+    return parser
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_parse_document(parser):
+    document = parse_document(HTML, parser=_parser(parser))
+    items = document.css('div.item')
+    assert len(items) == 2
+    assert items[0].attrib == {'class': 'item', 'data-id': '1'}
+    assert items[0].css('h3')[0].text == 'Item 1'
+    assert items[1].css('a') == []
+    if parser != 'selectolax':
+        assert items[0].xpath('.//a')[0].attrib == {'href': '/1'}
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_parse_document_encoding_declaration(parser):
+    source = '<?xml version="1.0" encoding="iso-8859-1"?><html><body><p>café</p></body></html>'
+    document = parse_document(source, parser=_parser(parser))
+    assert document.css('p')[0].text == 'café'
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_extract_task_parser(tmp_path, parser):
+
+    class ParserExtract(Extract):
+
+        def extract(self, raw_source, source_idx):
+            return self.extract_task(
+                selectors=['div.missing', 'div.item'],
+                callback=lambda element, idx: {'title': element.css('h3')[0].text},
+                post_extract=self.collected.extend,
+            )
+
+    scraper = Scraper(scraper_name='test_documents', extract_cls=ParserExtract)
+    scraper.config._set_value('EXTRACTOR_PARSER', _parser(parser))
+    manifest = {'source_files': [], 'time_downloaded': '', 'date_downloaded': ''}
+    extractor = scraper.extract({}, manifest)
+    extractor.collected = []
+    for extraction_task in extractor._get_extraction_tasks(HTML, 0):
+        extraction_task(HTML)
+
+    assert extractor.collected == [{'title': 'Item 1'}, {'title': 'Item 2'}]
+    assert scraper.selector_stats.snapshot()['div.item'] == {'evaluated': 1, 'matched': 1}
+
+
+def test_bench_parsers():
+    results = bench.run_bench(num_tasks=5, page_size=5000, stages=('extract',),
+                              parsers=('parsel', 'lxml'))
+    assert [result['stage'] for result in results] == ['extract', 'extract:lxml']
+    assert all(result['count'] == 5 for result in results)
+
+
+@pytest.mark.parametrize('parser', ['parsel', 'lxml'])
+def test_iter_elements(parser):
+    num_items = 20000
+    html = ('<html><body><ul>'
+            + ''.join(f'<li class="item{" sold" * (idx % 2)}"><a href="/{idx}">{idx}</a></li>'
+                      for idx in range(num_items))
+            + '</ul></body></html>')
+    siblings = []
+    titles = []
+    for element in iter_elements(html, 'li', attrs={'class': 'sold'}, parser=parser):
+        titles.append(element.css('a')[0].text)
+        root = element.root if parser == 'parsel' else element.element
+        siblings.append(len(root.getparent()))
+
+    assert titles == [str(idx) for idx in range(1, num_items, 2)]
+    # Items already extracted are freed, only what lxml has read ahead is kept
+    assert max(siblings) < num_items / 10
+
+
+@pytest.mark.parametrize('parser', ['parsel', 'lxml'])
+def test_iter_elements_nested_tags(parser):
+    html = ('<html><body>'
+            + ''.join(f'<div class="item"><div class="title">{idx}</div>'
+                      f'<div class="price">{idx}.5</div></div>' for idx in range(3))
+            + '</body></html>')
+    items = [(element.css('div.title')[0].text, element.css('div.price')[0].text)
+             for element in iter_elements(html, 'div', attrs={'class': 'item'}, parser=parser)]
+    # The inner divs are not freed before their item is done
+    assert items == [(str(idx), f'{idx}.5') for idx in range(3)]
+
+
+def test_iter_elements_xml():
+    sitemap = ('<?xml version="1.0" encoding="UTF-8"?>'
+               '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+               '<url><loc>https://a.com/1</loc></url><url><loc>https://a.com/2</loc></url>'
+               '</urlset>')
+    locs = [element.xpath('string()').get() for element in iter_elements(sitemap, 'url')]
+    assert locs == ['https://a.com/1', 'https://a.com/2']
+
+
+def test_extract_task_item_tag(tmp_path):
+
+    class ItemTagExtract(Extract):
+
+        def extract(self, raw_source, source_idx):
+            return self.extract_task(
+                item_tag='div',
+                item_attrs={'class': 'item'},
+                callback=lambda element, idx: {'id': element.attrib['data-id']},
+                post_extract=self.collected.extend,
+            )
+
+    scraper = Scraper(scraper_name='test_documents', extract_cls=ItemTagExtract)
+    manifest = {'source_files': [], 'time_downloaded': '', 'date_downloaded': ''}
+    extractor = scraper.extract({}, manifest)
+    extractor.collected = []
+    for extraction_task in extractor._get_extraction_tasks(HTML, 0):
+        extraction_task(HTML)
+
+    assert extractor.collected == [{'id': '1'}, {'id': '2'}]
+    assert scraper.stats['sources_parsed'] == 0
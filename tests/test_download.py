@@ -0,0 +1,162 @@
+import gc
+import gzip
+import json
+import time
+import pytest
+import weakref
+
+from scraperx import Scraper, Download, Dispatch
+from scraperx.exceptions import ResponseTooLargeError
+
+from .conftest import PAGE
+
+
+def _get_downloader(url):
+    scraper = Scraper(scraper_name='test_download')
+    return Download(scraper, {'url': url})
+
+
+def test_bytes_downloaded_gzip(server_url):
+    downloader = _get_downloader(f'{server_url}/gzip')
+    r = downloader.request_get(downloader.task['url'])
+    assert r.content == PAGE
+    assert r.bytes_downloaded['decompressed'] == len(PAGE)
+    assert r.bytes_downloaded['compressed'] == len(gzip.compress(PAGE))
+    assert downloader._manifest['bytes_downloaded'] == r.bytes_downloaded
+    assert downloader.scraper.stats['bytes_decompressed'] == len(PAGE)
+
+
+def test_max_bytes(server_url):
+    downloader = _get_downloader(f'{server_url}/plain')
+    with pytest.raises(ResponseTooLargeError):
+        downloader.request_get(downloader.task['url'], max_bytes=len(PAGE) - 1)
+    # Should not retry a response that is too large
+    assert downloader.scraper.stats['requests'] == 1
+
+
+def test_max_bytes_streamed(server_url):
+    # The compressed size is under the limit, so it can only be caught while streaming
+    downloader = _get_downloader(f'{server_url}/gzip')
+    with pytest.raises(ResponseTooLargeError):
+        downloader.request_get(downloader.task['url'], max_bytes=len(PAGE) - 1)
+
+
+def test_stream_counted(server_url):
+    downloader = _get_downloader(f'{server_url}/gzip')
+    r = downloader.request_get(downloader.task['url'], stream=True)
+    # Nothing is counted until the caller reads the body
+    assert downloader.scraper.stats['requests'] == 0
+    assert r.content == PAGE
+    assert r.bytes_downloaded['decompressed'] == len(PAGE)
+    assert downloader.scraper.stats['bytes_decompressed'] == len(PAGE)
+
+    r = downloader.request_get(downloader.task['url'], stream=True, max_bytes=len(PAGE) - 1)
+    with pytest.raises(ResponseTooLargeError):
+        for _ in r.iter_content(chunk_size=1024):
+            pass
+
+
+def test_bandwidth_budget_local_only():
+    scraper = Scraper(scraper_name='test_download')
+    scraper.config._set_value('DISPATCH_BANDWIDTH_BUDGET', 10)
+    scraper.stats.incr('bytes_compressed', 10)
+    dispatcher = Dispatch(scraper, tasks=[{'url': 'http://localhost'}])
+    assert dispatcher._bandwidth_budget_reached()
+
+    # The bytes of downloads on other services are not counted here
+    scraper.config._set_value('DISPATCH_SERVICE_NAME', 'sns')
+    assert not dispatcher._bandwidth_budget_reached()
+
+
+def test_dns_cache(server_url):
+    url = server_url.replace('127.0.0.1', 'localhost')
+    scraper = Scraper(scraper_name='test_download')
+    scraper.config._set_value('DOWNLOADER_DNS_CACHE', True)
+    for _ in range(3):
+        # Each download has its own session, so its own connections
+        downloader = Download(scraper, {'url': url})
+        assert downloader.request_get(url).content == PAGE
+
+    assert scraper.stats['dns_cache_misses'] == 1
+    assert scraper.stats['dns_cache_hits'] == 2
+
+    # Another scraper counts its own lookups
+    other_scraper = Scraper(scraper_name='test_download')
+    other_scraper.config._set_value('DOWNLOADER_DNS_CACHE', True)
+    downloader = Download(other_scraper, {'url': url})
+    downloader.request_get(url)
+    assert other_scraper.stats['dns_cache_misses'] == 1
+    assert scraper.stats['dns_cache_misses'] == 1
+
+
+def test_dns_cache_system_resolver(monkeypatch):
+    from scraperx import dns_cache
+
+    # Like a name that is only in the hosts file, the system resolver is always used
+    monkeypatch.setattr(dns_cache.socket, 'getaddrinfo',
+                        lambda host, port, type: [(None, None, None, '', ('10.0.0.1', port))])
+    monkeypatch.setattr(dns_cache, '_record_ttl', lambda host: 5)
+    cache = dns_cache.DNSCache(max_age=300)
+    assert cache.resolve('scraperx.test', 80) == ['10.0.0.1']
+    expires = cache._entries['scraperx.test'][1]
+    assert expires - time.monotonic() <= 5
+
+
+def test_dns_cache_not_kept():
+    from scraperx import dns_cache
+
+    scraper = Scraper(scraper_name='test_download')
+    scraper.config._set_value('DOWNLOADER_DNS_CACHE', True)
+    assert dns_cache.get_dns_cache(scraper) is dns_cache.get_dns_cache(scraper)
+    assert scraper in dns_cache._dns_caches
+
+    scraper_ref = weakref.ref(scraper)
+    del scraper
+    gc.collect()
+    assert scraper_ref() is None
+
+
+def test_in_memory_handoff(server_url, tmp_path):
+    from scraperx import Extract
+
+    extracted = []
+
+    class HandoffExtract(Extract):
+
+        def extract(self, raw_source, source_idx):
+            extracted.append(raw_source)
+
+    scraper = Scraper(scraper_name='test_download', extract_cls=HandoffExtract)
+    scraper.config._set_value('DOWNLOADER_IN_MEMORY_HANDOFF', True)
+    scraper.config._set_value('DOWNLOADER_FILE_TEMPLATE', str(tmp_path / 'source.html'))
+    Download(scraper, {'url': server_url}).run()
+
+    assert extracted == [PAGE.decode('utf-8')]
+    assert scraper.stats['sources_read_from_memory'] == 1
+    # Still saved, but the contents are not in the metadata
+    assert (tmp_path / 'source.html').read_bytes() == PAGE
+    metadata = json.loads((tmp_path / 'source.html_metadata.json').read_text())
+    assert 'content' not in metadata['download_manifest']['source_files'][0]
+
+
+def test_upload_failed_not_extracted(server_url, tmp_path, monkeypatch):
+    from scraperx import download as download_module
+
+    class SaveDownload(Download):
+
+        def download(self):
+            self.save_request(self.request_get(self.task['url']))
+
+    triggered = []
+
+    def _upload_failed(scraper, target_path):
+        raise OSError(f"Could not upload {target_path}")
+
+    monkeypatch.setattr(download_module, 'wait_for_upload', _upload_failed)
+    monkeypatch.setattr(download_module, 'run_task', lambda *args, **kwargs: triggered.append(1))
+    scraper = Scraper(scraper_name='test_download', download_cls=SaveDownload)
+    scraper.config._set_value('DISPATCH_SERVICE_NAME', 'sns')
+    scraper.config._set_value('DOWNLOADER_FILE_TEMPLATE', str(tmp_path / 'source.html'))
+    SaveDownload(scraper, {'url': server_url}).run()
+    # The extractor would read a file that does not exist
+    assert triggered == []
@@ -0,0 +1,250 @@
+import json
+import pytest
+
+from scraperx import Scraper, Extract
+from scraperx.extract_pool import run_extract_pool, get_extract_queue, close_extract_queues
+
+from .conftest import PAGE
+
+
+class MultipleExtract(Extract):
+
+    def extract(self, raw_source, source_idx):
+        for name in ('a', 'b', 'c'):
+            yield self.extract_task(
+                name=name,
+                selectors=['p'],
+                callback=lambda element, idx: {'text': element.css('::text').get()},
+                post_extract=self.collect,
+            )
+
+    def collect(self, data):
+        self.collected.append(data)
+
+
+class SaveExtract(Extract):
+
+    def extract(self, raw_source, source_idx):
+        return self.extract_task(
+            selectors=['p'],
+            callback=lambda element, idx: {'text': element.css('::text').get()},
+            post_extract=self.save_as,
+            post_extract_kwargs={'file_format': 'json_lines'},
+        )
+
+
+def _extractor(tmp_path, extract_cls):
+    source_file = tmp_path / 'source.html'
+    source_file.write_bytes(PAGE)
+    manifest = {'source_files': [{'file': str(source_file)}],
+                'time_downloaded': '',
+                'date_downloaded': '',
+                }
+    scraper = Scraper(scraper_name='test_extract', extract_cls=extract_cls)
+    extractor = scraper.extract({}, manifest)
+    extractor.collected = []
+    return scraper, extractor
+
+
+def test_source_parsed_once(tmp_path):
+    scraper, extractor = _extractor(tmp_path, MultipleExtract)
+    extractor.run()
+
+    assert len(extractor.collected) == 3
+    assert all(len(data) == 1000 for data in extractor.collected)
+    assert scraper.stats['sources_parsed'] == 1
+    assert scraper.stats['parse_cache_hits'] == 2
+    # Not kept once the source is extracted
+    assert extractor._parsed_source is None
+
+
+def test_find_css_elements_fallback(tmp_path):
+    scraper, extractor = _extractor(tmp_path, MultipleExtract)
+    parsed = extractor._parse_source(PAGE.decode('utf-8'))
+
+    results = extractor.find_css_elements(parsed, ['div.missing', 'p::text'])
+    assert len(results) == 1000
+    assert results[0].get() == 'scraperx'
+    assert extractor.find_css_elements(parsed, ['div.missing']) == []
+    assert scraper.selector_stats.snapshot() == {
+        'div.missing': {'evaluated': 2, 'matched': 0},
+        'p::text': {'evaluated': 1, 'matched': 1},
+    }
+
+
+def test_adaptive_selectors(tmp_path):
+    scraper, extractor = _extractor(tmp_path, MultipleExtract)
+    scraper.config._set_value('EXTRACTOR_ADAPTIVE_SELECTORS', True)
+    scraper.config._set_value('EXTRACTOR_SELECTOR_STATS_FILE', str(tmp_path / 'stats.json'))
+    parsed = extractor._parse_source(PAGE.decode('utf-8'))
+
+    selectors = ['div.missing', 'span.missing', 'p']
+    for _ in range(3):
+        extractor.find_css_elements(parsed, selectors)
+    # After the first time, `p` is tried first
+    assert scraper.selector_stats.snapshot()['div.missing']['evaluated'] == 1
+    assert scraper.selector_stats.order(selectors) == ['p', 'div.missing', 'span.missing']
+
+    scraper.selector_stats.file = str(tmp_path / 'stats.json')
+    scraper.selector_stats.save()
+    next_run = Scraper(scraper_name='test_extract')
+    next_run.selector_stats.load(str(tmp_path / 'stats.json'))
+    assert next_run.selector_stats.order(selectors)[0] == 'p'
+
+
+def test_extract_pool(tmp_path):
+    metadata_files = []
+    for task_id in range(5):
+        source_file = tmp_path / f'{task_id}.html'
+        source_file.write_bytes(PAGE)
+        metadata = {'task': {'id': task_id},
+                    'download_manifest': {'source_files': [{'file': str(source_file)}],
+                                          'time_downloaded': '',
+                                          'date_downloaded': '',
+                                          }}
+        metadata_file = tmp_path / f'{task_id}_metadata.json'
+        metadata_file.write_text(json.dumps(metadata))
+        metadata_files.append(str(metadata_file))
+    broken_file = tmp_path / 'broken_metadata.json'
+    broken_file.write_text('{')
+    metadata_files.append(str(broken_file))
+
+    scraper = Scraper(scraper_name='test_extract', extract_cls=SaveExtract)
+    scraper.config._set_value('EXTRACTOR_FILE_TEMPLATE', str(tmp_path / 'out' / '{id}.jsonl'))
+    run_extract_pool(scraper, metadata_files, workers=2, chunk_size=2)
+
+    for task_id in range(5):
+        with open(tmp_path / 'out' / f'{task_id}.jsonl', encoding='utf-8') as f:
+            assert len(f.readlines()) == 1000
+    # Counted in the workers, merged into the parents stats
+    assert scraper.stats['metadata_files_extracted'] == 5
+    assert scraper.stats['metadata_files_failed'] == 1
+    assert scraper.stats['sources_extracted'] == 5
+    assert scraper.selector_stats.snapshot()['p'] == {'evaluated': 5, 'matched': 5}
+
+
+@pytest.mark.parametrize('pool', ['thread', 'process'])
+def test_dispatch_extract_queue(server_url, tmp_path, pool):
+    scraper = Scraper(scraper_name='test_extract', extract_cls=SaveExtract)
+    scraper.config._set_value('DISPATCH_RATELIMIT_VALUE', 50.0)
+    scraper.config._set_value('DOWNLOADER_FILE_TEMPLATE', str(tmp_path / 'source' / '{id}.html'))
+    scraper.config._set_value('EXTRACTOR_WORKERS', 2)
+    scraper.config._set_value('EXTRACTOR_POOL', pool)
+    scraper.config._set_value('EXTRACTOR_OUTPUT_MODE', 'aggregate')
+    scraper.config._set_value('EXTRACTOR_AGGREGATE_TEMPLATE',
+                              str(tmp_path / 'out' / '{segment_id}.jsonl'))
+
+    tasks = [{'id': task_id, 'url': server_url} for task_id in range(4)]
+    scraper.dispatch(tasks=tasks).run()
+
+    num_rows = 0
+    for output_file in (tmp_path / 'out').iterdir():
+        with open(output_file, encoding='utf-8') as f:
+            num_rows += len(f.readlines())
+    assert num_rows == 4000
+    assert scraper.stats['extracts_queued'] == 4
+    # Merged back from the worker processes when using a process pool
+    assert scraper.stats['sources_extracted'] == 4
+    assert scraper.stats['rows_aggregated'] == 4000
+
+
+def test_extract_queue_per_scraper():
+    scrapers = []
+    for _ in range(2):
+        scraper = Scraper(scraper_name='test_extract', extract_cls=SaveExtract)
+        scraper.config._set_value('EXTRACTOR_WORKERS', 1)
+        scrapers.append(scraper)
+    try:
+        first_queue = get_extract_queue(scrapers[0])
+        assert get_extract_queue(scrapers[0]) is first_queue
+        assert get_extract_queue(scrapers[1]).scraper is scrapers[1]
+    finally:
+        close_extract_queues()
+
+
+class StreamExtract(Extract):
+
+    def extract(self, raw_source, source_idx):
+        return self.extract_task(
+            callback=self.callback,
+            raw_source=list(range(5)),
+            qa={'idx': {'type': int}},
+            qa_policy=self.qa_policy,
+            post_extract=self.collect,
+            **self.stream_kwargs,
+        )
+
+    def callback(self, item, idx):
+        self.events.append(('extracted', idx))
+        return {'idx': idx if idx != self.bad_idx else 'bad'}
+
+    def collect(self, data):
+        if isinstance(data, list):
+            self.events.append(('batch', len(data)))
+            return
+        # Kept so the stream is not closed when it is garbage collected
+        self.stream = data
+        for row in data:
+            self.events.append(('consumed', row['idx']))
+            if row['idx'] == self.stop_idx:
+                break
+
+
+def _stream_extractor(tmp_path, bad_idx=None, stop_idx=None, qa_policy=None,
+                      **stream_kwargs):
+    scraper, extractor = _extractor(tmp_path, StreamExtract)
+    extractor.events = []
+    extractor.bad_idx = bad_idx
+    extractor.stop_idx = stop_idx
+    extractor.qa_policy = qa_policy
+    extractor.stream_kwargs = stream_kwargs
+    return scraper, extractor
+
+
+def test_extract_task_stream(tmp_path):
+    scraper, extractor = _stream_extractor(tmp_path, stream=True)
+    extractor.run()
+    # Each item is extracted as post_extract consumes it
+    assert extractor.events[:4] == [('extracted', 0), ('consumed', 0),
+                                    ('extracted', 1), ('consumed', 1)]
+
+    scraper, extractor = _stream_extractor(tmp_path, stream_batch_size=2)
+    extractor.run()
+    assert [event for event in extractor.events if event[0] == 'batch'] == \
+        [('batch', 2), ('batch', 2), ('batch', 1)]
+    assert scraper.stats['extract_batches'] == 3
+
+
+def test_extract_task_stream_qa_error(tmp_path):
+    scraper, extractor = _stream_extractor(tmp_path, bad_idx=2, stream=True)
+    extractor.run()
+    # Rows before the failure were already consumed, the task still fails
+    assert ('consumed', 1) in extractor.events
+    assert ('extracted', 3) not in extractor.events
+    assert scraper.stats['sources_extract_failed'] == 1
+
+
+def test_extract_task_stream_stopped_early(tmp_path):
+    scraper, extractor = _stream_extractor(tmp_path, bad_idx=0, stop_idx=1, qa_policy='drop',
+                                           stream=True)
+    extractor.run()
+    assert ('extracted', 2) not in extractor.events
+    # The stream is closed once post_extract returns, so the qa is counted right away
+    assert scraper.stats['qa_rows_dropped'] == 1
+
+
+def test_extract_task_stream_save_as(tmp_path):
+    scraper, extractor = _extractor(tmp_path, StreamExtract)
+    # A file per task is written by each call of save_as
+    with pytest.raises(ValueError):
+        extractor.extract_task(callback=extractor.callback, post_extract=extractor.save_as,
+                               stream_batch_size=2)
+    with pytest.raises(ValueError):
+        extractor.extract_task(callback=extractor.callback, post_extract=extractor.save_as,
+                               stream=True)
+    extractor.extract_task(callback=extractor.callback, post_extract=extractor.save_as,
+                           post_extract_kwargs={'file_format': 'json_lines'}, stream=True)
+
+    scraper.config._set_value('EXTRACTOR_OUTPUT_MODE', 'aggregate')
+    extractor.extract_task(callback=extractor.callback, post_extract=extractor.save_as,
+                           stream_batch_size=2)
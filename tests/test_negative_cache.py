@@ -0,0 +1,59 @@
+import time
+
+from scraperx import Scraper, Download
+from scraperx.negative_cache import NegativeCache, task_fingerprint, get_negative_cache
+
+
+def test_task_fingerprint():
+    assert task_fingerprint({'a': 1, 'b': 2}) == task_fingerprint({'b': 2, 'a': 1})
+    assert task_fingerprint({'a': 1}) != task_fingerprint({'a': 2})
+
+
+def test_negative_cache_persist(tmp_path):
+    cache_file = str(tmp_path / 'negative_cache.json')
+    cache = NegativeCache(cache_file, ttl=1)
+    cache.add({'url': 'http://a'}, 404)
+    cache.save()
+
+    cache = NegativeCache(cache_file, ttl=1)
+    assert cache.get({'url': 'http://a'})['status_code'] == 404
+    assert cache.get({'url': 'http://b'}) is None
+
+    cache.remove({'url': 'http://a'})
+    assert cache.get({'url': 'http://a'}) is None
+
+
+def test_negative_cache_expired(tmp_path):
+    cache = NegativeCache(str(tmp_path / 'negative_cache.json'), ttl=-1)
+    cache.add({'url': 'http://a'}, 410)
+    assert cache.get({'url': 'http://a'}) is None
+
+
+def test_dispatch_skips_failed(server_url, tmp_path):
+    scraper = Scraper(scraper_name='test_negative_cache')
+    scraper.config._set_value('DISPATCH_NEGATIVE_CACHE_FILE',
+                              str(tmp_path / 'negative_cache.json'))
+    scraper.config._set_value('DISPATCH_RATELIMIT_VALUE', 50.0)
+    missing_task = {'url': f'{server_url}/status/404'}
+
+    Download(scraper, missing_task).run()
+    num_requests = scraper.stats['requests']
+
+    dispatcher = scraper.dispatch(tasks=[missing_task])
+    start = time.time()
+    dispatcher.run()
+    assert time.time() - start < 1
+    assert scraper.stats['requests'] == num_requests
+    assert scraper.stats['negative_cache_skipped'] == 1
+    assert dispatcher.skipped_tasks[0]['task'] == missing_task
+
+
+def test_negative_cache_local_only(tmp_path):
+    scraper = Scraper(scraper_name='test_negative_cache')
+    scraper.config._set_value('DISPATCH_NEGATIVE_CACHE_FILE',
+                              str(tmp_path / 'negative_cache_remote.json'))
+    assert get_negative_cache(scraper) is not None
+
+    # The downloads do not run where the file is
+    scraper.config._set_value('DISPATCH_SERVICE_NAME', 'sns')
+    assert get_negative_cache(scraper) is None
@@ -0,0 +1,60 @@
+import pytest
+
+from scraperx.qa import QAValidator
+from scraperx.stats import RunStats
+from scraperx.exceptions import QAValueError
+
+QA_RULES = {'title': {'type': str, 'max_length': 5, 'default': ''},
+            'price': {'type': float, 'required': True},
+            'rank': {'default': 0},
+            }
+
+
+def _rows():
+    return [{'title': 'a', 'price': 1.0},
+            {'title': 'too long', 'price': 2.0, 'rank': 1},
+            {'title': 'b', 'price': None},
+            ]
+
+
+def test_qa_fail():
+    validator = QAValidator(QA_RULES)
+    with pytest.raises(QAValueError, match='Field title is longer then 5 at result 3'):
+        validator.validate(_rows(), idx=3)
+    assert validator.violations == {('title', 'max_length'): 1}
+
+
+def test_qa_drop():
+    validator = QAValidator(QA_RULES, policy='drop')
+    assert validator.validate(_rows()) == [{'title': 'a', 'price': 1.0, 'rank': 0}]
+    assert validator.summary() == {'violations': {'title': {'max_length': 1},
+                                                  'price': {'required': 1}},
+                                   'rows_dropped': 2}
+
+    stats = RunStats()
+    validator.add_to_stats(stats, name='items')
+    assert stats['qa_violations.items.price.required'] == 1
+    assert stats['qa_rows_dropped'] == 2
+    assert validator.summary() == {'violations': {}, 'rows_dropped': 0}
+
+
+def test_qa_default():
+    validator = QAValidator(QA_RULES, policy='default')
+    # price has no default, so that row is still dropped
+    assert validator.validate(_rows()) == [{'title': 'a', 'price': 1.0, 'rank': 0},
+                                           {'title': '', 'price': 2.0, 'rank': 1}]
+    assert validator.rows_dropped == 1
+
+
+def test_qa_policy_not_supported():
+    with pytest.raises(ValueError):
+        QAValidator(QA_RULES, policy='ignore')
+
+
+def test_qa_length_unsupported_log_extras(caplog):
+    validator = QAValidator({'rank': {'max_length': 2}}, log_extras={'task': {'id': 1}})
+    assert validator.validate([{'rank': 5}, {'rank': 6}]) == [{'rank': 5}, {'rank': 6}]
+    warnings = [r for r in caplog.records if r.levelname == 'WARNING']
+    # Only warned about once per field
+    assert len(warnings) == 1
+    assert warnings[0].task == {'id': 1}
@@ -0,0 +1,131 @@
+import json
+import tempfile
+import threading
+
+from scraperx import Scraper, Extract
+from scraperx.sinks import AggregatingSink, close_output_sinks, get_output_sink
+
+
+class SinkExtract(Extract):
+
+    def extract(self, raw_source, source_idx):
+        return self.extract_task(
+            name='items',
+            callback=lambda item, idx: {'task_id': self.task['id'], 'idx': idx},
+            raw_source=[None, None],
+            post_extract=self.save_as,
+        )
+
+
+def _run_extract(scraper, task):
+    manifest = {'source_files': [], 'time_downloaded': '', 'date_downloaded': ''}
+    extractor = scraper.extract(task, manifest)
+    for extraction_task in extractor._get_extraction_tasks('', 0):
+        extraction_task('')
+
+
+def test_aggregate_tasks(tmp_path):
+    scraper = Scraper(scraper_name='test_sinks', extract_cls=SinkExtract)
+    scraper.config._set_value('EXTRACTOR_OUTPUT_MODE', 'aggregate')
+    scraper.config._set_value('EXTRACTOR_AGGREGATE_TEMPLATE',
+                              str(tmp_path / '{name}' / '{segment_id}.jsonl'))
+    for task_id in range(3):
+        _run_extract(scraper, {'id': task_id})
+    close_output_sinks()
+
+    output_files = list((tmp_path / 'items').iterdir())
+    assert len(output_files) == 1
+    with open(output_files[0]) as f:
+        rows = [json.loads(line) for line in f]
+    assert [row['task_id'] for row in rows] == [0, 0, 1, 1, 2, 2]
+    assert scraper.stats['rows_aggregated'] == 6
+
+
+def test_aggregate_ignores_file_format(tmp_path, caplog):
+    scraper = Scraper(scraper_name='test_sinks')
+    scraper.config._set_value('EXTRACTOR_OUTPUT_MODE', 'aggregate')
+    scraper.config._set_value('EXTRACTOR_AGGREGATE_TEMPLATE',
+                              str(tmp_path / '{name}' / '{segment_id}.jsonl'))
+    manifest = {'source_files': [], 'time_downloaded': '', 'date_downloaded': ''}
+    extractor = SinkExtract(scraper, {'id': 0}, manifest)
+    extractor.save_as([{'idx': 0}], file_format='parquet', name='items')
+    close_output_sinks()
+
+    assert len(list((tmp_path / 'items').iterdir())) == 1
+    assert any('parquet' in r.getMessage() for r in caplog.records
+               if r.levelname == 'WARNING')
+
+
+def test_save_as_old_signature(tmp_path):
+    saved = []
+
+    class OldSaveAsExtract(SinkExtract):
+
+        def save_as(self, data, file_format='json', template_values={}):
+            saved.extend(data)
+
+    scraper = Scraper(scraper_name='test_sinks', extract_cls=OldSaveAsExtract)
+    _run_extract(scraper, {'id': 0})
+    # Not passed the task name it does not take
+    assert saved == [{'task_id': 0, 'idx': 0}, {'task_id': 0, 'idx': 1}]
+
+
+def test_aggregate_partition_and_roll(tmp_path):
+    scraper = Scraper(scraper_name='test_sinks')
+    scraper.config._set_value('EXTRACTOR_COMPRESSION', 'gzip')
+    sink = AggregatingSink(scraper, str(tmp_path / '{name}_{segment_id}.jsonl.gz'), max_rows=2)
+    manifest = {'source_files': [], 'time_downloaded': '', 'date_downloaded': ''}
+    extractor = SinkExtract(scraper, {}, manifest)
+
+    for idx in range(3):
+        sink.append(extractor, [{'idx': idx}], name='a')
+    sink.append(extractor, [{'idx': 0}], name='b')
+    sink.close()
+
+    # 3 rows with max_rows of 2 rolls into a second file
+    assert len(list(tmp_path.glob('a_*.jsonl.gz'))) == 2
+    assert len(list(tmp_path.glob('b_*.jsonl.gz'))) == 1
+
+
+def test_aggregate_sink_per_scraper(tmp_path):
+    scrapers = []
+    for scraper_name in ('test_sinks_a', 'test_sinks_b'):
+        scraper = Scraper(scraper_name=scraper_name)
+        scraper.config._set_value('EXTRACTOR_OUTPUT_MODE', 'aggregate')
+        scrapers.append(scraper)
+    sinks = [get_output_sink(scraper) for scraper in scrapers]
+    assert sinks[0] is get_output_sink(scrapers[0])
+    assert sinks[1].scraper is scrapers[1]
+
+
+def test_aggregate_upload_outside_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    scraper = Scraper(scraper_name='test_sinks')
+    scraper.config._set_value('EXTRACTOR_SAVE_DATA_SERVICE', 's3')
+    sink = AggregatingSink(scraper, 's3://test-bucket/{name}_{segment_id}.jsonl', max_rows=1)
+    manifest = {'source_files': [], 'time_downloaded': '', 'date_downloaded': ''}
+    extractor = SinkExtract(scraper, {}, manifest)
+    uploading = threading.Event()
+    release = threading.Event()
+    uploaded = []
+
+    def _upload(segment):
+        uploading.set()
+        release.wait(5)
+        uploaded.append(segment['target_path'])
+
+    monkeypatch.setattr(sink, '_upload', _upload)
+    sink.append(extractor, [{'idx': 0}], name='a')
+    # Rolls the first file, which blocks in its upload
+    rolling = threading.Thread(target=sink.append, args=(extractor, [{'idx': 1}]),
+                               kwargs={'name': 'a'})
+    rolling.start()
+    assert uploading.wait(5)
+
+    # Other partitions can still be appended to during the upload
+    sink.append(extractor, [{'idx': 0}], name='b')
+    assert uploaded == []
+    release.set()
+    rolling.join()
+    sink.close()
+    assert len(uploaded) == 3
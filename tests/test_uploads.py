@@ -0,0 +1,66 @@
+import time
+import pytest
+import threading
+
+from scraperx import Scraper
+from scraperx.uploads import UploadQueue
+from scraperx.exceptions import UploadError
+from scraperx.workers import BoundedExecutor
+
+
+def test_bounded_executor_backpressure():
+    executor = BoundedExecutor(1, max_queue=1)
+    release = threading.Event()
+    executor.submit(release.wait)
+    executor.submit(release.wait)
+
+    def _release():
+        time.sleep(0.2)
+        release.set()
+    threading.Thread(target=_release).start()
+
+    start = time.time()
+    # Blocks until there is room in the queue
+    executor.submit(lambda: None)
+    assert time.time() - start >= 0.2
+    executor.join()
+    executor.shutdown()
+
+
+def test_upload_queue_wait():
+    uploaded = []
+
+    def _upload(path):
+        time.sleep(0.1)
+        uploaded.append(path)
+
+    upload_queue = UploadQueue(Scraper(scraper_name='test_uploads'), max_workers=2)
+    upload_queue.submit('s3://bucket/a', _upload, 's3://bucket/a')
+    upload_queue.submit('s3://bucket/b', _upload, 's3://bucket/b')
+    upload_queue.wait('s3://bucket/a')
+    assert 's3://bucket/a' in uploaded
+    upload_queue.flush()
+    assert sorted(uploaded) == ['s3://bucket/a', 's3://bucket/b']
+    # Nothing to wait for
+    upload_queue.wait('s3://bucket/c')
+
+
+def test_upload_queue_failure():
+
+    def _upload(path):
+        raise OSError(f"Could not upload {path}")
+
+    upload_queue = UploadQueue(Scraper(scraper_name='test_uploads'), max_workers=1)
+    upload_queue.submit('s3://bucket/a', _upload, 's3://bucket/a')
+    with pytest.raises(UploadError, match='1 uploads failed'):
+        upload_queue.flush()
+    # The upload is done, but waiting on it still raises why it failed
+    with pytest.raises(OSError, match='s3://bucket/a'):
+        upload_queue.wait('s3://bucket/a')
+    # Only raised by the flush after the failure
+    upload_queue.flush()
+
+    # Uploaded again successfully
+    upload_queue.submit('s3://bucket/a', lambda: None)
+    upload_queue.flush()
+    upload_queue.wait('s3://bucket/a')
@@ -67,3 +67,31 @@ def test_rate_limit_fn():
 
     # Is average diff within an error of margin?
     assert avg_diff > 0.19 and avg_diff < 0.21
+
+
+@mock_s3
+def test_s3_client_cache(monkeypatch):
+    from scraperx import Scraper
+    from scraperx.write import Write
+    # Newer versions of botocore send checksums in a way that moto does not understand
+    monkeypatch.setenv('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')
+    utils.clear_s3_client_cache()
+    scraper = Scraper(scraper_name='test_s3_client_cache')
+    scraper.config._set_value('DOWNLOADER_SAVE_DATA_BUCKET_NAME', 'test-bucket')
+
+    client = utils._get_s3_params(scraper, context_type='downloader')['client']
+    client.create_bucket(Bucket='test-bucket')
+    assert utils._get_s3_params(scraper, context_type='downloader')['client'] is client
+    assert utils._get_s3_params(scraper, context_type='extractor')['client'] is not client
+
+    scraper.config._set_value('DOWNLOADER_SAVE_DATA_AWS_ACCESS_KEY_ID', 'other-key')
+    assert utils._get_s3_params(scraper, context_type='downloader')['client'] is not client
+
+    # The cached clients are used to save and read files
+    for idx in range(3):
+        Write(scraper, f'source {idx}').write_file()\
+            .save(None, filename=f's3://test-bucket/source_{idx}.html', save_service='s3')
+        s3_params = utils._get_s3_params(scraper, context_type='extractor')
+        assert utils.read_file_contents(f's3://test-bucket/source_{idx}.html',
+                                        transport_params=s3_params) == f'source {idx}'
+    utils.clear_s3_client_cache()
@@ -0,0 +1,143 @@
+import json
+import pytest
+
+from scraperx import Scraper
+from scraperx.write import Write
+from scraperx.serializers import get_serializer
+from scraperx.utils import read_file_contents
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson', 'msgspec'])
+def test_write_json(tmp_path, backend):
+    data = [{'b': 1, 'a': 'é'}]
+    scraper = Scraper(scraper_name='test_write')
+    scraper.config._set_value('SERIALIZER_BACKEND', backend)
+
+    target = str(tmp_path / 'data.json')
+    Write(scraper, data).write_json().save(None, filename=target)
+    with open(target, encoding='utf-8') as f:
+        assert f.read() == '[{"b":1,"a":"é"}]'
+
+    Write(scraper, data).write_json(pretty=True).save(None, filename=target)
+    with open(target, encoding='utf-8') as f:
+        assert f.read() == json.dumps(data, sort_keys=True, indent=4, ensure_ascii=False)
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson', 'msgspec'])
+def test_serializer_non_str_keys(backend):
+    serializer = get_serializer(backend=backend)
+    assert serializer.dumps({1: 'a', 'b': {2.5: None}}) == '{"1":"a","b":{"2.5":null}}'
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip', 'zstd'])
+def test_write_json_lines_iterator(tmp_path, compression):
+    consumed = []
+
+    def _rows():
+        for idx in range(3):
+            consumed.append(idx)
+            yield {'idx': idx}
+
+    rows = _rows()
+    saver = Write(Scraper(scraper_name='test_write'), rows).write_json_lines()
+    # Nothing is serialized until the file is saved
+    assert consumed == []
+
+    target = str(tmp_path / 'data.jsonl')
+    saver.save(None, filename=target, compression=compression)
+    contents = read_file_contents(target,
+                                  compression=None if compression == 'none' else compression)
+    assert contents == '{"idx":0}\n{"idx":1}\n{"idx":2}\n'
+
+
+def test_write_parquet_batches(tmp_path):
+    import pyarrow.parquet as pq
+
+    rows = ({'idx': idx, 'name': f'item {idx}', 'price': None} for idx in range(25))
+    target = str(tmp_path / 'data.parquet')
+    Write(Scraper(scraper_name='test_write'), rows)\
+        .write_parquet(batch_size=10, compression='zstd')\
+        .save(None, filename=target)
+
+    parquet_file = pq.ParquetFile(target)
+    assert parquet_file.metadata.num_row_groups == 3
+    assert str(parquet_file.schema_arrow.field('price').type) == 'string'
+    table = parquet_file.read()
+    assert table.num_rows == 25
+    assert table.column('idx').to_pylist() == list(range(25))
+
+
+def test_write_parquet_extra_fields(tmp_path, caplog):
+    import pyarrow.parquet as pq
+
+    rows = [{'idx': 0}, {'idx': 1, 'name': 'item 1'}, {'idx': 2, 'name': 'item 2'}]
+    target = str(tmp_path / 'data.parquet')
+    Write(Scraper(scraper_name='test_write'), rows)\
+        .write_parquet(batch_size=1)\
+        .save(None, filename=target)
+
+    assert pq.read_table(target).column_names == ['idx']
+    warnings = [r for r in caplog.records if r.levelname == 'WARNING']
+    assert len(warnings) == 1
+    assert "['name']" in warnings[0].getMessage()
+
+
+def test_extract_save_as_parquet(tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from scraperx import Extract
+
+    class ParquetExtract(Extract):
+        schema_fields = {'idx': pa.int32(), 'name': pa.string()}
+
+        def extract(self, raw_source, source_idx):
+            return []
+
+    scraper = Scraper(scraper_name='test_write', extract_cls=ParquetExtract)
+    scraper.config._set_value('EXTRACTOR_FILE_TEMPLATE', str(tmp_path / 'out.parquet'))
+    scraper.config._set_value('EXTRACTOR_COMPRESSION', 'gzip')
+    manifest = {'source_files': [], 'time_downloaded': '', 'date_downloaded': ''}
+    extractor = scraper.extract({}, manifest)
+    extractor.save_as([{'idx': 1, 'name': 'a'}], file_format='parquet')
+
+    table = pq.read_table(str(tmp_path / 'out.parquet'))
+    assert table.schema.field('idx').type == pa.int32()
+    assert table.to_pylist() == [{'idx': 1, 'name': 'a'}]
+
+
+def test_write_csv(tmp_path):
+    rows = iter([{'b': 1, 'a': {'nested': [1, 2]}, 'c': None},
+                 {'a': 'x,y', 'b': 2, 'extra': 'skipped'}])
+    target = str(tmp_path / 'data.csv')
+    Write(Scraper(scraper_name='test_write'), rows).write_csv(columns=['a'])\
+        .save(None, filename=target)
+
+    with open(target, encoding='utf-8') as f:
+        assert f.read() == ('a,b,c\n'
+                            '"{""nested"":[1,2]}",1,\n'
+                            '"x,y",2,\n')
+
+
+def test_extract_save_as_csv_qa_columns(tmp_path):
+    from scraperx import Extract
+
+    class CSVExtract(Extract):
+
+        def extract(self, raw_source, source_idx):
+            return self.extract_task(
+                callback=lambda item, idx: {'title': 'a', 'price': 1.5},
+                raw_source=[None],
+                qa={'price': {'type': float}, 'title': {'type': str}},
+                post_extract=self.save_as,
+                post_extract_kwargs={'file_format': 'csv'},
+            )
+
+    scraper = Scraper(scraper_name='test_write', extract_cls=CSVExtract)
+    scraper.config._set_value('EXTRACTOR_FILE_TEMPLATE', str(tmp_path / 'out.csv'))
+    manifest = {'source_files': [], 'time_downloaded': '', 'date_downloaded': ''}
+    extractor = scraper.extract({}, manifest)
+    for extraction_task in extractor._get_extraction_tasks('', 0):
+        extraction_task('')
+
+    with open(tmp_path / 'out.csv', encoding='utf-8') as f:
+        assert f.read() == 'price,title\n1.5,a\n'